@@ -0,0 +1,71 @@
+import os
+import gzip
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# フェーズの進行順。checkpoint の "phase" は「完了済みの最後のフェーズ」を表す
+PHASES = ["initial", "voronoi", "gat", "cross", "done"]
+
+
+def checkpoint_path(instance_name, checkpoint_root="checkpoints"):
+    return os.path.join(checkpoint_root, f"{instance_name}.json.gz")
+
+
+def phase_rank(checkpoint):
+    """checkpoint が無ければ -1、あれば完了済みフェーズの順位（PHASES の添字）"""
+    if not checkpoint:
+        return -1
+    return PHASES.index(checkpoint["phase"])
+
+
+def save_checkpoint(path, state):
+    """
+    実行状態（ルート・収束フラグ・ラウンド番号・コスト基準など）を gzip 圧縮JSONで保存する。
+    顧客データは入力ファイルから再パースできるので保存しない。
+    書き込み途中で落ちても前回分が壊れないよう、一時ファイルに書いてから置き換える。
+    """
+    if state.get("phase") not in PHASES:
+        raise ValueError(f"save_checkpoint: 不正な phase です: {state.get('phase')}")
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    logger.info(f"💾 checkpoint を保存しました（phase={state['phase']}）: {path}")
+    return path
+
+
+def load_checkpoint(path):
+    """保存済みの状態を返す。存在しない・壊れている場合は None"""
+    if not os.path.isfile(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        logger.warning(f"checkpoint を読み込めないため無視します: {path} ({e})")
+        return None
+    if not isinstance(state, dict) or state.get("phase") not in PHASES:
+        logger.warning(f"checkpoint の形式が不正なため無視します: {path}")
+        return None
+    return state
+
+
+def checkpoint_matches(checkpoint, file_paths, offsets):
+    """
+    checkpoint が同じケース（入力ファイルとオフセット）のものか。
+    instance_name はファイル名だけから決まるので、オフセット違いのケースとは path が衝突する
+    """
+    saved_offsets = [list(o) for o in checkpoint.get("offsets", [])]
+    return (list(checkpoint.get("file_paths", [])) == list(file_paths)
+            and saved_offsets == [list(o) for o in offsets])
+
+
+def is_case_finished(path, file_paths, offsets):
+    """path に同じケース（checkpoint_matches）の完了済み checkpoint があるか"""
+    state = load_checkpoint(path)
+    return state is not None and state["phase"] == "done" and checkpoint_matches(state, file_paths, offsets)
@@ -0,0 +1,125 @@
+import math
+from bisect import bisect_right
+from gat import pair_task, related_pd_pairs, run_pair_tasks, select_exchange_actions
+from solver_metrics import pairs_evaluated, pairs_skipped
+
+
+def bisector_margin(point, depot_a, depot_b):
+    """
+    点から「デポa・デポbの垂直二等分線（ボロノイ境界）」までの符号付き距離。
+    a 側なら正、b 側なら負。
+    """
+    ax, ay = depot_a
+    bx, by = depot_b
+    px, py = point
+    norm = math.hypot(bx - ax, by - ay)
+    if norm == 0:
+        return 0.0
+    return (((px - bx) ** 2 + (py - by) ** 2) - ((px - ax) ** 2 + (py - ay) ** 2)) / (2.0 * norm)
+
+
+def bisector_position(point, depot_a, depot_b):
+    """境界線に沿った位置（a→b 方向に直交する軸への射影）"""
+    ax, ay = depot_a
+    bx, by = depot_b
+    norm = math.hypot(bx - ax, by - ay) or 1.0
+    tx, ty = -(by - ay) / norm, (bx - ax) / norm
+    return point[0] * tx + point[1] * ty
+
+
+class BoundaryIndex:
+    """
+    会社ペア (a, b) ごとに、各車両ルートの「境界からの最小マージン」でソートした索引。
+    query(a, b, margin) で境界から margin 以内にタスクを持つ a 社の車両を二分探索で取り出す。
+    """
+
+    def __init__(self, routes, vehicle_num_list, depot_coords, id_to_coord):
+        self.depot_coords = depot_coords
+        self.id_to_coord = id_to_coord
+        self.company_vehicles = []
+        vidx = 0
+        for n in vehicle_num_list:
+            self.company_vehicles.append(list(range(vidx, vidx + n)))
+            vidx += n
+        self.routes = routes
+        self._index = {}
+
+    def _build(self, a, b):
+        entries = []
+        for v in self.company_vehicles[a]:
+            tasks = self.routes[v][1:-1]
+            if not tasks:
+                continue
+            margin = min(bisector_margin(self.id_to_coord[n], self.depot_coords[a], self.depot_coords[b])
+                         for n in tasks)
+            entries.append((margin, v))
+        entries.sort()
+        self._index[(a, b)] = ([m for m, _ in entries], [v for _, v in entries])
+
+    def query(self, a, b, margin):
+        if (a, b) not in self._index:
+            self._build(a, b)
+        margins, vehicles = self._index[(a, b)]
+        return vehicles[:bisect_right(margins, margin)]
+
+    def boundary_span(self, v, a, b, margin):
+        """車両 v のタスクのうち境界近傍（margin 以内）にあるものの、境界沿い位置の範囲"""
+        pts = [self.id_to_coord[n] for n in self.routes[v][1:-1]]
+        near = [bisector_position(p, self.depot_coords[a], self.depot_coords[b]) for p in pts
+                if bisector_margin(p, self.depot_coords[a], self.depot_coords[b]) <= margin]
+        return (min(near), max(near)) if near else None
+
+
+def find_boundary_pairs(routes, vehicle_num_list, depot_id_list, customers, margin):
+    """
+    異なる会社の車両ペアのうち、両者が共通の境界近傍にタスクを持ち、
+    かつ境界沿いの位置範囲が（margin を許容して）重なるものだけを返す。
+    """
+    id_to_coord = {c['id']: (float(c['x']), float(c['y'])) for c in customers}
+    depot_coords = [id_to_coord[d] for d in depot_id_list]
+    index = BoundaryIndex(routes, vehicle_num_list, depot_coords, id_to_coord)
+
+    pairs = []
+    num_companies = len(vehicle_num_list)
+    for a in range(num_companies):
+        for b in range(a + 1, num_companies):
+            near_a = index.query(a, b, margin)
+            near_b = index.query(b, a, margin)
+            spans_a = {v: index.boundary_span(v, a, b, margin) for v in near_a}
+            spans_b = {v: index.boundary_span(v, b, a, margin) for v in near_b}
+            for i in near_a:
+                for j in near_b:
+                    si, sj = spans_a[i], spans_b[j]
+                    # b→a 方向の境界沿い座標は符号が反転する
+                    if si is None or sj is None:
+                        continue
+                    lo_j, hi_j = -sj[1], -sj[0]
+                    if si[0] - margin <= hi_j and lo_j <= si[1] + margin:
+                        pairs.append((min(i, j), max(i, j)))
+    return sorted(set(pairs))
+
+
+def perform_cross_company_exchange(routes, customers, PD_pairs, vehicle_capacity, vehicle_num_list,
+                                   depot_id_list, boundary_margin=10.0, executor=None, cost_cache=None):
+    """
+    会社間の境界限定交換：ボロノイ境界の近くにタスクを持つ異社の車両ペアだけを2車両VRPで再最適化し、
+    各車両は最大1回だけ変更されるよう CP-SAT で組み合わせを選ぶ（総距離改善のみ、各車は自社デポを維持）。
+    戻り値: (新しい全車両ルート, 評価したペア数)
+    """
+    candidate_pairs = find_boundary_pairs(routes, vehicle_num_list, depot_id_list, customers, boundary_margin)
+    PD_pairs_of_each_vehicle = {}
+    for v in {v for pair in candidate_pairs for v in pair}:
+        PD_pairs_of_each_vehicle[v] = related_pd_pairs(routes[v], PD_pairs)
+
+    tasks = []
+    for i, j in candidate_pairs:
+        PD_pairs_2v = PD_pairs_of_each_vehicle[i] + PD_pairs_of_each_vehicle[j]
+        tasks.append(pair_task((i, j), routes[i], routes[j], PD_pairs_2v, vehicle_capacity,
+                               phase="cross", allow_swap=False))
+    # 異社の車両ペアのうち境界から遠いものは解かない
+    num_cross_pairs = (sum(vehicle_num_list) ** 2 - sum(n * n for n in vehicle_num_list)) // 2
+    pairs_evaluated("cross", len(candidate_pairs))
+    pairs_skipped("cross", num_cross_pairs - len(candidate_pairs))
+    feasible_actions = [cand for cands in run_pair_tasks(tasks, customers, executor, cost_cache) for cand in cands]
+
+    return select_exchange_actions(routes, feasible_actions), len(candidate_pairs)
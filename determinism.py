@@ -0,0 +1,50 @@
+import os
+
+# 決定的モード。有効なら時間に依存する打ち切りを使わず、CP-SAT は1スレッド・固定シードで解く。
+# 環境変数 VRP_DETERMINISTIC=1 / VRP_SEED でも指定可（子プロセスにも引き継ぐ）
+_enabled = os.getenv("VRP_DETERMINISTIC", "0") == "1"
+_seed = int(os.getenv("VRP_SEED", "42"))
+
+
+def enable_determinism(seed=42):
+    global _enabled, _seed
+    _enabled, _seed = True, seed
+    os.environ["VRP_DETERMINISTIC"] = "1"
+    os.environ["VRP_SEED"] = str(seed)
+
+
+def disable_determinism():
+    global _enabled
+    _enabled = False
+    os.environ.pop("VRP_DETERMINISTIC", None)
+
+
+def deterministic_enabled():
+    return _enabled
+
+
+def base_seed():
+    return _seed
+
+
+def configure_cp_solver(solver, time_limit=None):
+    """
+    CP-SAT のパラメータを設定する。
+    決定的モードでは num_workers=1・random_seed 固定にし、time_limit は実時間ではなく
+    max_deterministic_time（CP-SAT 内部の作業量の単位）として使う（マシンの速さやコア数で結果が変わらない）。
+    """
+    if _enabled:
+        solver.parameters.num_workers = 1
+        solver.parameters.random_seed = _seed
+        if time_limit is not None:
+            solver.parameters.max_deterministic_time = time_limit
+    elif time_limit is not None:
+        solver.parameters.max_time_in_seconds = time_limit
+    return solver
+
+
+def routing_search_options(search_options):
+    """決定的モードでは routing の time_limit を外す（探索は局所最適で止まる）"""
+    if not _enabled or not search_options or "time_limit" not in search_options:
+        return search_options
+    return {k: v for k, v in search_options.items() if k != "time_limit"}
@@ -1,6 +1,20 @@
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
+from solver_telemetry import record_solve_event, status_name
+from solver_corpus import record_subproblem
+from solver_metrics import solve_started, solve_finished
+from determinism import routing_search_options
 import math
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# 既定のモデル構成。"standard"=従来（Time + 全体スパンに重みを付けた Distance 次元、Python コールバック）/
+# "lean"=行列を OR-Tools に渡して登録し、pickup→delivery の順序は Time 次元で表す（冗長な Distance 次元を作らない）
+SOLVER_MODEL = os.getenv("VRP_SOLVER_MODEL", "standard")
+# cost_upper_bound 指定時、上限を下回る総距離の解が探索の打ち切り判定この回数の間に見つからなければ探索を終える
+COST_BOUND_STALL_CHECKS = int(os.getenv("VRP_COST_BOUND_STALL", "10000"))
 
 def create_distance_matrix(customers):
     size = len(customers)
@@ -11,22 +25,63 @@ def create_distance_matrix(customers):
     return matrix
 
 
-def solve_vrp_flexible(customers, initial_routes, PD_pairs, num_vehicles, vehicle_capacity, start_depots, end_depots,
-                       use_capacity:bool, use_time:bool, use_pickup_delivery:bool, isGAT:bool):
-    # 距離行列を作成
-    distance_matrix = create_distance_matrix(customers)
-    
-     # 顧客ID → インデックス変換辞書
-    id_to_index = {c['id']: i for i, c in enumerate(customers)}
-    # 各車両のデポidをインデックスに変換（RoutingIndexManagerに渡す形式）
-    starts = [id_to_index[depot_id] for depot_id in start_depots]
-    ends = [id_to_index[depot_id] for depot_id in end_depots]
+def apply_search_options(search_params, search_options):
+    """
+    探索パラメータの上書き（リプレイやチューニング用）。対応キー:
+      - first_solution_strategy / local_search_metaheuristic: 列挙名（例 "PATH_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH"）
+      - time_limit: 秒（float）
+      - solution_limit: 見つける解の数の上限
+      - log_search: bool
+    """
+    if not search_options:
+        return search_params
+    for key, value in search_options.items():
+        if key == "first_solution_strategy":
+            search_params.first_solution_strategy = getattr(routing_enums_pb2.FirstSolutionStrategy, value)
+        elif key == "local_search_metaheuristic":
+            search_params.local_search_metaheuristic = getattr(routing_enums_pb2.LocalSearchMetaheuristic, value)
+        elif key == "time_limit":
+            search_params.time_limit.FromMilliseconds(int(float(value) * 1000))
+        elif key == "solution_limit":
+            search_params.solution_limit = int(value)
+        elif key == "log_search":
+            search_params.log_search = bool(value)
+        else:
+            raise ValueError(f"未対応の search_options キーです: {key}")
+    return search_params
 
-    # routing index managerを作成
-    manager = pywrapcp.RoutingIndexManager(len(customers), num_vehicles, starts, ends)
-    # Routing Modelを作成
-    routing = pywrapcp.RoutingModel(manager)
 
+def _int_matrix(matrix):
+    """OR-Tools に渡す整数行列。既に int の行列（create_distance_matrix / 共有メモリの tolist）はコピーしない"""
+    if not matrix or not matrix[0] or type(matrix[0][0]) is int:
+        return matrix
+    return [[int(v) for v in row] for row in matrix]
+
+
+def node_arrays(customers, distance_matrix=None, time_matrix=None):
+    """
+    モデル構築に使う配列を customers（dict のリスト）から一度だけ作る。
+    time_matrix[i][j] = 距離 + i のサービス時間（時間の遷移）
+    同じ部分問題を何度も解く呼び出し側は、結果を solve_vrp_flexible(arrays=...) に渡して使い回せる
+    （共有メモリのワーカーは SharedInstance.node_arrays で作る）。
+    """
+    if distance_matrix is None:
+        distance_matrix = create_distance_matrix(customers)
+    distance_matrix = _int_matrix(distance_matrix)
+    service_times = [int(c['service']) for c in customers]
+    if time_matrix is None:
+        time_matrix = [[d + service_times[i] for d in row] for i, row in enumerate(distance_matrix)]
+    return {
+        "distance_matrix": distance_matrix,
+        "time_matrix": _int_matrix(time_matrix),
+        "demands": [int(c['demand']) for c in customers],
+        "time_windows": [(int(c['ready']), int(c['due'])) for c in customers],
+    }
+
+
+def _add_standard_dimensions(routing, manager, customers, distance_matrix, time_matrix, PD_pairs, id_to_index,
+                             num_vehicles, vehicle_capacity, use_capacity, use_time, use_pickup_delivery):
+    """従来のモデル（Python コールバック、PD の順序は全体スパンに重みを付けた Distance 次元）。戻り値は (距離の transit index, 距離の累積を持つ次元名 or None)"""
     # transit callbackを作成・登録
     def distance_callback(from_idx, to_idx):
         from_node = manager.IndexToNode(from_idx)
@@ -51,10 +106,12 @@ def solve_vrp_flexible(customers, initial_routes, PD_pairs, num_vehicles, vehicl
     if use_time:
         time_windows = [(c['ready'], c['due']) for c in customers]
         service_times = [c['service'] for c in customers]
+        if time_matrix is None:
+            time_matrix = [[d + service_times[i] for d in row] for i, row in enumerate(distance_matrix)]
         def time_callback(from_idx, to_idx):
             from_node = manager.IndexToNode(from_idx)
             to_node = manager.IndexToNode(to_idx)
-            return distance_matrix[from_node][to_node] + service_times[from_node]
+            return time_matrix[from_node][to_node]
         time_cb = routing.RegisterTransitCallback(time_callback)
         routing.AddDimension(time_cb, 99999, 99999, False, "Time")
         time_dim = routing.GetDimensionOrDie("Time")
@@ -86,13 +143,145 @@ def solve_vrp_flexible(customers, initial_routes, PD_pairs, num_vehicles, vehicl
                                  == routing.VehicleVar(delivery_idx))
             routing.solver().Add(distance_dimension.CumulVar(pickup_idx)
                                  <= distance_dimension.CumulVar(delivery_idx))
+        return transit_callback_index, "Distance"
+    return transit_callback_index, None
+
+
+def _add_lean_dimensions(routing, manager, customers, distance_matrix, time_matrix, PD_pairs, id_to_index,
+                         num_vehicles, vehicle_capacity, use_capacity, use_time, use_pickup_delivery, arrays=None):
+    """
+    軽量モデル：距離・時間・需要を行列／ベクトルとして登録し（探索中に Python を呼ばない）、
+    PD の順序は Time 次元の累積で表す（時間を使わないときだけ距離の次元を作る。全体スパンの重みは付けない）。
+    目的は総距離のみなので、standard とは解が変わりうる。戻り値は _add_standard_dimensions と同じ
+    arrays は前計算済みの node_arrays の結果（None ならここで作る）
+    """
+    if arrays is None:
+        arrays = node_arrays(customers, distance_matrix, time_matrix)
+    transit_callback_index = routing.RegisterTransitMatrix(arrays["distance_matrix"])
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+    if use_capacity:
+        demand_cb = routing.RegisterUnaryTransitVector(arrays["demands"])
+        routing.AddDimensionWithVehicleCapacity(demand_cb, 0, [vehicle_capacity] * num_vehicles, True, 'Capacity')
+
+    order_dimension, distance_dimension_name = None, None
+    if use_time:
+        time_cb = routing.RegisterTransitMatrix(arrays["time_matrix"])
+        routing.AddDimension(time_cb, 99999, 99999, False, "Time")
+        order_dimension = routing.GetDimensionOrDie("Time")
+        for node_idx, window in enumerate(arrays["time_windows"]):
+            order_dimension.CumulVar(manager.NodeToIndex(node_idx)).SetRange(*window)
+
+    if use_pickup_delivery:
+        if order_dimension is None:
+            routing.AddDimension(transit_callback_index, 0, 10000, True, "Distance")
+            order_dimension = routing.GetDimensionOrDie("Distance")
+            distance_dimension_name = "Distance"
+        solver = routing.solver()
+        for pickup_id, delivery_id in PD_pairs:
+            if pickup_id not in id_to_index or delivery_id not in id_to_index:
+                print(f"Invalid ID pair: {pickup_id}, {delivery_id}")
+                continue
+            pickup_idx = manager.NodeToIndex(id_to_index[pickup_id])
+            delivery_idx = manager.NodeToIndex(id_to_index[delivery_id])
+            routing.AddPickupAndDelivery(pickup_idx, delivery_idx)
+            solver.Add(routing.VehicleVar(pickup_idx) == routing.VehicleVar(delivery_idx))
+            solver.Add(order_dimension.CumulVar(pickup_idx) <= order_dimension.CumulVar(delivery_idx))
+    return transit_callback_index, distance_dimension_name
+
+
+def _add_cost_bound_monitor(routing, num_vehicles, cost_upper_bound, distance_dimension_name, stall_checks):
+    """
+    cost_upper_bound とそれまでの最良を下回る総距離の解が、探索の打ち切り判定 stall_checks 回の間
+    見つからなければ探索を終える（CustomLimit。それまでの最良の解が返る）。
+    回数で数えるので実時間に依存しない（決定的モードでも同じ結果になる）。
+    総距離は目的の arc コスト。standard の目的はスパン項を含むので、その場合は
+    distance_dimension_name の次元の終点の累積から読む（None なら目的値そのもの）。
+    """
+    dimension = routing.GetDimensionOrDie(distance_dimension_name) if distance_dimension_name else None
+    state = {"best": cost_upper_bound, "since": 0}
+
+    def on_solution():
+        if dimension is None:
+            cost = routing.CostVar().Value()
+        else:
+            cost = sum(dimension.CumulVar(routing.End(v)).Value() for v in range(num_vehicles))
+        if cost < state["best"]:
+            state["best"], state["since"] = cost, 0
+
+    def stalled():
+        state["since"] += 1
+        return state["since"] >= stall_checks
+
+    routing.AddAtSolutionCallback(on_solution)
+    routing.AddSearchMonitor(routing.solver().CustomLimit(stalled))
+
+
+def solve_vrp_flexible(customers, initial_routes, PD_pairs, num_vehicles, vehicle_capacity, start_depots, end_depots,
+                       use_capacity:bool, use_time:bool, use_pickup_delivery:bool, isGAT:bool, phase=None,
+                       distance_matrix=None, time_matrix=None, search_options=None, cost_upper_bound=None, model=None,
+                       arrays=None):
+    # distance_matrix / time_matrix は customers と同じ並びの前計算済み行列（共有メモリ等から渡す場合）
+    # arrays は customers と同じ並びの node_arrays の結果（行列・需要・時間枠をまとめて使い回す場合。行列より優先）
+    # model は "standard" / "lean"（None なら SOLVER_MODEL = 環境変数 VRP_SOLVER_MODEL）
+    # search_options は apply_search_options で探索パラメータを上書きする
+    # cost_upper_bound は総距離（route_cost 基準）の上限。上限を下回る総距離の解が打ち切り判定
+    # COST_BOUND_STALL_CHECKS 回の間見つからなければ探索を終える（GAT で元のペアより良くならない探索を続けないため）。
+    # 返す解が上限を下回るとは限らないので、呼び出し側で元のコストと比べる
+    # [corpus] 記録モードなら部分問題をそのまま保存（無効時は何もしない）
+    record_subproblem(
+        phase=phase, customers=customers, initial_routes=initial_routes, PD_pairs=PD_pairs,
+        num_vehicles=num_vehicles, vehicle_capacity=vehicle_capacity,
+        start_depots=start_depots, end_depots=end_depots, use_capacity=use_capacity, use_time=use_time,
+        use_pickup_delivery=use_pickup_delivery, isGAT=isGAT, cost_upper_bound=cost_upper_bound
+    )
+    solve_started(phase)
+    search_options = routing_search_options(search_options)  # 決定的モードでは time_limit を外す
+    build_start = time.perf_counter()
+    if arrays is not None:
+        distance_matrix, time_matrix = arrays["distance_matrix"], arrays["time_matrix"]
+    # 距離行列を作成
+    if distance_matrix is None:
+        distance_matrix = create_distance_matrix(customers)
+    
+     # 顧客ID → インデックス変換辞書
+    id_to_index = {c['id']: i for i, c in enumerate(customers)}
+    # 各車両のデポidをインデックスに変換（RoutingIndexManagerに渡す形式）
+    starts = [id_to_index[depot_id] for depot_id in start_depots]
+    ends = [id_to_index[depot_id] for depot_id in end_depots]
+
+    # routing index managerを作成
+    manager = pywrapcp.RoutingIndexManager(len(customers), num_vehicles, starts, ends)
+    # Routing Modelを作成
+    routing = pywrapcp.RoutingModel(manager)
+
+    if (model or SOLVER_MODEL) == "lean":
+        transit_callback_index, distance_dimension_name = _add_lean_dimensions(
+            routing, manager, customers, distance_matrix, time_matrix, PD_pairs, id_to_index,
+            num_vehicles, vehicle_capacity, use_capacity, use_time, use_pickup_delivery, arrays=arrays
+        )
+    else:
+        transit_callback_index, distance_dimension_name = _add_standard_dimensions(
+            routing, manager, customers, distance_matrix, time_matrix, PD_pairs, id_to_index,
+            num_vehicles, vehicle_capacity, use_capacity, use_time, use_pickup_delivery
+        )
+
+    # 総距離の上限による早期打ち切り（制約・次元は足さず、見つかった解の距離を監視して探索を止める）。
+    # lean は目的が総距離だけで、warm-start からの降下は上限を超えないので監視しない
+    if cost_upper_bound is not None and (model or SOLVER_MODEL) != "lean":
+        _add_cost_bound_monitor(routing, num_vehicles, cost_upper_bound, distance_dimension_name,
+                                COST_BOUND_STALL_CHECKS)
 
     search_params = pywrapcp.DefaultRoutingSearchParameters()
     #search_params.log_search = True
 
+    build_time = time.perf_counter() - build_start
+    solve_start = time.perf_counter()
+    warm_start = isGAT
     if isGAT:
         #search_params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.AUTOMATIC
         search_params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.AUTOMATIC
+        apply_search_options(search_params, search_options)
 
         # idをローカルインデックスに変換
         initial_routes_local = []
@@ -101,12 +290,36 @@ def solve_vrp_flexible(customers, initial_routes, PD_pairs, num_vehicles, vehicl
 
         routing.CloseModelWithParameters(search_params)
         initial_solution = routing.ReadAssignmentFromRoutes(initial_routes_local, True)
-        solution = routing.SolveFromAssignmentWithParameters(initial_solution, search_params)
+        if initial_solution is None:
+            # 初期ルートが制約を満たさない（未訪問ノードを含む等）場合は通常の初期解構築に戻す
+            warm_start = False
+            search_params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.AUTOMATIC
+            apply_search_options(search_params, search_options)
+            solution = routing.SolveWithParameters(search_params)
+        else:
+            solution = routing.SolveFromAssignmentWithParameters(initial_solution, search_params)
     else:
         search_params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.AUTOMATIC
         search_params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.AUTOMATIC
+        apply_search_options(search_params, search_options)
         solution = routing.SolveWithParameters(search_params)
-    
+    solve_time = time.perf_counter() - solve_start
+
+    # [telemetry] 呼び出し単位のイベントを記録（無効時は何もしない）
+    record_solve_event(
+        phase=phase,
+        num_nodes=len(customers),
+        num_vehicles=num_vehicles,
+        num_pd=len(PD_pairs),
+        build_time=build_time,
+        solve_time=solve_time,
+        status=status_name(routing.status()),
+        objective=solution.ObjectiveValue() if solution else None,
+        warm_start=warm_start,
+    )
+    # [metrics] 実行中の数・完了数・時間のヒストグラム（無効時は何もしない）
+    solve_finished(phase, build_time + solve_time, ok=solution is not None)
+
     if not solution:
         print("No solution found.")
         return None
@@ -126,6 +339,61 @@ def solve_vrp_flexible(customers, initial_routes, PD_pairs, num_vehicles, vehicl
 
     return result
 
+class RouteCostCache:
+    """
+    ルート（ノード id のタプル）→ 総距離 の上限つき LRU。座標表は1ケースの全顧客から1度だけ作る。
+    ケース内ではノード id と座標の対応が変わらないので、同じルートの距離は1回だけ計算すればよい。
+    パイプラインがケースごとに作って cost_cache= で明示的に渡す（cached_route_cost 経由で引く）。
+    会社並列（スレッド）からも呼ばれるのでロックで守る。
+    """
+
+    def __init__(self, customers, maxsize=200000):
+        self.id_to_coord = {c['id']: (c['x'], c['y']) for c in customers}
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._costs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cost(self, route):
+        """キャッシュ済みならその値、無ければ計算して覚える。座標表に無いノードを含むなら None"""
+        key = tuple(route)
+        with self._lock:
+            cost = self._costs.get(key)
+            if cost is not None:
+                self._costs.move_to_end(key)
+                self.hits += 1
+                return cost
+        id_to_coord = self.id_to_coord
+        if any(n not in id_to_coord for n in key):
+            return None
+        cost = 0
+        for i in range(len(key) - 1):
+            x1, y1 = id_to_coord[key[i]]
+            x2, y2 = id_to_coord[key[i + 1]]
+            cost += ((x2 - x1)**2 + (y2 - y1)**2)**0.5
+        with self._lock:
+            self.misses += 1
+            self._costs[key] = cost
+            if len(self._costs) > self.maxsize:
+                self._costs.popitem(last=False)
+        return cost
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"routes": len(self._costs), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+def cached_route_cost(route, customers, cost_cache=None):
+    """cost_cache（RouteCostCache）があればそこから引き、無い（または座標表に無いノードを含む）なら route_cost で計算する"""
+    if cost_cache is not None:
+        cost = cost_cache.cost(route)
+        if cost is not None:
+            return cost
+    return route_cost(route, customers)
+
+
 def route_cost(route, customers):
     """ルートの総距離を計算する簡易関数"""
     id_to_coord = {c['id']: (c['x'], c['y']) for c in customers}
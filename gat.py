@@ -1,9 +1,31 @@
-from flexible_vrp_solver import solve_vrp_flexible, route_cost
+from flexible_vrp_solver import solve_vrp_flexible, cached_route_cost
+from route_insertion import travel_time
+from solver_metrics import pairs_evaluated, pairs_skipped
+from determinism import configure_cp_solver
 from ortools.sat.python import cp_model
+import heapq
+import math
+import os
+import time
 
+# 2車両部分問題に「元のペアの総距離」を渡し、それを下回る解が見つからない探索を打ち切る（VRP_COST_BOUND_STALL）。
+# 改善を取りこぼすことがあるので既定は無効
+GAT_COST_CUTOFF = os.getenv("VRP_GAT_COST_CUTOFF", "0") == "1"
 
-def initialize_individual_vrps(customers, pickup_to_delivery, num_lsps, vehicle_num_list, depot_id_list, vehicle_capacity, seed=42):
+
+def initialize_individual_vrps(customers, pickup_to_delivery, num_lsps, vehicle_num_list, depot_id_list, vehicle_capacity, seed=42,
+                               decompose_pairs=0, cluster_method="sweep", workers=1):
+    """
+    各社の初期経路を自社のタスクだけで解く。
+    decompose_pairs > 0 で、PD ペア数がそれを超える会社は decompose_pairs 件程度のクラスタに分けて
+    （cluster_method="sweep"=デポまわりの角度 / "kmeans"=ペア中点の k-means）、車両を件数に比例して割り振り、
+    クラスタごとに workers 並列で解いてつなぎ合わせる（1回の大きな solve を避ける）。
+    """
     all_vehicle_routes = []
+    pool = None
+    if decompose_pairs > 0 and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers)
     
     for i in range(num_lsps):
         depot_id = depot_id_list[i]
@@ -33,121 +55,262 @@ def initialize_individual_vrps(customers, pickup_to_delivery, num_lsps, vehicle_
         initial_routes = None
         # VRPを解く
         print(f">>>LSP {i+1}の初期経路を生成中・・・")
-        lsp_routes = solve_vrp_flexible(
-            sub_customers,
-            initial_routes,
-            sub_PD_pairs,
-            num_vehicles=num_vehicles,
-            vehicle_capacity=vehicle_capacity,
-            start_depots=start_depot,
-            end_depots=end_depot,
-            use_capacity=True,
-            use_time=True,
-            use_pickup_delivery=True,
-            isGAT=False
-        )
+        lsp_routes = None
+        if 0 < decompose_pairs < len(sub_PD_pairs) and num_vehicles > 1:
+            lsp_routes = solve_clustered_initial(sub_customers, sub_PD_pairs, depot_id, num_vehicles, vehicle_capacity,
+                                                 decompose_pairs, cluster_method, seed + i, pool)
+            if lsp_routes is None:
+                print(f">>>LSP {i+1}: クラスタ分割で解が得られなかったため一括で解き直します")
+        if lsp_routes is None:
+            lsp_routes = solve_vrp_flexible(
+                sub_customers,
+                initial_routes,
+                sub_PD_pairs,
+                num_vehicles=num_vehicles,
+                vehicle_capacity=vehicle_capacity,
+                start_depots=start_depot,
+                end_depots=end_depot,
+                use_capacity=True,
+                use_time=True,
+                use_pickup_delivery=True,
+                isGAT=False,
+                phase="initial"
+            )
 
         all_vehicle_routes.extend(lsp_routes)
 
+    if pool is not None:
+        pool.shutdown()
     return all_vehicle_routes
 
 
-def perform_gat_exchange(original_routes, customers, PD_pairs, vehicle_capacity, vehicle_num_list):
+def _pair_midpoint(pd, id_to_node):
+    p, d = id_to_node[pd[0]], id_to_node[pd[1]]
+    return ((p['x'] + d['x']) / 2.0, (p['y'] + d['y']) / 2.0)
+
+
+def cluster_pd_pairs(PD_pairs, depot, id_to_node, num_clusters, method="sweep", seed=42):
     """
-    社内限定GAT：与えられた routes は単一会社ぶんのみを想定。
-    - 2車両ペアごとに部分問題を解き、改善候補（アクション）を集める
-    - 各車両は最大1回だけ変更されるようにCP-SATでアクションを選択
-    - 会社間の個別合理性や会社マッピングは行わない（総距離改善のみ）
+    PD ペアを num_clusters 個の地域に分ける（空のクラスタは返さない）。
+      sweep  … デポから見たペア中点の角度で並べ、最も大きく空いた角度を切れ目にして件数で等分する
+      kmeans … ペア中点の k-means（Lloyd 法、初期中心は seed で選ぶ）
     """
-    feasible_actions = []
-    num_vehicles = len(original_routes)
+    points = [_pair_midpoint(pd, id_to_node) for pd in PD_pairs]
+    num_clusters = max(1, min(num_clusters, len(PD_pairs)))
+    if method == "sweep":
+        dx, dy = id_to_node[depot]['x'], id_to_node[depot]['y']
+        order = sorted(range(len(PD_pairs)), key=lambda j: math.atan2(points[j][1] - dy, points[j][0] - dx))
+        angles = [math.atan2(points[j][1] - dy, points[j][0] - dx) for j in order]
+        gaps = [(angles[(n + 1) % len(angles)] - angles[n]) % (2 * math.pi) for n in range(len(angles))]
+        start = (max(range(len(gaps)), key=gaps.__getitem__) + 1) % len(order)
+        order = order[start:] + order[:start]
+        bounds = [round(len(order) * c / num_clusters) for c in range(num_clusters + 1)]
+        return [[PD_pairs[j] for j in order[bounds[c]:bounds[c + 1]]] for c in range(num_clusters)
+                if bounds[c] < bounds[c + 1]]
+    if method != "kmeans":
+        raise ValueError(f"cluster_pd_pairs: 不正な method です: {method}")
+    import random
+    rng = random.Random(seed)
+    centers = [points[j] for j in rng.sample(range(len(points)), num_clusters)]
+    labels = None
+    for _ in range(50):
+        new_labels = [min(range(num_clusters), key=lambda c: math.hypot(x - centers[c][0], y - centers[c][1]))
+                      for x, y in points]
+        if new_labels == labels:
+            break
+        labels = new_labels
+        for c in range(num_clusters):
+            members = [points[j] for j in range(len(points)) if labels[j] == c]
+            if members:
+                centers[c] = (sum(x for x, _ in members) / len(members), sum(y for _, y in members) / len(members))
+    clusters = [[PD_pairs[j] for j in range(len(PD_pairs)) if labels[j] == c] for c in range(num_clusters)]
+    return [c for c in clusters if c]
 
-    # 各車両ルートに関連する PD ペア（そのルートに現れるノードを含むペア）を前計算
-    PD_pairs_of_each_vehicle = []
-    for vehicle_route in original_routes:
-        related_pairs = []
-        visited_set = set(vehicle_route)
-        for pickup, delivery in PD_pairs.items():
-            if pickup in visited_set or delivery in visited_set:
-                related_pairs.append((pickup, delivery))
-        PD_pairs_of_each_vehicle.append(related_pairs)
 
-    # 全ての 2車両ペア (i, j) に対し、2車両VRPで最適化した候補を収集
-    for i in range(num_vehicles):
-        for j in range(i + 1, num_vehicles):
-            # 対象ノード集合（両ルートの訪問ノード + 各自デポ）
-            combined_node_ids = set(original_routes[i] + original_routes[j])
-            if original_routes[i]:
-                combined_node_ids.add(original_routes[i][0])
-            if original_routes[j]:
-                combined_node_ids.add(original_routes[j][0])
-
-            # サブ顧客＆サブPD
-            sub_customers = [c for c in customers if c['id'] in combined_node_ids]
-            PD_pairs_2v = PD_pairs_of_each_vehicle[i] + PD_pairs_of_each_vehicle[j]
+def allocate_vehicles(sizes, num_vehicles):
+    """各クラスタに最低1台、残りを件数に比例して（最大剰余で）割り振る"""
+    counts = [1] * len(sizes)
+    rest = num_vehicles - len(sizes)
+    total = sum(sizes)
+    shares = [rest * s / total for s in sizes]
+    for c, share in enumerate(shares):
+        counts[c] += int(share)
+    leftover = num_vehicles - sum(counts)
+    for c in sorted(range(len(sizes)), key=lambda c: shares[c] - int(shares[c]), reverse=True)[:leftover]:
+        counts[c] += 1
+    return counts
 
-            # 両車両の（開始=終了）デポ
-            start_i = original_routes[i][0] if original_routes[i] else customers[0]['id']
-            start_j = original_routes[j][0] if original_routes[j] else customers[0]['id']
-            start_depots = [start_i, start_j]
-            end_depots = [start_i, start_j]
-
-            # 初期ルート（デポを取り除いてヒントにする）
-            initial_routes = []
-            for r in (original_routes[i], original_routes[j]):
-                if len(r) >= 2 and r[0] == r[-1]:
-                    initial_routes.append(r[1:-1])
-                else:
-                    initial_routes.append(r)
-
-            # 2車両の部分問題を解く（解が無ければスキップ）
-            new_routes = solve_vrp_flexible(
-                sub_customers, initial_routes, PD_pairs_2v,
-                num_vehicles=2, vehicle_capacity=vehicle_capacity,
-                start_depots=start_depots, end_depots=end_depots,
-                use_capacity=True, use_time=True, use_pickup_delivery=True,
-                isGAT=True  # ※あなたの実装に合わせています
-            )
-            if new_routes is None:
-                continue
 
-            old_cost = route_cost(original_routes[i], customers) + route_cost(original_routes[j], customers)
-            new_cost = sum(route_cost(r, customers) for r in new_routes)
-
-            # 改善がある場合のみ候補として保存
-            if new_cost < old_cost:
-                feasible_actions.append({
-                    'vehicle_pair': (i, j),
-                    'new_routes': new_routes,
-                    'old_cost': old_cost,
-                    'new_cost': new_cost,
-                    'cost_improvement': old_cost - new_cost
-                })
-
-                # 追加の“入れ替え版”も候補に入れる（元実装の有効手）
-                depot_i = new_routes[0][0]
-                depot_j = new_routes[1][0]
-                mid_i = [n for n in new_routes[0] if n != depot_i]
-                mid_j = [n for n in new_routes[1] if n != depot_j]
-                exchanged_routes = [
-                    [depot_i] + mid_j + [depot_i],
-                    [depot_j] + mid_i + [depot_j]
-                ]
-                exchanged_cost = sum(route_cost(r, customers) for r in exchanged_routes)
-                if exchanged_cost < old_cost:
-                    feasible_actions.append({
-                        'vehicle_pair': (i, j),
-                        'new_routes': exchanged_routes,
-                        'old_cost': old_cost,
-                        'new_cost': exchanged_cost,
-                        'cost_improvement': old_cost - exchanged_cost
-                    })
+def solve_clustered_initial(sub_customers, sub_PD_pairs, depot_id, num_vehicles, vehicle_capacity,
+                            cluster_pairs, method="sweep", seed=42, pool=None):
+    """
+    1社ぶんの初期解をクラスタ分割で作る（クラスタごとに solve_vrp_flexible、pool があれば並列）。
+    どれかのクラスタが解けなければ None（呼び出し側で一括の solve に戻す）。
+    """
+    id_to_node = {c['id']: c for c in sub_customers}
+    num_clusters = min(num_vehicles, math.ceil(len(sub_PD_pairs) / cluster_pairs))
+    clusters = cluster_pd_pairs(sub_PD_pairs, depot_id, id_to_node, num_clusters, method, seed)
+    vehicle_counts = allocate_vehicles([len(c) for c in clusters], num_vehicles)
+
+    tasks = []
+    for pairs, count in zip(clusters, vehicle_counts):
+        node_ids = {depot_id} | {n for pd in pairs for n in pd}
+        cluster_customers = [c for c in sub_customers if c['id'] in node_ids]
+        args = (cluster_customers, None, pairs, count, vehicle_capacity, [depot_id] * count, [depot_id] * count,
+                True, True, True, False, "initial_cluster")
+        tasks.append(pool.submit(solve_vrp_flexible, *args) if pool is not None else args)
+    print(f"    {len(clusters)}クラスタ（{method}）: ペア数 {[len(c) for c in clusters]} / 車両数 {vehicle_counts}")
+
+    routes = []
+    for task in tasks:
+        cluster_routes = task.result() if pool is not None else solve_vrp_flexible(*task)
+        if cluster_routes is None:
+            return None
+        routes.extend(cluster_routes)
+    return routes
+
+
+def related_pd_pairs(route, PD_pairs):
+    """そのルートに現れるノードを含む PD ペアのリスト"""
+    visited_set = set(route)
+    return [(pickup, delivery) for pickup, delivery in PD_pairs.items()
+            if pickup in visited_set or delivery in visited_set]
+
 
+def evaluate_vehicle_pair(route_i, route_j, customers, PD_pairs_2v, vehicle_capacity, phase="gat",
+                          allow_swap=True, distance_matrix=None, time_matrix=None, arrays=None, cost_cache=None):
+    """
+    2車両の部分問題を解き、改善となる候補ルート（最大2通り）を返す。
+    - route_i / route_j はデポ始終のルート。各車両は自分のデポを維持する
+    - allow_swap=False なら“入れ替え版”を候補にしない（デポが異なると時間枠を保証できないため）
+    - distance_matrix / time_matrix: 部分問題の顧客（customers から抽出した並び）に対応する前計算行列
+    - arrays: 同じ並びの前計算済み node_arrays（行列・需要・時間枠。与えれば行列より優先）
+    - cost_cache: ケースの RouteCostCache（あればルートの総距離をそこから引く）
+    - 戻り値: [{'new_routes', 'old_cost', 'new_cost', 'cost_improvement'}, ...]
+    """
+    # 対象ノード集合（両ルートの訪問ノード + 各自デポ）
+    combined_node_ids = set(route_i + route_j)
+    if route_i:
+        combined_node_ids.add(route_i[0])
+    if route_j:
+        combined_node_ids.add(route_j[0])
+
+    # サブ顧客
+    sub_customers = [c for c in customers if c['id'] in combined_node_ids]
+
+    # 両車両の（開始=終了）デポ
+    start_i = route_i[0] if route_i else customers[0]['id']
+    start_j = route_j[0] if route_j else customers[0]['id']
+    start_depots = [start_i, start_j]
+    end_depots = [start_i, start_j]
+
+    # 初期ルート（デポを取り除いてヒントにする）
+    initial_routes = []
+    for r in (route_i, route_j):
+        if len(r) >= 2 and r[0] == r[-1]:
+            initial_routes.append(r[1:-1])
+        else:
+            initial_routes.append(r)
+
+    # 改善判定の基準。ソルバーにも上限として渡し、これを超える解の探索を打ち切らせる
+    old_cost = cached_route_cost(route_i, customers, cost_cache) + cached_route_cost(route_j, customers, cost_cache)
+
+    # 2車両の部分問題を解く（解が無ければ候補なし）
+    new_routes = solve_vrp_flexible(
+        sub_customers, initial_routes, PD_pairs_2v,
+        num_vehicles=2, vehicle_capacity=vehicle_capacity,
+        start_depots=start_depots, end_depots=end_depots,
+        use_capacity=True, use_time=True, use_pickup_delivery=True,
+        isGAT=True,  # ※あなたの実装に合わせています
+        phase=phase,
+        distance_matrix=distance_matrix, time_matrix=time_matrix, arrays=arrays,
+        cost_upper_bound=old_cost if GAT_COST_CUTOFF else None
+    )
+    if new_routes is None:
+        return []
+
+    new_cost = sum(cached_route_cost(r, customers, cost_cache) for r in new_routes)
+
+    # 改善がある場合のみ候補として保存
+    candidates = []
+    if new_cost < old_cost:
+        candidates.append({
+            'new_routes': new_routes,
+            'old_cost': old_cost,
+            'new_cost': new_cost,
+            'cost_improvement': old_cost - new_cost
+        })
+
+    # 追加の“入れ替え版”も候補に入れる（元実装の有効手）
+    if candidates and allow_swap:
+        depot_i = new_routes[0][0]
+        depot_j = new_routes[1][0]
+        mid_i = [n for n in new_routes[0] if n != depot_i]
+        mid_j = [n for n in new_routes[1] if n != depot_j]
+        exchanged_routes = [
+            [depot_i] + mid_j + [depot_i],
+            [depot_j] + mid_i + [depot_j]
+        ]
+        exchanged_cost = sum(cached_route_cost(r, customers, cost_cache) for r in exchanged_routes)
+        if exchanged_cost < old_cost:
+            candidates.append({
+                'new_routes': exchanged_routes,
+                'old_cost': old_cost,
+                'new_cost': exchanged_cost,
+                'cost_improvement': old_cost - exchanged_cost
+            })
+    return candidates
+
+
+def pair_task(pair, route_i, route_j, PD_pairs_2v, vehicle_capacity, phase="gat", allow_swap=True):
+    """2車両部分問題1件分の小さな記述子（ワーカープロセスへ渡す単位）"""
+    return {
+        'vehicle_pair': pair,
+        'route_i': route_i,
+        'route_j': route_j,
+        'PD_pairs': PD_pairs_2v,
+        'vehicle_capacity': vehicle_capacity,
+        'phase': phase,
+        'allow_swap': allow_swap,
+    }
+
+
+def pair_task_node_ids(task):
+    """部分問題に登場するノードID（デポ含む）を昇順で返す"""
+    return sorted(set(task['route_i']) | set(task['route_j']))
+
+
+def run_pair_task(task, customers, distance_matrix=None, time_matrix=None, arrays=None, cost_cache=None):
+    """pair_task を解いて改善候補（vehicle_pair 付き）を返す"""
+    candidates = evaluate_vehicle_pair(
+        task['route_i'], task['route_j'], customers, task['PD_pairs'], task['vehicle_capacity'],
+        phase=task['phase'], allow_swap=task['allow_swap'],
+        distance_matrix=distance_matrix, time_matrix=time_matrix, arrays=arrays, cost_cache=cost_cache
+    )
+    for cand in candidates:
+        cand['vehicle_pair'] = task['vehicle_pair']
+    return candidates
+
+
+def run_pair_tasks(tasks, customers, executor=None, cost_cache=None):
+    """
+    pair_task のリストを解き、タスクと同じ順で結果（候補リスト）を返す。
+    executor（pair_executor の各バックエンド）を渡せばそちらで並列に解く（cost_cache は同じプロセスで解くときだけ使う）。
+    """
+    if executor is None:
+        return [run_pair_task(t, customers, cost_cache=cost_cache) for t in tasks]
+    return executor.map_pairs(tasks, customers)
+
+
+def select_exchange_actions(original_routes, feasible_actions):
+    """
+    CP-SAT：各車両は高々1回だけ使われるようにアクションを選択し、総改善量を最大化して
+    適用後の全車両ルートを返す。feasible_actions の各要素は 'vehicle_pair' を持つ。
+    """
     # 改善候補が無ければそのまま返す
     if not feasible_actions:
         return original_routes
 
-    # CP-SAT：各車両は高々1回だけ使われるようにアクションを選択し、総改善量を最大化
     model = cp_model.CpModel()
     x = [model.NewBoolVar(f'action_{k}') for k in range(len(feasible_actions))]
     model.Maximize(sum(int(round(a['cost_improvement'])) * x[k] for k, a in enumerate(feasible_actions)))
@@ -161,7 +324,7 @@ def perform_gat_exchange(original_routes, customers, PD_pairs, vehicle_capacity,
     for v, idxs in vehicle_to_actions.items():
         model.Add(sum(x[i] for i in idxs) <= 1)
 
-    solver = cp_model.CpSolver()
+    solver = configure_cp_solver(cp_model.CpSolver())
     status = solver.Solve(model)
 
     new_all_vehicles_routes = original_routes.copy()
@@ -177,3 +340,200 @@ def perform_gat_exchange(original_routes, customers, PD_pairs, vehicle_capacity,
 
     return new_all_vehicles_routes
 
+
+def perform_gat_exchange(original_routes, customers, PD_pairs, vehicle_capacity, vehicle_num_list, executor=None,
+                         cost_cache=None):
+    """
+    社内限定GAT：与えられた routes は単一会社ぶんのみを想定。
+    - 2車両ペアごとに部分問題を解き、改善候補（アクション）を集める（executor があれば並列）
+    - 各車両は最大1回だけ変更されるようにCP-SATでアクションを選択
+    - 会社間の個別合理性や会社マッピングは行わない（総距離改善のみ）
+    """
+    num_vehicles = len(original_routes)
+
+    # 各車両ルートに関連する PD ペア（そのルートに現れるノードを含むペア）を前計算
+    PD_pairs_of_each_vehicle = [related_pd_pairs(r, PD_pairs) for r in original_routes]
+
+    # 全ての 2車両ペア (i, j) に対し、2車両VRPで最適化した候補を収集
+    tasks = []
+    for i in range(num_vehicles):
+        for j in range(i + 1, num_vehicles):
+            PD_pairs_2v = PD_pairs_of_each_vehicle[i] + PD_pairs_of_each_vehicle[j]
+            tasks.append(pair_task((i, j), original_routes[i], original_routes[j], PD_pairs_2v, vehicle_capacity))
+    pairs_evaluated("gat", len(tasks))
+    feasible_actions = [cand for cands in run_pair_tasks(tasks, customers, executor, cost_cache) for cand in cands]
+
+    return select_exchange_actions(original_routes, feasible_actions)
+
+
+def run_company_gat(company_routes, sub_customers, sub_PD_pairs, vehicle_capacity, deadline=None, history=None,
+                    executor=None, engine="pair", cost_cache=None):
+    """
+    1社ぶんの社内GATを1回実行する（会社並列のときはスレッド／プロセスの1タスクになる単位）。
+    engine="lns" なら deadline まで lns_engine.perform_lns（history は LNSState）、
+    そうでなければ deadline があれば anytime 版（history は PairHistory）、無ければ全ペア版。
+    cost_cache はケースの RouteCostCache（会社ごとにプロセスを分けるときは None）。
+    戻り値: (新しいルート, 評価したペア数／LNS反復回数 or None, 期限切れで打ち切ったか, history)
+    """
+    if engine == "lns":
+        from lns_engine import perform_lns
+        routes, iterations, history = perform_lns(
+            company_routes, sub_customers, sub_PD_pairs, vehicle_capacity, deadline, state=history,
+            cost_cache=cost_cache
+        )
+        return routes, iterations, False, history
+    if deadline is not None:
+        routes, num_evaluated, timed_out = perform_gat_exchange_anytime(
+            company_routes, sub_customers, sub_PD_pairs, vehicle_capacity, deadline, history=history,
+            executor=executor, cost_cache=cost_cache
+        )
+        return routes, num_evaluated, timed_out, history
+    routes = perform_gat_exchange(
+        company_routes,                # 会社内ルートのみ
+        sub_customers,                 # 会社内顧客のみ
+        sub_PD_pairs,                  # 会社内PDのみ
+        vehicle_capacity,
+        [len(company_routes)],         # その会社の台数のみ
+        executor=executor,
+        cost_cache=cost_cache
+    )
+    return routes, None, False, history
+
+
+class PairHistory:
+    """
+    anytime GAT 用のペア履歴（会社ごとにラウンドをまたいで保持）。
+    - gains: 車両ペア (i, j) で過去に得られた改善量の累計
+    - exhausted: 改善が出なかった時の (route_i, route_j) の組。ルートが変わるまで再評価しない
+    """
+
+    def __init__(self):
+        self.gains = {}
+        self.exhausted = set()
+
+
+def _route_slack(route, id_to_node):
+    """ルート上で最も余裕の無いノードの (due - 到着時刻) を計画期間で正規化した値（0〜1）"""
+    if len(route) <= 2:
+        return 1.0
+    horizon = max(1, id_to_node[route[0]]['due'] - id_to_node[route[0]]['ready'])
+    t = id_to_node[route[0]]['ready']
+    slack = horizon
+    for k in range(1, len(route)):
+        prev = id_to_node[route[k - 1]]
+        node = id_to_node[route[k]]
+        t = max(node['ready'], t + travel_time(prev, node) + prev['service'])
+        slack = min(slack, node['due'] - t)
+    return max(0.0, min(1.0, slack / horizon))
+
+
+def _route_centroid(route, id_to_node):
+    tasks = route[1:-1] or route[:1]
+    return (sum(id_to_node[n]['x'] for n in tasks) / len(tasks),
+            sum(id_to_node[n]['y'] for n in tasks) / len(tasks))
+
+
+def score_vehicle_pair(route_i, route_j, id_to_node, history, pair, scale):
+    """
+    ペアの有望度（大きいほど先に解く）。ソルバーを呼ばずに計算できる指標だけを使う。
+      - 近さ: ルート重心間の距離が近いほど交換余地が大きい
+      - 余裕: 時間枠の余裕が大きいほど組み替えが通りやすい
+      - 実績: 過去にそのペアで得られた改善量
+    """
+    ci = _route_centroid(route_i, id_to_node)
+    cj = _route_centroid(route_j, id_to_node)
+    proximity = 1.0 / (1.0 + math.hypot(ci[0] - cj[0], ci[1] - cj[1]) / scale)
+    slack = (_route_slack(route_i, id_to_node) + _route_slack(route_j, id_to_node)) / 2.0
+    max_gain = max(history.gains.values(), default=0.0)
+    past = history.gains.get(pair, 0.0) / max_gain if max_gain > 0 else 0.0
+    return proximity + 0.5 * slack + 2.0 * past
+
+
+def perform_gat_exchange_anytime(original_routes, customers, PD_pairs, vehicle_capacity, deadline,
+                                 history=None, executor=None, cost_cache=None):
+    """
+    anytime 版の社内GAT：
+    - 全2車両ペアを score_vehicle_pair で採点し、優先度付きキューの順に解く
+    - 改善が出たらその場で確定（以降のペアは更新後のルートで評価）
+    - deadline（time.time() 基準の時刻）を過ぎたら、その時点で最良のルートを返す
+    - executor があれば、車両が重ならない上位ペアをワーカー数ずつまとめて並列に解く
+      （同じバッチのペアは互いに独立なので、全ての改善をそのまま確定できる）
+    戻り値: (新しいルート, 評価したペア数, 期限切れで打ち切ったか)
+    """
+    if history is None:
+        history = PairHistory()
+    routes = [list(r) for r in original_routes]
+    id_to_node = {c['id']: c for c in customers}
+    xs = [c['x'] for c in customers]
+    ys = [c['y'] for c in customers]
+    scale = max(1e-6, math.hypot(max(xs) - min(xs), max(ys) - min(ys)) / 10.0)
+    batch_size = max(1, executor.num_workers) if executor is not None else 1
+
+    # ルートが更新されたら version を進めて関連ペアを採点し直して再投入する（古いエントリは読み捨て）
+    version = [0] * len(routes)
+    queue = []
+    skipped = 0
+    for i in range(len(routes)):
+        for j in range(i + 1, len(routes)):
+            if len(routes[i]) <= 2 and len(routes[j]) <= 2:
+                skipped += 1
+                continue
+            score = score_vehicle_pair(routes[i], routes[j], id_to_node, history, (i, j), scale)
+            heapq.heappush(queue, (-score, i, j, 0, 0))
+
+    evaluated = 0
+    timed_out = False
+    while queue:
+        if time.time() >= deadline:
+            timed_out = True
+            break
+        # 優先度順に、既に選んだペアと車両が重ならないものを batch_size 件まで取り出す
+        batch = []
+        used = set()
+        deferred = []
+        while queue and len(batch) < batch_size:
+            entry = heapq.heappop(queue)
+            _, i, j, vi, vj = entry
+            if (vi, vj) != (version[i], version[j]):
+                continue
+            key = (tuple(routes[i]), tuple(routes[j]))
+            if key in history.exhausted:
+                skipped += 1
+                continue
+            if i in used or j in used:
+                deferred.append(entry)
+                continue
+            used.update((i, j))
+            batch.append((i, j, key))
+        for entry in deferred:
+            heapq.heappush(queue, entry)
+        if not batch:
+            continue
+
+        tasks = [
+            pair_task((i, j), routes[i], routes[j],
+                      related_pd_pairs(routes[i], PD_pairs) + related_pd_pairs(routes[j], PD_pairs), vehicle_capacity)
+            for i, j, _ in batch
+        ]
+        results = run_pair_tasks(tasks, customers, executor, cost_cache)
+        evaluated += len(batch)
+        for (i, j, key), candidates in zip(batch, results):
+            if not candidates:
+                history.exhausted.add(key)
+                continue
+
+            # 改善を即時確定
+            best = max(candidates, key=lambda a: a['cost_improvement'])
+            routes[i], routes[j] = best['new_routes']
+            history.gains[(i, j)] = history.gains.get((i, j), 0.0) + best['cost_improvement']
+            version[i] += 1
+            version[j] += 1
+            # 更新された車両を含むペアを再投入
+            touched = {(min(v, k), max(v, k)) for v in (i, j) for k in range(len(routes)) if k != v}
+            for a, b in sorted(touched):
+                score = score_vehicle_pair(routes[a], routes[b], id_to_node, history, (a, b), scale)
+                heapq.heappush(queue, (-score, a, b, version[a], version[b]))
+
+    pairs_evaluated("gat", evaluated)
+    pairs_skipped("gat", skipped)
+    return routes, evaluated, timed_out
@@ -0,0 +1,143 @@
+import math
+import random
+from parser import parse_lilim
+
+
+def synthetic_pdptw(num_pairs, num_vehicles=None, vehicle_capacity=200, area=100.0, horizon=1236,
+                    service=90, tw_width=(60, 240), demand_range=(10, 40), seed=0,
+                    x_offset=0.0, y_offset=0.0, id_offset=0):
+    """
+    Li & Lim 形式と同じ dict（parse_lilim の戻り値）で、ランダムな PDPTW インスタンスを作る。
+    - デポは領域中央。pickup / delivery は一様分布
+    - 時間枠は「デポ→pickup→delivery→デポ」を1台で直行できるように置く（各ペア単独では必ず実行可能）
+    - ID はデポ=id_offset、以降 pickup, delivery の順に連番
+    """
+    rng = random.Random(seed)
+    if num_vehicles is None:
+        num_vehicles = max(2, math.ceil(num_pairs / 2))
+
+    def node(nid, x, y, demand, ready, due, p_idx, d_idx, svc):
+        return {'id': nid, 'x': x + x_offset, 'y': y + y_offset, 'demand': demand, 'ready': ready,
+                'due': due, 'service': svc, 'pickup_index': p_idx, 'delivery_index': d_idx}
+
+    depot_x = depot_y = area / 2.0
+    customers = [node(id_offset, depot_x, depot_y, 0, 0, horizon, 0, 0, 0)]
+    PD_pairs = {}
+    for k in range(num_pairs):
+        p_id = id_offset + 2 * k + 1
+        d_id = p_id + 1
+        px, py = rng.uniform(0, area), rng.uniform(0, area)
+        dx, dy = rng.uniform(0, area), rng.uniform(0, area)
+        t_dp = int(math.hypot(px - depot_x, py - depot_y))
+        t_pd = int(math.hypot(dx - px, dy - py))
+        t_dd = int(math.hypot(depot_x - dx, depot_y - dy))
+
+        # pickup 到着の取りうる範囲 [t_dp, latest_p] から中心を選び、幅を持たせる
+        latest_p = horizon - (service + t_pd + service + t_dd)
+        if latest_p < t_dp:
+            # 直行でも間に合わない遠方ペアは近くに寄せ直す
+            dx, dy = px, py
+            t_pd, t_dd = 0, t_dp
+            latest_p = max(t_dp, horizon - (2 * service + t_dd))
+        center_p = rng.uniform(t_dp, latest_p)
+        w = rng.uniform(*tw_width)
+        ready_p = int(max(0, center_p - w / 2))
+        due_p = int(min(latest_p, center_p + w / 2))
+        due_p = max(due_p, ready_p)
+
+        # pickup は max(ready_p, t_dp) より前には始められない
+        earliest_d = max(ready_p, t_dp) + service + t_pd
+        latest_d = horizon - (service + t_dd)
+        center_d = rng.uniform(earliest_d, max(earliest_d, latest_d))
+        w = rng.uniform(*tw_width)
+        ready_d = int(max(earliest_d - t_pd, center_d - w / 2))
+        due_d = int(max(earliest_d, min(latest_d, center_d + w / 2)))
+
+        demand = rng.randint(*demand_range)
+        customers.append(node(p_id, px, py, demand, ready_p, due_p, 0, d_id, service))
+        customers.append(node(d_id, dx, dy, -demand, ready_d, due_d, p_id, 0, service))
+        PD_pairs[p_id] = d_id
+
+    return {
+        'customers': customers,
+        'PD_pairs': PD_pairs,
+        'num_vehicles': num_vehicles,
+        'vehicle_capacity': vehicle_capacity,
+        'depot_id': id_offset,
+        'depot_coord': (depot_x + x_offset, depot_y + y_offset),
+    }
+
+
+def auto_offsets(num_lsps, spacing=30.0, layout="ring"):
+    """
+    LSP の座標オフセットを自動で決める（1社目は (0, 0)）。
+    - "ring": 半径 spacing の円周上に等間隔（隣接社の領域が部分的に重なる）
+    - "grid": spacing 間隔の格子
+    """
+    if layout == "ring":
+        if num_lsps == 1:
+            return [(0.0, 0.0)]
+        radius = spacing / (2 * math.sin(math.pi / num_lsps)) if num_lsps > 2 else spacing / 2
+        offsets = []
+        for k in range(num_lsps):
+            theta = 2 * math.pi * k / num_lsps
+            offsets.append((round(radius * math.cos(theta) - radius, 3), round(radius * math.sin(theta), 3)))
+        return offsets
+    if layout == "grid":
+        cols = math.ceil(math.sqrt(num_lsps))
+        return [((k % cols) * spacing, (k // cols) * spacing) for k in range(num_lsps)]
+    raise ValueError(f"layout must be 'ring' or 'grid': {layout}")
+
+
+def combine_datasets(datasets):
+    """
+    各社のデータ（ID・座標オフセット付与済み）を1つのインスタンスに結合する。
+    ID は各社で連続した範囲（デポが先頭）になっている前提（initialize_individual_vrps の切り出しと同じ）。
+    """
+    out = {
+        'customers': [], 'PD_pairs': {}, 'depot_id_list': [], 'depot_coords': [],
+        'vehicle_num_list': [], 'vehicle_capacity': None,
+    }
+    for data in datasets:
+        out['customers'].extend(data['customers'])
+        out['PD_pairs'].update(data['PD_pairs'])
+        out['depot_id_list'].append(data['depot_id'])
+        out['depot_coords'].append(data['depot_coord'])
+        out['vehicle_num_list'].append(data['num_vehicles'])
+        if out['vehicle_capacity'] is None:
+            out['vehicle_capacity'] = data['vehicle_capacity']
+    return out
+
+
+def load_case(file_paths, offsets):
+    """Li & Lim ファイルを座標・IDオフセットを付けて読み込み、結合する（main.py のテストケース形式）"""
+    datasets = []
+    id_offset = 0
+    for path, offset in zip(file_paths, offsets):
+        data = parse_lilim(path, x_offset=offset[0], y_offset=offset[1], id_offset=id_offset)
+        datasets.append(data)
+        id_offset = max(c['id'] for c in data['customers']) + 1
+    return combine_datasets(datasets)
+
+
+def compose_case(sources, spacing=30.0, layout="ring", seed=0):
+    """
+    N社のインスタンスを自動オフセットで合成する。
+    sources の各要素は Li & Lim ファイルのパス（str）か、synthetic_pdptw の引数 dict（例 {"num_pairs": 300}）。
+    戻り値は combine_datasets の dict に 'offsets' を加えたもの。
+    """
+    offsets = auto_offsets(len(sources), spacing=spacing, layout=layout)
+    datasets = []
+    id_offset = 0
+    for k, (src, (ox, oy)) in enumerate(zip(sources, offsets)):
+        if isinstance(src, str):
+            data = parse_lilim(src, x_offset=ox, y_offset=oy, id_offset=id_offset)
+        else:
+            params = dict(src)
+            params.setdefault('seed', seed + k)
+            data = synthetic_pdptw(x_offset=ox, y_offset=oy, id_offset=id_offset, **params)
+        datasets.append(data)
+        id_offset = max(c['id'] for c in data['customers']) + 1
+    case = combine_datasets(datasets)
+    case['offsets'] = offsets
+    return case
@@ -0,0 +1,145 @@
+from route_insertion import euclid, travel_time, is_route_feasible, route_length
+
+# これ以下の訪問数（デポを除く）のルートはビットマスク DP で厳密に並べ直す
+MAX_EXACT_STOPS = 12
+# Or-opt で動かす区間の最大長
+OR_OPT_MAX_SEGMENT = 3
+
+
+def _add_label(labels, label):
+    """(cost, time) のパレート集合に label を加える（支配されていれば加えない）"""
+    cost, t = label[0], label[1]
+    for other in labels:
+        if other[0] <= cost and other[1] <= t:
+            return
+    labels[:] = [o for o in labels if not (cost <= o[0] and t <= o[1])]
+    labels.append(label)
+
+
+def exact_route_order(route, id_to_node, vehicle_capacity):
+    """
+    1本のルートの訪問順を、総距離が最小になるようビットマスク DP で厳密に求める（TSP-PDTW）。
+    状態 = (訪問済み集合, 最後のノード)、ラベル = (距離, 時刻) のパレート集合。
+      - delivery は同じルート内の pickup を訪問済みの状態からしか追加しない（順序）
+      - 積載量は訪問済み集合で決まるので、集合ごとに容量を判定する
+      - 距離 + 最後のノード→終点デポ が元のルートの距離を超えるラベルは捨てる
+    時間・容量の扱いは is_route_feasible と同じ。元より短い順序が無ければ元のルートを返す。
+    """
+    stops = route[1:-1]
+    n = len(stops)
+    if n < 2:
+        return list(route)
+    nodes = [id_to_node[route[0]]] + [id_to_node[s] for s in stops] + [id_to_node[route[-1]]]
+    end = n + 1
+    dist = [[euclid(a, b) for b in nodes] for a in nodes]
+    move = [[travel_time(a, b) + a['service'] for b in nodes] for a in nodes]
+    position = {s: k for k, s in enumerate(stops)}
+    pred = [0] * n
+    for k, s in enumerate(stops):
+        node = id_to_node[s]
+        p = node.get('pickup_index', 0)
+        if node['demand'] < 0 and p in position:
+            pred[k] = 1 << position[p]
+    demand = [id_to_node[s]['demand'] for s in stops]
+    bound = route_length(route, id_to_node) - 1e-9
+
+    # ラベル: (距離, 時刻, 直前のラベル, ノード番号)
+    layer = {(0, 0): [(0.0, nodes[0]['ready'], None, 0)]}
+    load = {0: 0}
+    for _ in range(n):
+        nxt = {}
+        for (mask, last), labels in layer.items():
+            for k in range(n):
+                bit = 1 << k
+                if mask & bit or (pred[k] and not mask & pred[k]):
+                    continue
+                new_mask = mask | bit
+                new_load = load[mask] + demand[k]
+                if new_load < 0 or new_load > vehicle_capacity:
+                    continue
+                load[new_mask] = new_load
+                node = nodes[k + 1]
+                for label in labels:
+                    cost = label[0] + dist[last][k + 1]
+                    if cost + dist[k + 1][end] > bound:
+                        continue
+                    t = max(node['ready'], label[1] + move[last][k + 1])
+                    if t > node['due']:
+                        continue
+                    _add_label(nxt.setdefault((new_mask, k + 1), []), (cost, t, label, k + 1))
+        layer = nxt
+        if not layer:
+            return list(route)
+
+    best = None
+    for (_, last), labels in layer.items():
+        for label in labels:
+            cost = label[0] + dist[last][end]
+            t = max(nodes[end]['ready'], label[1] + move[last][end])
+            if t <= nodes[end]['due'] and cost <= bound and (best is None or cost < best[0]):
+                best = (cost, label)
+    if best is None:
+        return list(route)
+    order = []
+    label = best[1]
+    while label[2] is not None:
+        order.append(stops[label[3] - 1])
+        label = label[2]
+    return [route[0]] + order[::-1] + [route[-1]]
+
+
+def or_opt(route, id_to_node, vehicle_capacity, max_segment=OR_OPT_MAX_SEGMENT):
+    """長さ 1..max_segment の区間を同じルートの別の位置へ動かす改善を、改善が無くなるまで繰り返す"""
+    route = list(route)
+    improved = True
+    while improved:
+        improved = False
+        for length in range(1, max_segment + 1):
+            for i in range(1, len(route) - length):
+                seg = route[i:i + length]
+                a, b = id_to_node[route[i - 1]], id_to_node[route[i + length]]
+                s0, s1 = id_to_node[seg[0]], id_to_node[seg[-1]]
+                removed = euclid(a, s0) + euclid(s1, b) - euclid(a, b)
+                rest = route[:i] + route[i + length:]
+                for j in range(len(rest) - 1):
+                    if j == i - 1:
+                        continue
+                    c, d = id_to_node[rest[j]], id_to_node[rest[j + 1]]
+                    if euclid(c, s0) + euclid(s1, d) - euclid(c, d) - removed >= -1e-9:
+                        continue
+                    candidate = rest[:j + 1] + seg + rest[j + 1:]
+                    if is_route_feasible(candidate, id_to_node, vehicle_capacity):
+                        route = candidate
+                        improved = True
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+    return route
+
+
+def optimize_route(route, id_to_node, vehicle_capacity, max_exact=MAX_EXACT_STOPS):
+    """訪問数が max_exact 以下なら厳密 DP、それより長ければ Or-opt で1本のルートの順序を改善する"""
+    if len(route) - 2 <= max_exact:
+        return exact_route_order(route, id_to_node, vehicle_capacity)
+    return or_opt(route, id_to_node, vehicle_capacity)
+
+
+def optimize_routes(routes, id_to_node, vehicle_capacity, max_exact=MAX_EXACT_STOPS):
+    """
+    全ルートの訪問順を1本ずつ改善する（車両間でタスクは動かさない）。
+    戻り値: (新しいルート, 総距離の改善量, 順序が変わった車両数)
+    """
+    new_routes, gain, changed = [], 0.0, 0
+    for route in routes:
+        new_route = optimize_route(route, id_to_node, vehicle_capacity, max_exact)
+        if new_route != route:
+            delta = route_length(route, id_to_node) - route_length(new_route, id_to_node)
+            if delta > 1e-9:
+                gain += delta
+                changed += 1
+            else:
+                new_route = list(route)
+        new_routes.append(new_route)
+    return new_routes, gain, changed
@@ -0,0 +1,173 @@
+import math
+import random
+import time
+from flexible_vrp_solver import solve_vrp_flexible, cached_route_cost
+from gat import related_pd_pairs
+from route_insertion import insert_pd_pairs, route_length
+from determinism import deterministic_enabled
+
+# 何も改善しない腕も時々は選ばれるよう、重みに足す下駄（改善量/秒）
+MIN_WEIGHT = 0.05
+# 改善量/秒 の指数移動平均の重み
+SCORE_DECAY = 0.3
+# 決定的モードで max_iterations 未指定のときの1回あたりの反復数（時間では区切らない）
+DETERMINISTIC_ITERATIONS = 200
+
+
+class LNSState:
+    """
+    LNS の適応状態（会社ごとにラウンドをまたいで保持）。
+    腕（"routes", k）= 空間的に近い k 台をまとめて解き直す、（"requests", None）= PD 要求を抜いて再挿入する。
+    各腕の「改善量/秒」の移動平均に比例した確率で次の腕を選ぶので、効いている k に寄っていく。
+    """
+
+    def __init__(self, k_max=5, seed=0):
+        self.arms = [("routes", k) for k in range(2, max(2, k_max) + 1)] + [("requests", None)]
+        self.scores = {arm: 1.0 for arm in self.arms}   # 最初は一様
+        self.calls = {arm: 0 for arm in self.arms}
+        self.gains = {arm: 0.0 for arm in self.arms}
+        self.rng = random.Random(seed)
+
+    def choose(self, num_routes):
+        arms = [a for a in self.arms if a[0] != "routes" or a[1] <= num_routes]
+        weights = [self.scores[a] + MIN_WEIGHT for a in arms]
+        return self.rng.choices(arms, weights=weights)[0]
+
+    def update(self, arm, gain, seconds):
+        rate = gain / max(seconds, 1e-3)
+        self.scores[arm] = (1 - SCORE_DECAY) * self.scores[arm] + SCORE_DECAY * rate
+        self.calls[arm] += 1
+        self.gains[arm] += gain
+
+    def summary(self):
+        """腕ごとの呼び出し回数・改善量の合計（表示用）"""
+        return {f"{kind}{'' if k is None else k}": (self.calls[(kind, k)], round(self.gains[(kind, k)], 2))
+                for kind, k in self.arms if self.calls[(kind, k)]}
+
+
+def _centroid(route, id_to_node):
+    tasks = route[1:-1] or route[:1]
+    return (sum(id_to_node[n]['x'] for n in tasks) / len(tasks),
+            sum(id_to_node[n]['y'] for n in tasks) / len(tasks))
+
+
+def related_route_group(routes, k, id_to_node, rng):
+    """空でないルートを1本選び、重心が近い順に k 台ぶんの車両 index を返す"""
+    busy = [v for v, r in enumerate(routes) if len(r) > 2]
+    if not busy:
+        return []
+    seed = rng.choice(busy)
+    cx, cy = _centroid(routes[seed], id_to_node)
+    others = sorted((v for v in range(len(routes)) if v != seed),
+                    key=lambda v: math.hypot(_centroid(routes[v], id_to_node)[0] - cx,
+                                             _centroid(routes[v], id_to_node)[1] - cy))
+    return [seed] + others[:k - 1]
+
+
+def reoptimize_route_group(routes, group, customers, PD_pairs, vehicle_capacity, time_limit, cost_cache=None):
+    """
+    group の車両をまとめた k 台の部分問題を、元のルートを初期解・元の総距離を上限として time_limit 秒で解く。
+    改善した場合は置き換えた全ルートを、しなければ None を返す。
+    """
+    group_routes = [routes[v] for v in group]
+    node_ids = set()
+    for r in group_routes:
+        node_ids.update(r)
+    sub_customers = [c for c in customers if c['id'] in node_ids]
+    sub_PD_pairs = related_pd_pairs([n for r in group_routes for n in r], PD_pairs)
+    depots = [r[0] for r in group_routes]
+    old_cost = sum(cached_route_cost(r, customers, cost_cache) for r in group_routes)
+
+    new_routes = solve_vrp_flexible(
+        sub_customers, [r[1:-1] for r in group_routes], sub_PD_pairs,
+        num_vehicles=len(group), vehicle_capacity=vehicle_capacity,
+        start_depots=depots, end_depots=depots,
+        use_capacity=True, use_time=True, use_pickup_delivery=True, isGAT=True, phase="lns",
+        search_options={"time_limit": time_limit}, cost_upper_bound=old_cost
+    )
+    if new_routes is None:
+        return None
+    if sum(cached_route_cost(r, customers, cost_cache) for r in new_routes) + 1e-9 >= old_cost:
+        return None
+    out = list(routes)
+    for v, r in zip(group, new_routes):
+        out[v] = r
+    return out
+
+
+def remove_and_reinsert(routes, PD_pairs, id_to_node, vehicle_capacity, num_requests, rng):
+    """
+    近い PD 要求を num_requests 件抜き（Shaw 除去）、最安実行可能挿入で入れ直す。
+    全件入り、総距離が下がった場合だけ新しいルートを返す（ソルバーは呼ばない）。
+    """
+    routed = {n for r in routes for n in r[1:-1]}
+    requests = [(p, d) for p, d in PD_pairs.items() if p in routed and d in routed]
+    if not requests:
+        return None
+
+    def midpoint(pd):
+        p, d = id_to_node[pd[0]], id_to_node[pd[1]]
+        return ((p['x'] + d['x']) / 2.0, (p['y'] + d['y']) / 2.0)
+
+    seed = rng.choice(requests)
+    sx, sy = midpoint(seed)
+    removed = sorted(requests, key=lambda pd: math.hypot(midpoint(pd)[0] - sx, midpoint(pd)[1] - sy))[:num_requests]
+    removed_ids = {n for pd in removed for n in pd}
+    partial = [[r[0]] + [n for n in r[1:-1] if n not in removed_ids] + [r[-1]] if len(r) >= 2 else list(r)
+               for r in routes]
+    new_routes, unrouted = insert_pd_pairs(partial, removed, id_to_node, vehicle_capacity)
+    if unrouted:
+        return None
+    old_cost = sum(route_length(r, id_to_node) for r in routes)
+    if sum(route_length(r, id_to_node) for r in new_routes) + 1e-9 >= old_cost:
+        return None
+    return new_routes
+
+
+def perform_lns(original_routes, customers, PD_pairs, vehicle_capacity, deadline, state=None,
+                subproblem_time_limit=1.0, max_iterations=None, stall_limit=50, removal_size=None, cost_cache=None):
+    """
+    社内LNS：1反復ごとに腕（k 台まとめて再最適化 / PD 要求の除去と再挿入）を選んで適用し、改善したら即時確定する。
+    - deadline（time.time() 基準）まで、または stall_limit 回続けて改善が無くなるまで繰り返す
+    - 各腕の改善量/秒に応じて次の腕（k）を選び直す（state に蓄積、ラウンドをまたいで使う）
+    - 決定的モードでは deadline を使わず max_iterations（既定 DETERMINISTIC_ITERATIONS）で区切り、腕は改善量/反復で評価する
+    戻り値: (新しいルート, 反復回数, state)
+    """
+    if state is None:
+        state = LNSState()
+    routes = [list(r) for r in original_routes]
+    id_to_node = {c['id']: c for c in customers}
+    if removal_size is None:
+        removal_size = max(2, len(PD_pairs) // 10)
+
+    deterministic = deterministic_enabled()
+    if deterministic:
+        deadline = None
+        if max_iterations is None:
+            max_iterations = DETERMINISTIC_ITERATIONS
+
+    iterations = 0
+    stall = 0
+    while (deadline is None or time.time() < deadline) and stall < stall_limit:
+        if max_iterations is not None and iterations >= max_iterations:
+            break
+        arm = state.choose(len(routes))
+        start = time.perf_counter()
+        before = sum(cached_route_cost(r, customers, cost_cache) for r in routes)
+        if arm[0] == "routes":
+            group = related_route_group(routes, arm[1], id_to_node, state.rng)
+            limit = subproblem_time_limit if deadline is None else max(0.05, min(subproblem_time_limit, deadline - time.time()))
+            new_routes = reoptimize_route_group(routes, group, customers, PD_pairs, vehicle_capacity, limit,
+                                                cost_cache) if group else None
+        else:
+            new_routes = remove_and_reinsert(routes, PD_pairs, id_to_node, vehicle_capacity,
+                                             state.rng.randint(2, removal_size), state.rng)
+        gain = 0.0
+        if new_routes is not None:
+            gain = before - sum(cached_route_cost(r, customers, cost_cache) for r in new_routes)
+            routes = new_routes
+        state.update(arm, gain, 1.0 if deterministic else time.perf_counter() - start)
+        stall = 0 if gain > 0 else stall + 1
+        iterations += 1
+
+    return routes, iterations, state
@@ -0,0 +1,97 @@
+import argparse
+import os
+import random
+import tempfile
+from tabulate import tabulate
+from flexible_vrp_solver import solve_vrp_flexible, route_cost, node_arrays
+from gat import related_pd_pairs
+from parser import parse_lilim
+from solver_telemetry import enable_telemetry, disable_telemetry, load_events, summarize_events
+
+MODELS = ("standard", "lean")
+
+
+def solve_instance(data, model, time_limit, arrays=None):
+    """1インスタンス全体を1社として解く（初期解と同じ設定）。arrays は前計算済みの node_arrays"""
+    depot = data['depot_id']
+    return solve_vrp_flexible(
+        data['customers'], None, list(data['PD_pairs'].items()), num_vehicles=data['num_vehicles'],
+        vehicle_capacity=data['vehicle_capacity'], start_depots=[depot] * data['num_vehicles'],
+        end_depots=[depot] * data['num_vehicles'], use_capacity=True, use_time=True, use_pickup_delivery=True,
+        isGAT=False, phase=f"instance/{model}", search_options={"time_limit": time_limit}, model=model,
+        arrays=arrays
+    )
+
+
+def solve_pair(data, route_i, route_j, model):
+    """GAT と同じ2車両部分問題（元のルートから warm-start）"""
+    node_ids = set(route_i) | set(route_j)
+    sub_customers = [c for c in data['customers'] if c['id'] in node_ids]
+    return solve_vrp_flexible(
+        sub_customers, [route_i[1:-1], route_j[1:-1]], related_pd_pairs(route_i + route_j, data['PD_pairs']),
+        num_vehicles=2, vehicle_capacity=data['vehicle_capacity'], start_depots=[route_i[0], route_j[0]],
+        end_depots=[route_i[-1], route_j[-1]], use_capacity=True, use_time=True, use_pickup_delivery=True,
+        isGAT=True, phase=f"pair/{model}", model=model
+    )
+
+
+def run_benchmark(paths, time_limit, num_pairs, seed):
+    """
+    Li & Lim の各インスタンスで standard / lean を比較する。
+      instance/<model> … インスタンス全体を time_limit 秒で解く
+      pair/<model>     … standard の解から選んだ車両ペア num_pairs 組を2車両部分問題として解く
+    build / solve 時間は solve_vrp_flexible の telemetry から、コストは route_cost の総距離で集計する。
+    """
+    events_path = os.path.join(tempfile.mkdtemp(prefix="model_benchmark_"), "events.jsonl")
+    enable_telemetry(events_path, reset=True)
+    costs = {}
+    rng = random.Random(seed)
+    try:
+        for path in paths:
+            data = parse_lilim(path)
+            print(f">>> {os.path.basename(path)}: {len(data['customers'])}ノード / {data['num_vehicles']}台")
+            base_routes = None
+            arrays = node_arrays(data['customers'])  # 両モデルで使い回す
+            for model in MODELS:
+                routes = solve_instance(data, model, time_limit, arrays)
+                if model == "standard":
+                    base_routes = routes
+                if routes is not None:
+                    costs.setdefault(f"instance/{model}", []).append(
+                        sum(route_cost(r, data['customers']) for r in routes))
+            if base_routes is None:
+                continue
+            busy = [r for r in base_routes if len(r) > 2]
+            pairs = [(a, b) for a in range(len(busy)) for b in range(a + 1, len(busy))]
+            for a, b in rng.sample(pairs, min(num_pairs, len(pairs))):
+                for model in MODELS:
+                    routes = solve_pair(data, busy[a], busy[b], model)
+                    if routes is not None:
+                        costs.setdefault(f"pair/{model}", []).append(
+                            sum(route_cost(r, data['customers']) for r in routes))
+    finally:
+        disable_telemetry()
+
+    rows = summarize_events(load_events(events_path))
+    for row in rows:
+        values = costs.get(row["phase"], [])
+        row["cost_total"] = sum(values)
+        del row["warm_start"], row["share(%)"]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="solve_vrp_flexible の standard / lean モデルの構築・求解時間と解の比較")
+    parser.add_argument("files", nargs="*", default=["data/LC1_2_2.txt", "data/LR1_2_3.txt"],
+                        help="Li & Lim 形式のインスタンス（既定は LC1_2_2 / LR1_2_3）")
+    parser.add_argument("--time-limit", type=float, default=30.0, help="インスタンス全体を解くときの秒数")
+    parser.add_argument("--pairs", type=int, default=30, help="インスタンスごとに解く2車両部分問題の数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = run_benchmark(args.files, args.time_limit, args.pairs, args.seed)
+    print(tabulate(rows, headers="keys", floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import math
+import random
+import time
+from flexible_vrp_solver import solve_vrp_flexible, route_cost
+from gat import related_pd_pairs
+from route_insertion import cheapest_pd_insertion, route_length
+
+# 新しいノードの既定値（add_request で省略されたとき）
+DEFAULT_SERVICE = 0
+
+
+class OnlineRouter:
+    """
+    計画済みのルートに、後から届く PD 要求を1件ずつ差し込む（全体を解き直さない）。
+
+      router = OnlineRouter(customers, routes, PD_pairs, vehicle_num_list, depot_id_list, vehicle_capacity)
+      result = router.add_request({"x": .., "y": .., "demand": 10, "ready": .., "due": ..},
+                                  {"x": .., "y": .., "ready": .., "due": ..})
+
+    - 全社・全車両の中から最安実行可能挿入の位置を選ぶ（company を指定するとその会社の車両だけ）
+    - repair=True なら、挿入した車両と重心が近い同じ会社の車両 repair_vehicles-1 台を
+      solve_vrp_flexible（元のルートから warm-start・元の総距離を上限）で短時間だけ解き直す
+    - どこにも入らない要求は pending に残す（retry_pending で入れ直せる）
+    routes / customers / PD_pairs はその場で更新されるので、export_vrp_state 等にそのまま渡せる。
+    """
+
+    def __init__(self, customers, routes, PD_pairs, vehicle_num_list, depot_id_list, vehicle_capacity,
+                 repair=False, repair_vehicles=2, repair_time_limit=0.2):
+        self.customers = customers
+        self.routes = [list(r) for r in routes]
+        self.PD_pairs = PD_pairs
+        self.depot_id_list = depot_id_list
+        self.vehicle_num_list = vehicle_num_list
+        self.vehicle_capacity = vehicle_capacity
+        self.repair = repair
+        self.repair_vehicles = repair_vehicles
+        self.repair_time_limit = repair_time_limit
+        self.id_to_node = {c['id']: c for c in customers}
+        self.vehicle_company = [comp for comp, n in enumerate(vehicle_num_list) for _ in range(n)]
+        self.next_id = max(self.id_to_node) + 1
+        self.pending = []
+
+    def _new_node(self, spec, demand, pickup_index, delivery_index):
+        node = {
+            'id': self.next_id,
+            'x': float(spec['x']),
+            'y': float(spec['y']),
+            'demand': demand,
+            'ready': int(spec.get('ready', 0)),
+            'due': int(spec.get('due', self.id_to_node[self.depot_id_list[0]]['due'])),
+            'service': int(spec.get('service', DEFAULT_SERVICE)),
+            'pickup_index': pickup_index,
+            'delivery_index': delivery_index,
+        }
+        self.next_id += 1
+        self.customers.append(node)
+        self.id_to_node[node['id']] = node
+        return node
+
+    def add_request(self, pickup, delivery, company=None, repair=None):
+        """
+        PD 要求1件を登録して差し込む。pickup / delivery は x, y, ready, due, service（demand は pickup 側）を持つ dict。
+        戻り値: {'pickup_id', 'delivery_id', 'vehicle', 'company', 'delta', 'repaired', 'seconds'}
+                （挿入できなければ vehicle=None で、要求は pending に残る）
+        """
+        start = time.perf_counter()
+        demand = int(pickup.get('demand', delivery.get('demand', 0)))
+        p = self._new_node(pickup, abs(demand), 0, 0)
+        d = self._new_node(delivery, -abs(demand), p['id'], 0)
+        p['delivery_index'] = d['id']
+        self.PD_pairs[p['id']] = d['id']
+        result = self.insert_pair(p['id'], d['id'], company, repair)
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    def insert_pair(self, pickup_id, delivery_id, company=None, repair=None):
+        """登録済みの PD ペアを最安実行可能挿入で差し込む（add_request / retry_pending から呼ぶ）"""
+        best = None
+        for v, route in enumerate(self.routes):
+            if company is not None and self.vehicle_company[v] != company:
+                continue
+            ins = cheapest_pd_insertion(route, pickup_id, delivery_id, self.id_to_node, self.vehicle_capacity)
+            if ins is not None and (best is None or ins[0] < best[0]):
+                best = (ins[0], v, ins[1])
+        result = {'pickup_id': pickup_id, 'delivery_id': delivery_id, 'vehicle': None, 'company': None,
+                  'delta': None, 'repaired': False}
+        if best is None:
+            self.pending.append((pickup_id, delivery_id, company))
+            return result
+        delta, v, new_route = best
+        self.routes[v] = new_route
+        result.update(vehicle=v, company=self.vehicle_company[v], delta=delta)
+        if self.repair if repair is None else repair:
+            gain = self.repair_around(v)
+            if gain > 0:
+                result.update(repaired=True, delta=delta - gain)
+        return result
+
+    def retry_pending(self):
+        """pending の要求をもう一度差し込む（ルートが変わって空きができた後など）。入った件数を返す"""
+        pending, self.pending = self.pending, []
+        return sum(1 for p, d, comp in pending if self.insert_pair(p, d, comp)['vehicle'] is not None)
+
+    def _nearby_vehicles(self, v):
+        """v と同じ会社の車両を、タスクの重心が近い順に repair_vehicles 台（v を含む）"""
+        def centroid(route):
+            tasks = route[1:-1] or route[:1]
+            return (sum(self.id_to_node[n]['x'] for n in tasks) / len(tasks),
+                    sum(self.id_to_node[n]['y'] for n in tasks) / len(tasks))
+        cx, cy = centroid(self.routes[v])
+        same = [u for u in range(len(self.routes)) if u != v and self.vehicle_company[u] == self.vehicle_company[v]]
+        same.sort(key=lambda u: math.hypot(centroid(self.routes[u])[0] - cx, centroid(self.routes[u])[1] - cy))
+        return [v] + same[:self.repair_vehicles - 1]
+
+    def repair_around(self, v):
+        """挿入した車両の周辺を小さな部分問題として解き直し、改善したら置き換える。改善量を返す"""
+        group = self._nearby_vehicles(v)
+        group_routes = [self.routes[u] for u in group]
+        node_ids = {n for r in group_routes for n in r}
+        sub_customers = [self.id_to_node[n] for n in sorted(node_ids)]
+        old_cost = sum(route_cost(r, sub_customers) for r in group_routes)
+        new_routes = solve_vrp_flexible(
+            sub_customers, [r[1:-1] for r in group_routes],
+            related_pd_pairs([n for r in group_routes for n in r], self.PD_pairs),
+            num_vehicles=len(group), vehicle_capacity=self.vehicle_capacity,
+            start_depots=[r[0] for r in group_routes], end_depots=[r[-1] for r in group_routes],
+            use_capacity=True, use_time=True, use_pickup_delivery=True, isGAT=True, phase="online",
+            search_options={"time_limit": self.repair_time_limit}, cost_upper_bound=old_cost
+        )
+        if new_routes is None:
+            return 0.0
+        gain = old_cost - sum(route_cost(r, sub_customers) for r in new_routes)
+        if gain <= 1e-9:
+            return 0.0
+        for u, r in zip(group, new_routes):
+            self.routes[u] = r
+        return gain
+
+    def total_cost(self):
+        return sum(route_length(r, self.id_to_node) for r in self.routes)
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+
+def main():
+    """合成インスタンスの一部の要求を後から届くものとして差し込み、1件あたりの時間を計る"""
+    from gat import initialize_individual_vrps
+    from instance_generator import compose_case
+
+    parser = argparse.ArgumentParser(description="計画済みルートへの PD 要求のオンライン挿入（1件あたりの時間を計測）")
+    parser.add_argument("--lsps", type=int, default=3)
+    parser.add_argument("--pairs", type=int, default=30, help="1社あたりの PD ペア数")
+    parser.add_argument("--online-ratio", type=float, default=0.3, help="後から届く要求の割合")
+    parser.add_argument("--repair", action="store_true", help="挿入後に周辺の車両を解き直す")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    case = compose_case([{"num_pairs": args.pairs} for _ in range(args.lsps)], spacing=50, seed=args.seed)
+    rng = random.Random(args.seed)
+    pairs = list(case['PD_pairs'].items())
+    online = set(rng.sample(pairs, int(len(pairs) * args.online_ratio)))
+    online_ids = {n for pd in online for n in pd}
+    id_to_node = {c['id']: c for c in case['customers']}
+    static_customers = [c for c in case['customers'] if c['id'] not in online_ids]
+    static_pairs = {p: d for p, d in pairs if (p, d) not in online}
+
+    start = time.perf_counter()
+    routes = initialize_individual_vrps(static_customers, static_pairs, args.lsps, case['vehicle_num_list'],
+                                        case['depot_id_list'], case['vehicle_capacity'])
+    print(f"初期計画（{len(static_pairs)}件）: {time.perf_counter() - start:.2f}s")
+
+    router = OnlineRouter(list(static_customers), routes, dict(static_pairs), case['vehicle_num_list'],
+                          case['depot_id_list'], case['vehicle_capacity'], repair=args.repair)
+    latencies = []
+    for p, d in sorted(online, key=lambda pd: id_to_node[pd[0]]['ready']):
+        result = router.add_request(id_to_node[p], id_to_node[d])
+        latencies.append(result['seconds'])
+    inserted = len(online) - len(router.pending)
+    print(f"オンライン挿入 {inserted}/{len(online)}件: p50 {_quantile(latencies, 0.5) * 1000:.1f}ms / "
+          f"p95 {_quantile(latencies, 0.95) * 1000:.1f}ms / 最大 {max(latencies) * 1000:.1f}ms")
+    print(f"総距離: {router.total_cost():.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import os
+import time
+import secrets
+import queue
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import Process, AuthenticationError
+from multiprocessing.connection import Listener, Client
+from gat import pair_task_node_ids, run_pair_task
+from shared_instance import SharedInstance
+from pair_worker import is_loopback, serve
+from solver_metrics import solve_started, solve_finished, workers_changed, batch_finished
+
+logger = logging.getLogger(__name__)
+
+# ワーカープロセス内で attach した共有インスタンス（initializer で設定）
+_worker_instance = None
+
+
+def _attach_worker(spec):
+    global _worker_instance
+    _worker_instance = SharedInstance.attach(spec)
+
+
+def _run_shared_task(task):
+    """ワーカー側：ノードIDから共有メモリ上のデータで部分問題を組み立てて解く。(候補, 所要秒数) を返す"""
+    start = time.perf_counter()
+    node_ids = pair_task_node_ids(task)
+    candidates = run_pair_task(
+        task,
+        _worker_instance.customers_for(node_ids),
+        arrays=_worker_instance.node_arrays(node_ids),
+    )
+    return candidates, time.perf_counter() - start
+
+
+class SerialPairExecutor:
+    """同一プロセスで順に解く（既定の動作と同じ。比較・デバッグ用）"""
+
+    num_workers = 1
+
+    def map_pairs(self, tasks, customers):
+        return [run_pair_task(t, customers) for t in tasks]
+
+    def close(self):
+        pass
+
+
+class SharedMemoryPairExecutor:
+    """
+    2車両部分問題をプロセスプールで並列に解く。
+    インスタンスデータは SharedInstance としてケースごとに1回だけ公開し、
+    各タスクで送るのはルート（ノードIDのリスト）と PD ペアだけにする。
+    """
+
+    def __init__(self, shared_instance, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_attach_worker,
+            initargs=(shared_instance.spec,),
+        )
+        workers_changed("process_pool", self.max_workers)
+
+    @property
+    def num_workers(self):
+        """同時に解ける部分問題の数（anytime GAT のバッチの大きさに使う）"""
+        return self.max_workers
+
+    def map_pairs(self, tasks, customers=None):
+        # 結果はタスクの順で返る（完了順に依存しない）
+        # [metrics] ワーカー内の solve は親のレジストリに届かないので、タスク単位の時間をここで記録する。
+        # 投入はワーカー数までに絞り、solve_started は投入時・solve_finished は完了時に呼ぶ
+        # （一括で投入すると in-flight がキュー待ちのタスクまで数えてバッチサイズに跳ねるため）
+        start = time.perf_counter()
+        results = [None] * len(tasks)
+        pending = {}
+        next_index = 0
+        busy = 0.0
+        while next_index < len(tasks) or pending:
+            while next_index < len(tasks) and len(pending) < self.max_workers:
+                task = tasks[next_index]
+                solve_started(task['phase'])
+                pending[self.pool.submit(_run_shared_task, task)] = next_index
+                next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                candidates, seconds = future.result()
+                solve_finished(tasks[index]['phase'], seconds)
+                busy += seconds
+                results[index] = candidates
+        batch_finished("process_pool", self.max_workers, busy, time.perf_counter() - start)
+        return results
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+class WorkQueuePairExecutor:
+    """
+    2車両部分問題をソケット越しのワーカー（pair_worker.py）に配るワークキュー。
+    複数ホストのワーカーが address に接続してタスクを1件ずつ取りに来る（pull 型なので速いワーカーほど多く解く）。
+
+    - ノード表はワーカーごとに1回だけ送る（publish で更新されたときのみ再送）。タスクはルートとPDペアだけ
+    - ワーカーの切断・タイムアウト・例外ではタスクを再キューし、max_retries を超えたら手元で解く
+    - ワーカーが1台も居ない状態が idle_timeout 秒続いた場合も残りを手元で解く
+    - 結果はタスクの順で返す（どのワーカーがどの順で解いたかに依存しない）
+    - local_workers > 0 なら同じマシンにワーカープロセスを起動する（1台での動作確認・小規模運用用）
+    - タスク・結果は pickle でやり取りするので authkey は必須。省略時はループバックでのみ待ち受け、
+      ランダムな鍵を生成する（generated_authkey=True。ワーカーにはその鍵を渡す）
+    """
+
+    def __init__(self, address=("127.0.0.1", 0), authkey=None, local_workers=0,
+                 max_retries=2, task_timeout=300.0, idle_timeout=30.0):
+        self.generated_authkey = not authkey
+        if not authkey:
+            if not is_loopback(address[0]):
+                raise ValueError(f"{address[0]} で待ち受けるには認証鍵（VRP_PAIR_QUEUE_AUTHKEY / --pair-queue-authkey）の指定が必要です")
+            authkey = secrets.token_hex(16)
+        if isinstance(authkey, str):
+            authkey = authkey.encode()
+        self.authkey = authkey
+        self.max_retries = max_retries
+        self.task_timeout = task_timeout
+        self.idle_timeout = idle_timeout
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+
+        self._cond = threading.Condition()
+        self._queue = queue.Queue()   # 配布待ちのタスク番号（None はワーカー停止の合図）
+        self._pending = {}            # 番号 → タスク（未完了のもの）
+        self._results = {}            # 番号 → 結果
+        self._attempts = {}           # 番号 → 失敗回数
+        self._local = []              # 手元で解くことにしたタスク番号
+        self._next_seq = 0
+        self._version = 0
+        self._id_to_customer = {}
+        self._instance = []
+        self._num_workers = 0
+        self._busy_seconds = 0.0      # リモートワーカーが部分問題に費やした時間の累計（metrics 用）
+        self._closed = False
+
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+        self._local_procs = [Process(target=serve, args=(self.address, authkey), daemon=True)
+                             for _ in range(local_workers)]
+        for p in self._local_procs:
+            p.start()
+
+    # === ワーカー接続の管理 ===
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                logger.warning("認証に失敗した接続を拒否しました")
+                continue
+            except OSError:
+                break
+            if self._closed:
+                conn.close()
+                break
+            threading.Thread(target=self._serve_worker, args=(conn,), daemon=True).start()
+
+    def _serve_worker(self, conn):
+        """1ワーカー分の送受信ループ（タスクを1件送って結果を待つ、を繰り返す）"""
+        sent_version = -1
+        with self._cond:
+            self._num_workers += 1
+            workers_changed("work_queue", self._num_workers)
+        try:
+            while True:
+                seq = self._queue.get()
+                if seq is None:
+                    conn.send(("stop",))
+                    break
+                with self._cond:
+                    task = self._pending.get(seq)
+                    version, instance = self._version, self._instance
+                if task is None:
+                    continue  # 他のワーカー／手元で解き終えた
+                start = time.perf_counter()
+                solve_started(task['phase'])
+                try:
+                    if sent_version != version:
+                        conn.send(("instance", version, instance))
+                        sent_version = version
+                    conn.send(("task", seq, task))
+                    if not conn.poll(self.task_timeout):
+                        raise TimeoutError(f"{self.task_timeout} 秒以内に応答がありません")
+                    kind, _, payload = conn.recv()
+                except (EOFError, OSError, TimeoutError) as e:
+                    solve_finished(task['phase'], time.perf_counter() - start, ok=False)
+                    self._retry(seq, f"ワーカーを切り離しました: {e}")
+                    break
+                seconds = time.perf_counter() - start
+                solve_finished(task['phase'], seconds, ok=kind == "result")
+                with self._cond:
+                    self._busy_seconds += seconds
+                if kind == "result":
+                    self._complete(seq, payload)
+                else:
+                    self._retry(seq, payload)
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            with self._cond:
+                self._num_workers -= 1
+                workers_changed("work_queue", self._num_workers)
+                self._cond.notify_all()
+
+    def _complete(self, seq, result):
+        with self._cond:
+            if seq in self._pending:
+                del self._pending[seq]
+                self._results[seq] = result
+                self._cond.notify_all()
+
+    def _retry(self, seq, reason):
+        with self._cond:
+            if seq not in self._pending:
+                return
+            self._attempts[seq] = self._attempts.get(seq, 0) + 1
+            logger.warning(f"タスク {seq} の失敗 {self._attempts[seq]} 回目: {reason}")
+            if self._attempts[seq] > self.max_retries:
+                self._local.append(seq)
+                self._cond.notify_all()
+                return
+        self._queue.put(seq)
+
+    def _solve_locally(self, seq):
+        with self._cond:
+            task = self._pending.get(seq)
+        if task is not None:
+            customers = [self._id_to_customer[nid] for nid in pair_task_node_ids(task)]
+            self._complete(seq, run_pair_task(task, customers))
+
+    # === 公開インターフェース ===
+    @property
+    def num_workers(self):
+        """接続中のワーカー数（未接続なら 0。手元で解くときは1件ずつになる）"""
+        with self._cond:
+            return self._num_workers
+
+    def publish(self, customers):
+        """ワーカーへ送るノード表を更新する（次のタスク送信時に各ワーカーへ1回だけ送られる）"""
+        with self._cond:
+            self._id_to_customer.update({c['id']: c for c in customers})
+            self._instance = list(self._id_to_customer.values())
+            self._version += 1
+
+    def map_pairs(self, tasks, customers=None):
+        if customers is not None and any(c['id'] not in self._id_to_customer for c in customers):
+            self.publish(customers)
+        start = time.perf_counter()
+        with self._cond:
+            busy_before = self._busy_seconds
+            seqs = list(range(self._next_seq, self._next_seq + len(tasks)))
+            self._next_seq += len(tasks)
+            for seq, task in zip(seqs, tasks):
+                self._pending[seq] = task
+        for seq in seqs:
+            self._queue.put(seq)
+
+        idle_since = None
+        while True:
+            with self._cond:
+                if all(seq in self._results for seq in seqs):
+                    break
+                local, self._local = self._local, []
+                if not local:
+                    if self._num_workers == 0:
+                        idle_since = idle_since or time.time()
+                        if time.time() - idle_since >= self.idle_timeout:
+                            logger.warning("接続中のワーカーが無いため、残りのタスクを手元で解きます")
+                            local = [seq for seq in seqs if seq in self._pending]
+                    else:
+                        idle_since = None
+                    if not local:
+                        self._cond.wait(timeout=1.0)
+            for seq in local:
+                self._solve_locally(seq)
+
+        with self._cond:
+            results = [self._results.pop(seq) for seq in seqs]
+            for seq in seqs:
+                self._attempts.pop(seq, None)
+            busy, num_workers = self._busy_seconds - busy_before, self._num_workers
+        batch_finished("work_queue", num_workers, busy, time.perf_counter() - start)
+        return results
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            num_workers = self._num_workers
+        for _ in range(num_workers):
+            self._queue.put(None)
+        # accept() で待っているスレッドを起こしてから閉じる
+        host, port = self.address
+        try:
+            Client(("127.0.0.1" if host in ("0.0.0.0", "") else host, port), authkey=self.authkey).close()
+        except (OSError, AuthenticationError):
+            pass
+        self.listener.close()
+        self._accept_thread.join(timeout=5)
+        for p in self._local_procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
@@ -0,0 +1,105 @@
+import argparse
+import ipaddress
+import logging
+import os
+import time
+import traceback
+from multiprocessing.connection import Client
+from gat import pair_task_node_ids, run_pair_task
+
+logger = logging.getLogger(__name__)
+
+
+
+def parse_address(text):
+    """"host:port" → (host, port)"""
+    host, _, port = text.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def is_loopback(host):
+    """host がループバック（同じマシンからしか接続できない）アドレスか"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _connect(address, authkey, connect_timeout):
+    """コーディネータが起動するまで待ちながら接続する"""
+    deadline = time.time() + connect_timeout
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except (ConnectionRefusedError, OSError):
+            if time.time() >= deadline:
+                raise
+            time.sleep(0.5)
+
+
+def serve(address, authkey, connect_timeout=60.0):
+    """
+    WorkQueuePairExecutor（pair_executor.py）に接続し、2車両部分問題を受け取っては解いて返す。
+    メッセージ（pickle されたタプル）:
+      受信 ("instance", version, customers) … ノード表の差し替え（ケースごとに1回）
+      受信 ("task", seq, task)              … pair_task を解いて ("result", seq, 候補リスト) を返す
+      受信 ("stop",)                        … 終了
+    解けなかった場合は ("error", seq, トレースバック文字列) を返す（コーディネータ側で再試行）。
+    authkey はコーディネータと同じ鍵（pickle を受け取るので、鍵を知る相手としか接続しない）。
+    """
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    conn = _connect(address, authkey, connect_timeout)
+    id_to_customer = {}
+    logger.info(f"pair worker {os.getpid()} が {address} に接続しました")
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                break
+            kind = msg[0]
+            if kind == "stop":
+                break
+            if kind == "instance":
+                id_to_customer = {c['id']: c for c in msg[2]}
+                continue
+            if kind == "task":
+                _, seq, task = msg
+                try:
+                    customers = [id_to_customer[nid] for nid in pair_task_node_ids(task)]
+                    conn.send(("result", seq, run_pair_task(task, customers)))
+                except Exception:
+                    conn.send(("error", seq, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="2車両部分問題のリモートワーカー（WorkQueuePairExecutor に接続）")
+    parser.add_argument("--connect", required=True, help="コーディネータのアドレス host:port")
+    parser.add_argument("--authkey", default=os.getenv("VRP_PAIR_QUEUE_AUTHKEY"),
+                        help="コーディネータの認証鍵（既定は環境変数 VRP_PAIR_QUEUE_AUTHKEY。必須）")
+    parser.add_argument("--processes", type=int, default=1, help="このホストで起動するワーカー数")
+    parser.add_argument("--connect-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error("--authkey または VRP_PAIR_QUEUE_AUTHKEY で、コーディネータが表示した認証鍵を指定してください")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    address = parse_address(args.connect)
+    if args.processes <= 1:
+        serve(address, args.authkey, args.connect_timeout)
+        return
+    from multiprocessing import Process
+    procs = [Process(target=serve, args=(address, args.authkey, args.connect_timeout)) for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
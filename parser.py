@@ -1,14 +1,20 @@
-def parse_lilim200(filepath, x_offset=0, y_offset=0, id_offset=0, time_offset=0):
+def parse_lilim(filepath, x_offset=0, y_offset=0, id_offset=0, time_offset=0):
+    """
+    Li & Lim 形式の PDPTW インスタンス（100 / 200 / 400 / 600 / 800 / 1000 タスク版共通）を読み込む。
+    - 1行目: 車両数 容量 [速度]
+    - 2行目以降: id x y demand ready due service pickup_index delivery_index（空白・タブ区切り）
+    - デポは pickup/delivery の参照を持たない demand=0 のノード（通常は id=0 の先頭行）
+    """
     customers = []
     P_to_D = {}
 
     with open(filepath, 'r') as f:
-        lines = f.readlines()
+        lines = [line for line in f if line.strip()]
 
     # 1行目から車両数・容量を読み取る
     header_parts = lines[0].strip().split()
     num_vehicles = int(header_parts[0])
-    vehicle_capacity = int(header_parts[1])
+    vehicle_capacity = int(float(header_parts[1]))
 
     # 2行目以降のノード情報を処理
     for line in lines[1:]:
@@ -19,10 +25,10 @@ def parse_lilim200(filepath, x_offset=0, y_offset=0, id_offset=0, time_offset=0)
         cust_id = int(parts[0]) + id_offset
         x = float(parts[1]) + x_offset
         y = float(parts[2]) + y_offset
-        demand = int(parts[3])
-        ready = int(parts[4]) + time_offset
-        due = int(parts[5]) + time_offset
-        service = int(parts[6])
+        demand = int(float(parts[3]))
+        ready = int(float(parts[4])) + time_offset
+        due = int(float(parts[5])) + time_offset
+        service = int(float(parts[6]))
         if int(parts[7]) > 0:
             pickup_index = int(parts[7]) + id_offset
         else:
@@ -49,11 +55,27 @@ def parse_lilim200(filepath, x_offset=0, y_offset=0, id_offset=0, time_offset=0)
         if demand > 0 and delivery_index > 0:
             P_to_D[cust_id] = delivery_index
 
+    # 参照先が存在しないペアは、残った片側のノードごと落とす（切り詰めたファイル等への保険）。
+    # 以降の処理はデポ以外の全ノードがどれかのペアに属している前提
+    node_ids = {c['id'] for c in customers}
+    P_to_D = {p: d for p, d in P_to_D.items() if d in node_ids}
+    paired = set(P_to_D) | set(P_to_D.values())
+    customers = [c for c in customers
+                 if c['id'] in paired or (c['pickup_index'] == 0 and c['delivery_index'] == 0)]
+
+    depot = next((c for c in customers
+                  if c['demand'] == 0 and c['pickup_index'] == 0 and c['delivery_index'] == 0), customers[0])
+
     return {
         'customers': customers,
         'PD_pairs': P_to_D,
         'num_vehicles': num_vehicles,
         'vehicle_capacity': vehicle_capacity,
-        'depot_id': customers[0]['id'],
-        'depot_coord': (customers[0]['x'], customers[0]['y'])
+        'depot_id': depot['id'],
+        'depot_coord': (depot['x'], depot['y'])
     }
+
+
+def parse_lilim200(filepath, x_offset=0, y_offset=0, id_offset=0, time_offset=0):
+    """200タスク版向けの従来名（parse_lilim と同じ）"""
+    return parse_lilim(filepath, x_offset=x_offset, y_offset=y_offset, id_offset=id_offset, time_offset=time_offset)
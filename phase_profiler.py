@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import tracemalloc
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# サンプリングの間隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+
+class _PhaseStats:
+    """1フェーズ分の集計。同じ名前のフェーズに何度入っても（export / plot など）同じ行に積み上げる"""
+
+    def __init__(self, name, mode):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_bytes = 0      # フェーズ中の tracemalloc ピーク（計測開始からの累積確保量）
+        self.net_bytes = 0       # フェーズ終了時 − 開始時 の確保量
+        self.profile = None
+        self.stacks = Counter()  # sample モード：折りたたみスタック → サンプル数
+        if mode == "cprofile":
+            import cProfile
+            self.profile = cProfile.Profile()
+
+
+class PhaseProfiler:
+    """
+    パイプラインのフェーズ（parse / initial / voronoi / gat_round_N / cross_round_N / export / plot）
+    ごとに CPU 時間・実時間・メモリのピークを計り、<root>/<instance>/ にファイルを書き出す。
+
+      mode="cprofile" … cProfile。<phase>.pstats（snakeviz / gprof2dot / pstats で読む）
+      mode="sample"   … メインスレッドのスタックを一定間隔で採取。<phase>.folded（flamegraph.pl / speedscope 用）
+      memory=True     … tracemalloc でフェーズ中のピークと純増を記録（実行はかなり遅くなり、wall / cpu も
+                        その分だけ膨らむ。時間を見るときは memory=False で別に計測する）
+
+    フェーズは入れ子にできる（GATラウンド中の export / plot など）。内側にいる間は外側の計測を止めるので、
+    外側の行には内側の時間は含まれない。子プロセス（gat_workers>1 やワークキューのワーカー）は対象外。
+
+        profiler = PhaseProfiler("profiles/LC1_2_2_LC1_2_6")
+        with profiler.phase("initial"):
+            ...
+        profiler.close()   # ファイルと summary.json を書き出し、集計行を返す
+    """
+
+    def __init__(self, output_dir, mode="cprofile", memory=False):
+        if mode not in ("cprofile", "sample"):
+            raise ValueError(f"PhaseProfiler: 不正な mode です: {mode}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.memory = memory
+        self.phases = OrderedDict()
+        self._stack = []         # [(_PhaseStats, wall開始, cpu開始, 確保量開始)]
+        self._started_tracemalloc = False
+        self._sampler = None
+        self._sampler_stop = threading.Event()
+        self._main_ident = threading.get_ident()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if mode == "sample":
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+            self._sampler.start()
+
+    # === 計測区間 ===
+    def _pause(self, stats):
+        if stats.profile is not None:
+            stats.profile.disable()
+        if self.memory:
+            stats.peak_bytes = max(stats.peak_bytes, tracemalloc.get_traced_memory()[1])
+
+    def _resume(self, stats):
+        if self.memory:
+            tracemalloc.reset_peak()
+        if stats.profile is not None:
+            stats.profile.enable()
+
+    @contextmanager
+    def phase(self, name):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = _PhaseStats(name, self.mode)
+        if self._stack:
+            self._pause(self._stack[-1][0])
+        current = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        self._stack.append((stats, time.perf_counter(), time.process_time(), current))
+        self._resume(stats)
+        try:
+            yield stats
+        finally:
+            self._pause(stats)
+            _, wall_start, cpu_start, mem_start = self._stack.pop()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            net = tracemalloc.get_traced_memory()[0] - mem_start if self.memory else 0
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.net_bytes += net
+            # 外側のフェーズには内側の時間・確保量を含めない（開始時刻と基準をずらす）
+            if self._stack:
+                outer, outer_wall, outer_cpu, outer_mem = self._stack[-1]
+                self._stack[-1] = (outer, outer_wall + wall, outer_cpu + cpu, outer_mem + net)
+                self._resume(outer)
+
+    # === sample モード ===
+    def _sample_loop(self):
+        while not self._sampler_stop.wait(SAMPLE_INTERVAL):
+            stack = self._stack[-1:]
+            if not stack:
+                continue
+            stats = stack[0][0]
+            frame = sys._current_frames().get(self._main_ident)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stats.stacks[";".join(reversed(names))] += 1
+
+    # === 出力 ===
+    def rows(self):
+        return [{
+            "phase": s.name,
+            "calls": s.calls,
+            "wall(s)": s.wall,
+            "cpu(s)": s.cpu,
+            "peak(MB)": s.peak_bytes / 1e6 if self.memory else None,
+            "net(MB)": s.net_bytes / 1e6 if self.memory else None,
+        } for s in self.phases.values()]
+
+    def close(self):
+        """計測を止め、フェーズごとのファイルと summary.json を書き出して集計行を返す"""
+        if self._sampler is not None:
+            self._sampler_stop.set()
+            self._sampler.join()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        os.makedirs(self.output_dir, exist_ok=True)
+        for stats in self.phases.values():
+            base = os.path.join(self.output_dir, stats.name)
+            if stats.profile is not None:
+                stats.profile.dump_stats(base + ".pstats")
+            if stats.stacks:
+                with open(base + ".folded", "w", encoding="utf-8") as f:
+                    for stack, count in stats.stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+        rows = self.rows()
+        with open(os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump({"mode": self.mode, "memory": self.memory, "phases": rows}, f, ensure_ascii=False, indent=2)
+        logger.info(f"📊 プロファイルを保存しました: {self.output_dir}")
+        return rows
+
+
+def format_profile(rows):
+    from tabulate import tabulate
+    return tabulate(rows, headers="keys", floatfmt=".3f")
@@ -0,0 +1,770 @@
+import os
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, fields
+from itertools import chain
+from checkpoint import checkpoint_path, checkpoint_matches, load_checkpoint, save_checkpoint, phase_rank, PHASES
+from instance_generator import load_case  # N社分のデータ読み込み・結合
+from solver_telemetry import enable_telemetry, disable_telemetry, summarize_telemetry, format_summary
+from solver_corpus import enable_recording, disable_recording
+from solver_metrics import round_finished, case_finished
+
+# ortools / matplotlib を読み込むモジュール（gat, voronoi_allocator, visualizer など）は、
+# import 時のコストを避けるため実際に使う関数の中で読み込む
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default) == "1"
+
+
+@dataclass
+class PipelineConfig:
+    """パイプラインの設定。既定値は従来の main.py のフラグ（環境変数 VRP_* 未設定時）と同じ"""
+    enable_export: bool = True           # JSON出力(export_vrp_state)
+    export_format: str = "json"          # "json"=step_N.json / "packed"=型付き配列のバイナリ＋マニフェスト（大規模向け）
+    enable_plot: bool = True             # PNG出力(plot_routes)
+    plot_mode: str = "standard"          # "standard"=plot_routes / "fast"=RoutePlotter（図を使い回す）/ "offline"=ケース終了後に step JSON から並列描画
+    initial_decompose_pairs: int = 0     # >0 なら PD ペアがこれを超える会社の初期解を、この件数程度のクラスタに分けて解く（gat_workers で並列）
+    initial_cluster_method: str = "sweep"  # クラスタ分割の方法: sweep=デポまわりの角度 / kmeans=ペア中点の k-means
+    voronoi_warm_start: bool = False     # ボロノイ再最適化を初期経路から warm-start
+    voronoi_allocation: str = "nearest"  # "nearest"=最近デポ / "balanced"=作業量上限つき
+    voronoi_balance_by: str = "vehicles" # balanced時の上限基準: tasks / vehicles / demand
+    voronoi_balance_slack: float = 0.1   # balanced時の上限の余裕
+    gat_workers: int = 1                 # >1 なら2車両部分問題をプロセス並列で解く（共有メモリ）
+    gat_time_budget: float = 0.0         # >0 なら社内GAT全体の秒数上限（anytime モード）
+    gat_company_parallel: bool = False   # 各ラウンドで未収束の全社の社内GATを同時に実行する
+    gat_engine: str = "pair"             # "pair"=2車両ペアの全探索（従来）/ "lns"=k台まとめて・要求の抜き差しの適応LNS
+    lns_time_budget: float = 10.0        # lns 時の1社1ラウンドあたりの秒数
+    lns_k_max: int = 5                   # lns でまとめて解き直す最大台数
+    intra_route_opt: bool = False        # 各GATラウンドの後に、各ルートの訪問順を単独で最適化（短いルートは厳密DP）
+    intra_route_max_exact: int = 12      # 厳密DPで解く訪問数の上限（これより長いルートは Or-opt）
+    pair_queue_address: str = ""         # "host:port" 指定時は2車両部分問題をワークキュー経由でリモートワーカーに配る
+    pair_queue_local_workers: int = 0    # ワークキュー使用時、同じマシンで起動するワーカー数
+    pair_queue_authkey: str = ""         # ワークキューの認証鍵（空ならループバックのみ・ランダムな鍵を生成して表示）
+    enable_cross_exchange: bool = False  # GAT収束後に境界限定の会社間交換
+    cross_boundary_margin: float = 10.0  # 境界からの距離のしきい値
+    enable_telemetry: bool = False       # solve単位の計測(<telemetry_root>/<instance>.jsonl)
+    record_corpus_root: str = ""         # 指定時は部分問題を <root>/<instance>/ に記録（replay_corpus.py 用）
+    progress_url: str = ""               # 指定時はステップごとのルート差分・コストを progress_server.py へ送る
+    metrics_port: int = 0                # >0 なら http://127.0.0.1:<port>/metrics で Prometheus 形式のメトリクスを公開
+    metrics_file: str = ""               # 指定時は metrics_interval 秒ごとに同じ内容をファイルへ書き出す
+    metrics_interval: float = 15.0
+    enable_profile: bool = False         # フェーズ別の CPU/メモリ計測(<profile_root>/<instance>/)
+    profile_mode: str = "cprofile"       # "cprofile"=<phase>.pstats / "sample"=<phase>.folded（flamegraph 用）
+    profile_memory: bool = False         # tracemalloc でフェーズごとのメモリピークも記録（時間が膨らむので既定は無効）
+    deterministic: bool = False          # 時間に依存する打ち切りを使わず、並列数によらず同じルートを出す（比較実験用）
+    seed: int = 42                       # 初期解のクラスタ分割・LNS・CP-SAT のシード
+    route_cost_cache_size: int = 200000  # ケース内のルート総距離のキャッシュ（LRU）の上限件数。0 で無効
+    enable_checkpoint: bool = False      # フェーズ/ラウンドごとの状態保存（resume 時は常に保存）
+    resume: bool = False                 # checkpoint から再開（完了済みケースはスキップ）
+    export_root: str = "web_data"
+    viewer_root: str = "vrp-viewer/public/vrp_data"
+    figure_root: str = "figures"
+    checkpoint_root: str = "checkpoints"
+    telemetry_root: str = "telemetry"
+    profile_root: str = "profiles"
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """環境変数 VRP_* から設定を作る（overrides で個別に上書き）"""
+        config = cls(
+            enable_export=_env_flag("VRP_ENABLE_EXPORT", "1"),
+            export_format=os.getenv("VRP_EXPORT_FORMAT", "json"),
+            enable_plot=_env_flag("VRP_ENABLE_PLOT", "1"),
+            plot_mode=os.getenv("VRP_PLOT_MODE", "standard"),
+            initial_decompose_pairs=int(os.getenv("VRP_INITIAL_DECOMPOSE_PAIRS", "0")),
+            initial_cluster_method=os.getenv("VRP_INITIAL_CLUSTER_METHOD", "sweep"),
+            voronoi_warm_start=_env_flag("VRP_VORONOI_WARM_START", "0"),
+            voronoi_allocation=os.getenv("VRP_VORONOI_ALLOCATION", "nearest"),
+            voronoi_balance_by=os.getenv("VRP_VORONOI_BALANCE_BY", "vehicles"),
+            voronoi_balance_slack=float(os.getenv("VRP_VORONOI_BALANCE_SLACK", "0.1")),
+            gat_workers=int(os.getenv("VRP_GAT_WORKERS", "1")),
+            gat_time_budget=float(os.getenv("VRP_GAT_TIME_BUDGET", "0")),
+            gat_company_parallel=_env_flag("VRP_GAT_COMPANY_PARALLEL", "0"),
+            gat_engine=os.getenv("VRP_GAT_ENGINE", "pair"),
+            lns_time_budget=float(os.getenv("VRP_LNS_TIME_BUDGET", "10")),
+            lns_k_max=int(os.getenv("VRP_LNS_K_MAX", "5")),
+            intra_route_opt=_env_flag("VRP_INTRA_ROUTE_OPT", "0"),
+            intra_route_max_exact=int(os.getenv("VRP_INTRA_ROUTE_MAX_EXACT", "12")),
+            pair_queue_address=os.getenv("VRP_PAIR_QUEUE", ""),
+            pair_queue_local_workers=int(os.getenv("VRP_PAIR_QUEUE_LOCAL_WORKERS", "0")),
+            pair_queue_authkey=os.getenv("VRP_PAIR_QUEUE_AUTHKEY", ""),
+            enable_cross_exchange=_env_flag("VRP_ENABLE_CROSS_EXCHANGE", "0"),
+            cross_boundary_margin=float(os.getenv("VRP_CROSS_BOUNDARY_MARGIN", "10.0")),
+            enable_telemetry=_env_flag("VRP_ENABLE_TELEMETRY", "0"),
+            record_corpus_root=os.getenv("VRP_RECORD_CORPUS_ROOT", ""),
+            progress_url=os.getenv("VRP_PROGRESS_URL", ""),
+            metrics_port=int(os.getenv("VRP_METRICS_PORT", "0")),
+            metrics_file=os.getenv("VRP_METRICS_FILE", ""),
+            metrics_interval=float(os.getenv("VRP_METRICS_INTERVAL", "15")),
+            enable_profile=_env_flag("VRP_ENABLE_PROFILE", "0"),
+            profile_mode=os.getenv("VRP_PROFILE_MODE", "cprofile"),
+            profile_memory=_env_flag("VRP_PROFILE_MEMORY", "0"),
+            deterministic=_env_flag("VRP_DETERMINISTIC", "0"),
+            seed=int(os.getenv("VRP_SEED", "42")),
+            route_cost_cache_size=int(os.getenv("VRP_ROUTE_COST_CACHE_SIZE", "200000")),
+            enable_checkpoint=_env_flag("VRP_ENABLE_CHECKPOINT", "0"),
+            resume=_env_flag("VRP_RESUME", "0"),
+        )
+        known = {f.name for f in fields(cls)}
+        for key, value in overrides.items():
+            if key not in known:
+                raise TypeError(f"PipelineConfig に {key} はありません")
+            if value is not None:
+                setattr(config, key, value)
+        return config
+
+
+# ==============================
+# === 会社別の集計ユーティリティ ===
+# ==============================
+def compute_company_costs(routes, all_customers, vehicle_num_list, cost_cache=None):
+    """vehicle_num_list に従って routes を会社ごとに分割し、各社の合計 route_cost を返す（cost_cache はケースの RouteCostCache）"""
+    from flexible_vrp_solver import cached_route_cost
+    costs = []
+    vidx = 0
+    for n in vehicle_num_list:
+        s = 0.0
+        for _ in range(n):
+            s += cached_route_cost(routes[vidx], all_customers, cost_cache)
+            vidx += 1
+        costs.append(s)
+    return costs
+
+
+def print_round_table(initial_company_costs, prev_company_costs, curr_company_costs):
+    """初期コスト／暫定コスト／ラウンド改善率／初期比改善率 を会社別＋TOTALで表示"""
+    initial_total_cost = sum(initial_company_costs)
+    prev_total_cost = sum(prev_company_costs)
+    curr_total_cost = sum(curr_company_costs)
+    colw = 10
+    # ヘッダー行
+    print(
+        " " * 7 +
+        "{:>{w}} {:>{w}} {:>{w}} {:>{w}}".format(
+            "初期コスト", "暫定コスト", "ラウンド改善(%)", "初期比改善(%)", w=colw
+        )
+    )
+    # 各社の行
+    colw = 15
+    for idx, (init_c, prev_c, cur_c) in enumerate(zip(initial_company_costs, prev_company_costs, curr_company_costs), 1):
+        round_improve = ((prev_c - cur_c) / prev_c * 100.0) if prev_c > 0 else 0.0
+        init_improve = ((init_c - cur_c) / init_c * 100.0) if init_c > 0 else 0.0
+        print(
+            f"LSP {idx:<2} " +
+            "{:>{w}.2f} {:>{w}.2f} {:>{w}.2f} {:>{w}.2f}".format(
+                init_c, cur_c, round_improve, init_improve, w=colw
+            )
+        )
+    # TOTAL行
+    round_improve_total = ((prev_total_cost - curr_total_cost) / prev_total_cost * 100.0) if prev_total_cost > 0 else 0.0
+    init_improve_total = ((initial_total_cost - curr_total_cost) / initial_total_cost * 100.0) if initial_total_cost > 0 else 0.0
+    print(
+        f"{'TOTAL':<6} " +
+        "{:>{w}.2f} {:>{w}.2f} {:>{w}.2f} {:>{w}.2f}".format(
+            initial_total_cost, curr_total_cost, round_improve_total, init_improve_total, w=colw
+        )
+    )
+
+
+def print_voronoi_table(initial_company_costs, voronoi_company_costs):
+    """初期コスト／ボロノイ後コスト／初期比改善率 を会社別＋TOTALで表示"""
+    initial_total_cost = sum(initial_company_costs)
+    voronoi_total_cost = sum(voronoi_company_costs)
+    colw = 10
+    print(
+        " " * 7 +
+        "{:>{w}} {:>{w}} {:>{w}}".format(
+            "初期コスト", "暫定コスト", "初期比改善(%)", w=colw
+        )
+    )
+    colw = 15
+    for idx, (init_c, cur_c) in enumerate(zip(initial_company_costs, voronoi_company_costs), 1):
+        init_improve = ((init_c - cur_c) / init_c * 100.0) if init_c > 0 else 0.0
+        print(
+            f"LSP {idx:<2} " +
+            "{:>{w}.2f} {:>{w}.2f} {:>{w}.2f}".format(
+                init_c, cur_c, init_improve, w=colw
+            )
+        )
+    init_improve_total = ((initial_total_cost - voronoi_total_cost) / initial_total_cost * 100.0) if initial_total_cost > 0 else 0.0
+    print(
+        f"{'TOTAL':<6} " +
+        "{:>{w}.2f} {:>{w}.2f} {:>{w}.2f}".format(
+            initial_total_cost, voronoi_total_cost, init_improve_total, w=colw
+        )
+    )
+
+
+def split_routes_by_company(routes, vehicle_num_list):
+    """全車両ルート配列を company ごとのサブ配列に分割"""
+    out = []
+    idx = 0
+    for n in vehicle_num_list:
+        out.append(routes[idx: idx + n])
+        idx += n
+    return out
+
+
+def flatten(list_of_lists):
+    return list(chain.from_iterable(list_of_lists))
+
+
+def filter_subcustomers_by_routes(all_customers, company_routes):
+    """その会社のルートに登場するノードのみを抽出して customers を縮約"""
+    node_ids = set()
+    for r in company_routes:
+        node_ids.update(r)
+    return [c for c in all_customers if c["id"] in node_ids]
+
+
+def filter_pd_pairs_for_nodes(all_PD_pairs, node_ids_set):
+    """PD両端が node_ids_set に含まれるペアのみ残す"""
+    return {p: d for p, d in all_PD_pairs.items() if p in node_ids_set and d in node_ids_set}
+
+
+def instance_name_for(file_paths):
+    return "_".join(os.path.basename(p).split('.')[0] for p in file_paths)
+
+
+# ==============================
+# === パイプライン本体 ===
+# ==============================
+class VoronoiRoutingPipeline:
+    """
+    1ケース = 読み込み → 初期解 → ボロノイ再配布 → 社内GAT（→ 会社間交換）→ 出力 の流れをまとめたもの。
+    main.py の CLI からも、他のサービスからのライブラリ利用からも同じ run_case を呼ぶ。
+
+        pipeline = VoronoiRoutingPipeline(PipelineConfig(enable_plot=False))
+        result = pipeline.run_case(1, ["data/LC1_2_2.txt", "data/LC1_2_6.txt"], [(0, 0), (42, -42)])
+    """
+
+    def __init__(self, config=None):
+        self.config = config or PipelineConfig.from_env()
+        if self.config.deterministic:
+            from determinism import enable_determinism
+            enable_determinism(self.config.seed)
+        self.publisher = None
+        if self.config.progress_url:
+            from progress_server import ProgressPublisher
+            self.publisher = ProgressPublisher(self.config.progress_url)
+        self.metrics = None
+        if self.config.metrics_port or self.config.metrics_file:
+            from solver_metrics import MetricsExporter
+            self.metrics = MetricsExporter(port=self.config.metrics_port, path=self.config.metrics_file,
+                                           interval=self.config.metrics_interval)
+
+    def run(self, test_cases):
+        """(file_paths, offsets) のリストを順に実行し、各ケースの結果 dict のリストを返す"""
+        return [self.run_case(case_index, file_paths, offsets)
+                for case_index, (file_paths, offsets) in enumerate(test_cases, 1)]
+
+    def close(self):
+        """送信待ちの途中経過を送り切り、メトリクスの公開を止める（ファイルには最後の値を書く）"""
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.metrics is not None:
+            self.metrics.close()
+
+    # === 出力（有効時だけ visualizer / web_exporter を読み込む）===
+    def _save_step(self, case, routes, step_idx, phase):
+        cfg = self.config
+        if self.publisher is not None:
+            self.publisher.step(case["instance_name"], step_idx, phase, routes,
+                                compute_company_costs(routes, case["customers"], case["vehicle_num_list"], case["cost_cache"]),
+                                elapsed=case["prev_elapsed"] + time.time() - case["start_time"])
+        if cfg.enable_export:
+            from web_exporter import export_vrp_state, export_packed_state
+            export = export_packed_state if cfg.export_format == "packed" else export_vrp_state
+            with self._phase(case, "export"):
+                export(case["customers"], routes, case["PD_pairs"], step_idx, case_index=case["case_index"],
+                                 depot_id_list=case["depot_id_list"], vehicle_num_list=case["vehicle_num_list"],
+                                 instance_name=case["instance_name"], output_root=cfg.export_root)
+        if cfg.enable_plot and cfg.plot_mode == "fast":
+            with self._phase(case, "plot"):
+                if case.get("plotter") is None:
+                    from visualizer import RoutePlotter
+                    case["plotter"] = RoutePlotter(case["customers"], case["depot_id_list"], case["vehicle_num_list"],
+                                                   instance_name=case["instance_name"], output_dir=cfg.figure_root,
+                                                   web_data_root=cfg.export_root)
+                case["plotter"].plot(routes, step_idx)
+        elif cfg.enable_plot and cfg.plot_mode != "offline":
+            from visualizer import plot_routes
+            with self._phase(case, "plot"):
+                plot_routes(case["customers"], routes, case["depot_id_list"], case["vehicle_num_list"],
+                            iteration=step_idx, instance_name=case["instance_name"], output_dir=cfg.figure_root)
+
+    def _phase(self, case, name):
+        """プロファイル有効時はフェーズの計測区間、無効時は何もしないコンテキスト"""
+        profiler = case.get("profiler")
+        return profiler.phase(name) if profiler is not None else nullcontext()
+
+    def _checkpoint(self, case, phase, **state):
+        if not (self.config.enable_checkpoint or self.config.resume):
+            return
+        state.update(phase=phase, instance_name=case["instance_name"], file_paths=case["file_paths"],
+                     offsets=case["offsets"], elapsed=case["prev_elapsed"] + time.time() - case["start_time"])
+        save_checkpoint(case["ckpt_path"], state)
+
+    def run_case(self, case_index, file_paths, offsets):
+        """
+        1ケースを実行して結果を返す。
+        戻り値: {"instance_name", "skipped", "routes", "initial_company_costs", "final_company_costs", "elapsed"}
+        """
+        cfg = self.config
+        print("\n\n" + "="*60)
+        print(f"テストケース {case_index}: {' + '.join(file_paths)}")
+        print(f"オフセット: {' , '.join(str(o) for o in offsets)}")
+        print("="*60)
+
+        instance_name = instance_name_for(file_paths)
+        start_time = time.time()
+
+        # === checkpoint（再開時は完了済みフェーズを読み込んで飛ばす）===
+        ckpt_path = checkpoint_path(instance_name, cfg.checkpoint_root)
+        ckpt = load_checkpoint(ckpt_path) if cfg.resume else None
+        if ckpt and not checkpoint_matches(ckpt, file_paths, offsets):
+            print(f">>> {ckpt_path} は別のケース（{ckpt.get('file_paths')} / オフセット {ckpt.get('offsets')}）の"
+                  "checkpoint のため使わず、最初から実行します")
+            ckpt = None
+        resumed_rank = phase_rank(ckpt)  # -1=新規, 以降は PHASES の添字（完了済みの最後のフェーズ）
+        if resumed_rank == PHASES.index("done"):
+            print(f">>> テストケース {case_index} は完了済みのためスキップ（{ckpt_path}）")
+            return {"instance_name": instance_name, "skipped": True, "routes": ckpt["gat_current_routes"],
+                    "elapsed": ckpt.get("elapsed", 0.0)}
+        if ckpt:
+            print(f">>> checkpoint から再開します（完了済み: {ckpt['phase']}）")
+
+        telemetry_path = os.path.join(cfg.telemetry_root, f"{instance_name}.jsonl")
+        if cfg.enable_telemetry:
+            enable_telemetry(telemetry_path, reset=resumed_rank < 0)
+        if cfg.record_corpus_root:
+            enable_recording(os.path.join(cfg.record_corpus_root, instance_name))
+
+        profiler = None
+        if cfg.enable_profile:
+            from phase_profiler import PhaseProfiler
+            profiler = PhaseProfiler(os.path.join(cfg.profile_root, instance_name), mode=cfg.profile_mode,
+                                     memory=cfg.profile_memory)
+
+        # === データファイルをパース（座標・IDオフセットを付与し結合。N社対応）===
+        with profiler.phase("parse") if profiler is not None else nullcontext():
+            case_data = load_case(file_paths, offsets)
+        from flexible_vrp_solver import RouteCostCache
+        case = {
+            "case_index": case_index,
+            "instance_name": instance_name,
+            "file_paths": file_paths,
+            "offsets": offsets,
+            "customers": case_data['customers'],
+            "PD_pairs": case_data['PD_pairs'],
+            "depot_id_list": case_data['depot_id_list'],
+            "vehicle_num_list": case_data['vehicle_num_list'],
+            "vehicle_capacity": case_data['vehicle_capacity'],
+            "ckpt": ckpt,
+            "ckpt_path": ckpt_path,
+            "resumed_rank": resumed_rank,
+            "start_time": start_time,
+            "prev_elapsed": ckpt.get("elapsed", 0.0) if ckpt else 0.0,
+            "profiler": profiler,
+            # ルート総距離のキャッシュ（ケースごとに作り、コスト計算に明示的に渡す）
+            "cost_cache": RouteCostCache(case_data['customers'], cfg.route_cost_cache_size)
+                          if cfg.route_cost_cache_size > 0 else None,
+        }
+        if self.publisher is not None:
+            self.publisher.case_started(instance_name, case["customers"], case["PD_pairs"],
+                                        case["depot_id_list"], case["vehicle_num_list"])
+
+        with self._phase(case, "initial"):
+            routes, initial_company_costs = self._run_initial(case)
+        with self._phase(case, "voronoi"):
+            voronoi_routes = self._run_voronoi(case, routes, initial_company_costs)
+        gat_state = dict(initial_routes=routes, initial_company_costs=initial_company_costs,
+                         voronoi_routes=voronoi_routes)
+        final = self._run_gat_and_cross(case, voronoi_routes, initial_company_costs, gat_state)
+
+        #  [データ保存] -> jsonファイル
+        if cfg.enable_export:
+            from web_exporter import generate_index_json
+            with self._phase(case, "export"):
+                generate_index_json(instance_name=instance_name, output_root=cfg.export_root, target_root=cfg.viewer_root)
+
+        #  [データ保存] -> pngファイル（offline モードは出力済みの step JSON からまとめて並列に描く）
+        if case.get("plotter") is not None:
+            case["plotter"].close()
+        if cfg.enable_plot and cfg.plot_mode == "offline":
+            if cfg.enable_export:
+                from render_figures import render_case
+                with self._phase(case, "plot"):
+                    render_case(os.path.join(cfg.export_root, instance_name), cfg.figure_root)
+            else:
+                print(">>> plot_mode=offline は JSON出力（enable_export）が必要なため、図は作成しません")
+
+        #  [コンソール出力] -> solve 単位の集計
+        if cfg.enable_telemetry:
+            print("\n==== ソルバー呼び出し集計（phase別） ====")
+            print(format_summary(summarize_telemetry(telemetry_path)))
+            disable_telemetry()
+        if cfg.record_corpus_root:
+            disable_recording()
+        if profiler is not None:
+            from phase_profiler import format_profile
+            print(f"\n==== フェーズ別プロファイル（{profiler.output_dir}） ====")
+            print(format_profile(profiler.close()))
+
+        self._checkpoint(case, "done", **final, **gat_state)
+
+        # 実行時間
+        elapsed = time.time() - start_time
+        prev_elapsed = case["prev_elapsed"]
+        if prev_elapsed > 0:
+            print(f">>> テストケース {case_index} の実行時間: {elapsed:.2f} 秒（中断前と合わせて {prev_elapsed + elapsed:.2f} 秒）")
+        else:
+            print(f">>> テストケース {case_index} の実行時間: {elapsed:.2f} 秒")
+
+        final_company_costs = compute_company_costs(final["gat_current_routes"], case["customers"],
+                                                    case["vehicle_num_list"], case["cost_cache"])
+        if case["cost_cache"] is not None:
+            cache_stats = case["cost_cache"].stats()
+            print(f">>> ルート距離キャッシュ: {cache_stats['routes']}ルート / ヒット率 {cache_stats['hit_rate'] * 100:.1f}%")
+        if self.publisher is not None:
+            self.publisher.case_finished(instance_name, final_company_costs, elapsed=prev_elapsed + elapsed)
+        case_finished(instance_name, prev_elapsed + elapsed)
+
+        return {
+            "instance_name": instance_name,
+            "skipped": False,
+            "routes": final["gat_current_routes"],
+            "initial_company_costs": initial_company_costs,
+            "final_company_costs": final_company_costs,
+            "elapsed": prev_elapsed + elapsed,
+        }
+
+    # =============================
+    # === 初期：LSP個別の経路生成 ===
+    # =============================
+    def _run_initial(self, case):
+        from gat import initialize_individual_vrps
+        ckpt, resumed_rank = case["ckpt"], case["resumed_rank"]
+        if resumed_rank >= 0:
+            routes = ckpt["initial_routes"]
+        else:
+            routes = initialize_individual_vrps(
+                case["customers"], case["PD_pairs"], len(case["file_paths"]), case["vehicle_num_list"],
+                case["depot_id_list"], vehicle_capacity=case["vehicle_capacity"], seed=self.config.seed,
+                decompose_pairs=self.config.initial_decompose_pairs,
+                cluster_method=self.config.initial_cluster_method,
+                workers=self.config.gat_workers,
+            )
+
+        #　[コンソール出力] -> 会社別コスト
+        initial_company_costs = compute_company_costs(routes, case["customers"], case["vehicle_num_list"], case["cost_cache"])
+        print("\n==== 初期経路：会社別コスト ====")
+        for idx, c in enumerate(initial_company_costs, 1):
+            print(f"LSP {idx}: {c:.2f}")
+        print(f"TOTAL: {sum(initial_company_costs):.2f}")
+        # [データ保存] -> jsonファイル、pngファイル（再開時は保存済み）
+        if resumed_rank < 0:
+            self._save_step(case, routes, 0, "initial")
+            self._checkpoint(case, "initial", initial_routes=routes, initial_company_costs=initial_company_costs)
+        return routes, initial_company_costs
+
+    # ==========================================
+    # === Voronoi再配布 → 各社で一発最適化 ===
+    # ==========================================
+    def _run_voronoi(self, case, routes, initial_company_costs):
+        from voronoi_allocator import perform_voronoi_routing
+        cfg = self.config
+        ckpt, resumed_rank = case["ckpt"], case["resumed_rank"]
+        print("\n=== Voronoi分割による経路再生成 ===")
+        if resumed_rank >= 1:
+            voronoi_routes = ckpt["voronoi_routes"]
+        else:
+            voronoi_routes = perform_voronoi_routing(
+                customers=case["customers"],
+                PD_pairs=case["PD_pairs"],
+                depot_id_list=case["depot_id_list"],
+                vehicle_num_list=case["vehicle_num_list"],
+                vehicle_capacity=case["vehicle_capacity"],
+                warm_start_routes=routes if cfg.voronoi_warm_start else None,
+                allocation=cfg.voronoi_allocation,
+                balance_by=cfg.voronoi_balance_by,
+                balance_slack=cfg.voronoi_balance_slack
+            )
+
+        #　[コンソール出力] -> 改善率、他
+        voronoi_company_costs = compute_company_costs(voronoi_routes, case["customers"], case["vehicle_num_list"], case["cost_cache"])
+        print_voronoi_table(initial_company_costs, voronoi_company_costs)
+        # [データ保存] -> jsonファイル、pngファイル（再開時は保存済み）
+        if resumed_rank < 1:
+            self._save_step(case, voronoi_routes, 1, "voronoi")
+            self._checkpoint(case, "voronoi", initial_routes=routes, initial_company_costs=initial_company_costs,
+                             voronoi_routes=voronoi_routes)
+        return voronoi_routes
+
+    # =======================================================
+    # === 社内限定の GAT 改善（会社ごとに独立に繰り返し） ===
+    # =======================================================
+    def _run_company_gats(self, jobs, vehicle_capacity, gat_deadline, pair_histories, pair_executor, company_pool,
+                          cost_cache=None):
+        """
+        未収束の各社（jobs: 会社index → (ルート, 社内顧客, 社内PD)）で社内GATを1回実行し、
+        会社index → (新しいルート, 評価ペア数, 時間切れか) を返す。
+        company_pool があれば全社を同時に投入する（ラウンド時間は最も遅い会社で決まる）。
+        cost_cache はスレッドで並べるときだけ共有する（プロセスには渡さない）。
+        """
+        from gat import run_company_gat
+        engine = self.config.gat_engine
+
+        def lns_deadline(deadline):
+            # lns は1社1ラウンドの秒数で区切る（ケース全体の締め切りが先ならそちら）
+            if engine != "lns":
+                return deadline
+            round_deadline = time.time() + self.config.lns_time_budget
+            return round_deadline if deadline is None else min(deadline, round_deadline)
+
+        results = {}
+        if company_pool is None:
+            for n, (comp_idx, (company_routes, sub_customers, sub_PD_pairs)) in enumerate(jobs.items()):
+                deadline = None
+                if gat_deadline is not None:
+                    # 残り時間を、このラウンドでまだ処理していない未収束の会社で等分する
+                    deadline = time.time() + max(0.0, gat_deadline - time.time()) / (len(jobs) - n)
+                new_routes, num_evaluated, timed_out, pair_histories[comp_idx] = run_company_gat(
+                    company_routes, sub_customers, sub_PD_pairs, vehicle_capacity, lns_deadline(deadline),
+                    pair_histories[comp_idx], pair_executor, engine, cost_cache
+                )
+                results[comp_idx] = (new_routes, num_evaluated, timed_out)
+            return results
+
+        # 会社並列：同時に走るので、どの会社もケース全体の締め切りまで使える
+        # プロセスで並べる場合、子プロセスの solve・ペア数のカウンタは戻り値で受け取って親のレジストリに足し込む
+        from concurrent.futures import ThreadPoolExecutor
+        from solver_metrics import run_with_metrics, merge_metrics
+        in_process = not isinstance(company_pool, ThreadPoolExecutor)
+        if in_process:
+            cost_cache = None
+        futures = {}
+        for comp_idx, (company_routes, sub_customers, sub_PD_pairs) in jobs.items():
+            args = (company_routes, sub_customers, sub_PD_pairs, vehicle_capacity, lns_deadline(gat_deadline),
+                    pair_histories[comp_idx], pair_executor, engine, cost_cache)
+            futures[comp_idx] = (company_pool.submit(run_with_metrics, run_company_gat, *args) if in_process
+                                 else company_pool.submit(run_company_gat, *args))
+        for comp_idx, future in futures.items():
+            result = future.result()
+            if in_process:
+                result, snapshot = result
+                merge_metrics(snapshot)
+            new_routes, num_evaluated, timed_out, pair_histories[comp_idx] = result
+            results[comp_idx] = (new_routes, num_evaluated, timed_out)
+        return results
+
+    def _run_gat_and_cross(self, case, voronoi_routes, initial_company_costs, gat_state):
+        from flexible_vrp_solver import cached_route_cost
+        from gat import PairHistory
+        cfg = self.config
+        ckpt, resumed_rank = case["ckpt"], case["resumed_rank"]
+        all_customers, all_PD_pairs = case["customers"], case["PD_pairs"]
+        vehicle_num_list, vehicle_capacity = case["vehicle_num_list"], case["vehicle_capacity"]
+        cost_cache = case["cost_cache"]
+        print("\n=== 社内GATによる経路改善 ===")
+
+        num_companies = len(vehicle_num_list)
+        converged = [False] * num_companies          # 会社ごとの収束フラグ
+        gat_round = 1
+        gat_current_routes = voronoi_routes[:]       # 作業用コピー
+        step_idx = 2                                 # 0=初期, 1=ボロノイ, 以降はGATラウンド
+        cross_round = 1
+        cross_finished = False
+        if resumed_rank >= PHASES.index("gat"):
+            converged = ckpt["converged"]
+            gat_round = ckpt["gat_round"]
+            gat_current_routes = ckpt["gat_current_routes"]
+            step_idx = ckpt["step_idx"]
+        # 会社間交換まで進んだ checkpoint なら社内GATは終わっている（時間切れで未収束の会社があっても再実行しない）
+        gat_finished = resumed_rank >= PHASES.index("cross")
+        if gat_finished:
+            cross_round = ckpt.get("cross_round", 1)
+            cross_finished = ckpt.get("cross_finished", True)  # ラウンドごとの保存より前の checkpoint は終了後にだけ保存
+
+        # 並列モード：インスタンスをケースごとに1回だけ共有メモリへ公開し、ワーカーはそれを参照する
+        # 分散モード：ワークキューを開き、pair_worker.py のワーカー（他ホスト可）に部分問題を配る
+        shared_instance = None
+        pair_executor = None
+        if cfg.pair_queue_address:
+            from pair_executor import WorkQueuePairExecutor
+            from pair_worker import parse_address
+            pair_executor = WorkQueuePairExecutor(parse_address(cfg.pair_queue_address), authkey=cfg.pair_queue_authkey,
+                                                  local_workers=cfg.pair_queue_local_workers)
+            pair_executor.publish(all_customers)
+            print(f">>> ワークキューを {pair_executor.address} で待ち受け中"
+                  f"（python pair_worker.py --connect <host>:{pair_executor.address[1]}）")
+            if pair_executor.generated_authkey:
+                print(f">>> 認証鍵を生成しました: VRP_PAIR_QUEUE_AUTHKEY={pair_executor.authkey.decode()}")
+        elif cfg.gat_workers > 1:
+            from shared_instance import SharedInstance
+            from pair_executor import SharedMemoryPairExecutor
+            shared_instance = SharedInstance.publish(all_customers, all_PD_pairs)
+            pair_executor = SharedMemoryPairExecutor(shared_instance, max_workers=cfg.gat_workers)
+
+        # 会社並列：部分問題を pair_executor のワーカーで解く場合はスレッドで全社の投入だけ並べ、
+        # そうでなければ会社ごとにプロセスを割り当てる
+        company_pool = None
+        if cfg.gat_company_parallel and num_companies > 1:
+            if pair_executor is not None:
+                from concurrent.futures import ThreadPoolExecutor
+                company_pool = ThreadPoolExecutor(max_workers=num_companies)
+            else:
+                # 進捗配信・メトリクスのスレッドが動いている親を fork しないよう spawn で起動する
+                # （決定的モード・corpus 記録・テレメトリの設定は環境変数で子プロセスに引き継がれる）
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                company_pool = ProcessPoolExecutor(max_workers=min(num_companies, os.cpu_count() or 1),
+                                                   mp_context=multiprocessing.get_context("spawn"))
+
+        # anytime モード：ケース全体の締め切りと、会社ごとのペア履歴（ラウンドをまたいで保持）
+        # lns：会社ごとの腕（k 台 / 要求の抜き差し）の成績（同じくラウンドをまたいで保持）
+        # （決定的モードでは時間で打ち切らないので gat_time_budget は使わない）
+        gat_deadline = time.time() + cfg.gat_time_budget if cfg.gat_time_budget > 0 and not cfg.deterministic else None
+        if cfg.intra_route_opt:
+            from intra_route import optimize_routes
+            all_id_to_node = {c["id"]: c for c in all_customers}
+        if cfg.gat_engine == "lns":
+            from lns_engine import LNSState
+            pair_histories = [LNSState(k_max=cfg.lns_k_max, seed=cfg.seed + k) for k in range(num_companies)]
+        else:
+            pair_histories = [PairHistory() for _ in range(num_companies)]
+        budget_exhausted = False
+
+        try:
+            while not gat_finished and not all(converged):
+                if gat_deadline is not None and time.time() >= gat_deadline:
+                    budget_exhausted = True
+                    break
+                with self._phase(case, f"gat_round_{gat_round}"):
+                    print(f"--- 社内GATラウンド {gat_round} ---")
+
+                    prev_company_costs = compute_company_costs(gat_current_routes, all_customers, vehicle_num_list, cost_cache)
+
+                    # 会社ごとにルートを分割
+                    per_company_routes = split_routes_by_company(gat_current_routes, vehicle_num_list)
+                    next_company_routes_list = []
+
+                    # 未収束の会社ごとに社内の顧客/PDに絞る
+                    jobs = {}
+                    for comp_idx, company_routes in enumerate(per_company_routes):
+                        if converged[comp_idx]:
+                            continue
+                        sub_customers = filter_subcustomers_by_routes(all_customers, company_routes)
+                        sub_node_ids = set(c["id"] for c in sub_customers)
+                        sub_PD_pairs_dict = filter_pd_pairs_for_nodes(all_PD_pairs, sub_node_ids)
+                        jobs[comp_idx] = (company_routes, sub_customers, sub_PD_pairs_dict)
+
+                    # 社内GATを1回実行（会社並列なら全社同時）
+                    company_results = self._run_company_gats(jobs, vehicle_capacity, gat_deadline, pair_histories,
+                                                             pair_executor, company_pool, cost_cache)
+
+                    # 結果を会社の順に反映
+                    for comp_idx, company_routes in enumerate(per_company_routes):
+                        # 収束済みの会社はスキップ
+                        if converged[comp_idx]:
+                            print(f">>> LSP {comp_idx + 1}: 収束済みのためスキップ")
+                            next_company_routes_list.append(company_routes)
+                            continue
+
+                        new_company_routes, num_evaluated, timed_out = company_results[comp_idx]
+                        if cfg.intra_route_opt:
+                            # ルート単位の後処理（車両間でタスクは動かさず、各ルートの順序だけ並べ直す）
+                            new_company_routes, order_gain, num_reordered = optimize_routes(
+                                new_company_routes, all_id_to_node, vehicle_capacity, cfg.intra_route_max_exact)
+                            if num_reordered:
+                                print(f">>> LSP {comp_idx + 1}: 訪問順の最適化で {num_reordered}台 -{order_gain:.2f}")
+                        old_cost_company = sum(cached_route_cost(r, all_customers, cost_cache) for r in company_routes)
+                        if cfg.gat_engine == "lns":
+                            print(f">>> LSP {comp_idx + 1}: LNS {num_evaluated}回 {pair_histories[comp_idx].summary()}")
+                        elif num_evaluated is not None:
+                            print(f">>> LSP {comp_idx + 1}: {num_evaluated}ペアを評価" + ("（時間切れ）" if timed_out else ""))
+                        new_cost_company = sum(cached_route_cost(r, all_customers, cost_cache) for r in new_company_routes)
+
+                        # 改善判定（数値ゆらぎ対策）
+                        if new_cost_company + 1e-9 < old_cost_company:
+                            delta = (old_cost_company - new_cost_company) / old_cost_company * 100.0 if old_cost_company > 0 else 0.0
+                            print(f">>> LSP {comp_idx + 1}: +{delta:.2f}%  ( {old_cost_company:.2f} → {new_cost_company:.2f} )")
+                            next_company_routes_list.append(new_company_routes)
+                            # 改善した会社は次ラウンドも対象（converged は据え置き False）
+                        elif timed_out:
+                            # 時間切れで未評価のペアが残っているので収束とはみなさない
+                            print(f">>> LSP {comp_idx + 1}: +0.00% ( {old_cost_company:.2f} → {new_cost_company:.2f} )")
+                            next_company_routes_list.append(company_routes)
+                        else:
+                            print(f">>> LSP {comp_idx + 1}: +0.00% ( {old_cost_company:.2f} → {new_cost_company:.2f} ) → 収束")
+                            converged[comp_idx] = True
+                            next_company_routes_list.append(company_routes)  # 変化なしを引き継ぐ
+
+                    # ラウンド結果を反映
+                    gat_current_routes = flatten(next_company_routes_list)
+
+                    #　[コンソール出力] -> 改善率、他
+                    curr_company_costs = compute_company_costs(gat_current_routes, all_customers, vehicle_num_list, cost_cache)
+                    print_round_table(initial_company_costs, prev_company_costs, curr_company_costs)
+                    round_finished(case["instance_name"], "gat", gat_round, prev_company_costs, curr_company_costs)
+
+                    # [データ保存] -> jsonファイル、pngファイル
+                    self._save_step(case, gat_current_routes, step_idx, "gat")
+
+                    # 次のラウンドへ
+                    gat_round += 1
+                    step_idx += 1
+                    self._checkpoint(case, "gat", converged=converged, gat_round=gat_round, step_idx=step_idx,
+                                     gat_current_routes=gat_current_routes, **gat_state)
+
+            if gat_finished:
+                print("\n>>> checkpoint で社内GATは完了済みのためスキップ")
+            elif budget_exhausted:
+                print(f"\n>>> 時間予算（{cfg.gat_time_budget:.0f} 秒）を使い切ったため、社内GATを終了")
+            else:
+                print("\n>>> 全社が収束（改善率=0%）したため、社内GATを終了")
+
+            # ===================================================
+            # === 会社間の境界限定交換（オプション、改善が止まるまで） ===
+            # ===================================================
+            if cfg.enable_cross_exchange and not cross_finished:
+                from cross_company_exchange import perform_cross_company_exchange
+                print("\n=== 境界限定の会社間交換 ===")
+                while True:
+                    with self._phase(case, f"cross_round_{cross_round}"):
+                        prev_company_costs = compute_company_costs(gat_current_routes, all_customers, vehicle_num_list, cost_cache)
+                        new_routes, num_pairs = perform_cross_company_exchange(
+                            gat_current_routes, all_customers, all_PD_pairs, vehicle_capacity,
+                            vehicle_num_list, case["depot_id_list"], boundary_margin=cfg.cross_boundary_margin,
+                            executor=pair_executor, cost_cache=cost_cache
+                        )
+                        curr_company_costs = compute_company_costs(new_routes, all_customers, vehicle_num_list, cost_cache)
+                        print(f"--- 会社間交換ラウンド {cross_round}（境界近傍ペア {num_pairs} 組） ---")
+                        print_round_table(initial_company_costs, prev_company_costs, curr_company_costs)
+                        round_finished(case["instance_name"], "cross", cross_round, prev_company_costs, curr_company_costs)
+                        if not sum(curr_company_costs) + 1e-9 < sum(prev_company_costs):
+                            print(">>> 改善なしのため会社間交換を終了")
+                            break
+                        gat_current_routes = new_routes
+
+                        # [データ保存] -> jsonファイル、pngファイル
+                        self._save_step(case, gat_current_routes, step_idx, "cross")
+                        cross_round += 1
+                        step_idx += 1
+                        self._checkpoint(case, "cross", converged=converged, gat_round=gat_round, step_idx=step_idx,
+                                         gat_current_routes=gat_current_routes, cross_round=cross_round,
+                                         cross_finished=False, **gat_state)
+                self._checkpoint(case, "cross", converged=converged, gat_round=gat_round, step_idx=step_idx,
+                                 gat_current_routes=gat_current_routes, cross_round=cross_round,
+                                 cross_finished=True, **gat_state)
+        finally:
+            if company_pool is not None:
+                company_pool.shutdown(wait=True)
+            if pair_executor is not None:
+                pair_executor.close()
+            if shared_instance is not None:
+                shared_instance.close()
+                shared_instance.unlink()
+
+        return dict(converged=converged, gat_round=gat_round, step_idx=step_idx, gat_current_routes=gat_current_routes)
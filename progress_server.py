@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import json
+import logging
+import queue
+import threading
+import urllib.request
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# SSE クライアントごとの未送信イベント上限。溢れたら差分を捨てて最新スナップショットを送り直す
+CLIENT_QUEUE_SIZE = 256
+KEEPALIVE_SECONDS = 15.0
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), ensure_ascii=False)}\n\n".encode()
+
+
+class ProgressServer:
+    """
+    最適化の途中経過をブラウザ（vrp-viewer）へ SSE で流す軽量 HTTP サーバ（asyncio、標準ライブラリのみ）。
+
+      POST /publish            … パイプライン（ProgressPublisher）からイベントを受け取る
+      GET  /events[?instance=] … SSE。接続直後に現在のスナップショット、以降は差分を送る
+      GET  /state              … 全インスタンスの現在状態（JSON）
+
+    イベント（"type" で区別）:
+      case … ケース開始。customers / PD_pairs / depot_id_list / vehicle_num_list / routes（step_*.json と同じキー）
+      step … ラウンド結果。changed={車両index: ルート} の差分と company_costs / total_cost
+      done … ケース終了
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765):
+        self.host = host
+        self.port = port
+        self.states = {}        # instance_name → 現在状態（snapshot と同じ形）
+        self.clients = set()    # (asyncio.Queue, instance フィルタ)
+        self._loop = None
+        self._server = None
+
+    # === 状態の更新と配信 ===
+    def _apply(self, event):
+        name = event.get("instance_name")
+        kind = event.get("type")
+        if kind == "case":
+            self.states[name] = {k: v for k, v in event.items() if k != "type"}
+            return "snapshot", self.states[name]
+        state = self.states.get(name)
+        if state is None:
+            return None, None  # case を受け取る前の差分は捨てる
+        if kind == "step":
+            routes = state["routes"]
+            del routes[event.get("num_routes", len(routes)):]
+            for idx, route in event.get("changed", {}).items():
+                idx = int(idx)
+                routes.extend([] for _ in range(idx + 1 - len(routes)))
+                routes[idx] = route
+            for key in ("step_index", "phase", "company_costs", "total_cost", "elapsed"):
+                if key in event:
+                    state[key] = event[key]
+        elif kind == "done":
+            state["done"] = True
+        return kind, {k: v for k, v in event.items() if k != "type"}
+
+    def _broadcast(self, event):
+        kind, payload = self._apply(event)
+        if kind is None:
+            return
+        name = event.get("instance_name")
+        for q, instance in list(self.clients):
+            if instance and instance != name:
+                continue
+            try:
+                q.put_nowait(_sse(kind, payload))
+            except asyncio.QueueFull:
+                # 遅いクライアントは差分を捨てて最新状態から送り直す
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(_sse("snapshot", self.states[name]))
+
+    def publish_threadsafe(self, event):
+        """別スレッド（同一プロセス内のパイプライン）からイベントを渡す"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._broadcast, event)
+
+    # === HTTP ===
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            url = urlsplit(target)
+
+            if method == "OPTIONS":
+                await self._respond(writer, 204, b"")
+            elif method == "POST" and url.path == "/publish":
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                self._broadcast(json.loads(body))
+                await self._respond(writer, 204, b"")
+            elif method == "GET" and url.path == "/state":
+                await self._respond(writer, 200, json.dumps(self.states, ensure_ascii=False).encode(),
+                                    content_type="application/json")
+            elif method == "GET" and url.path == "/events":
+                instance = parse_qs(url.query).get("instance", [None])[0]
+                await self._stream(writer, instance)
+            else:
+                await self._respond(writer, 404, b"not found")
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.debug(f"progress server: 接続を終了しました ({e})")
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, content_type="text/plain; charset=utf-8"):
+        reason = {200: "OK", 204: "No Content", 404: "Not Found"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "Access-Control-Allow-Headers: Content-Type\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _stream(self, writer, instance):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: keep-alive\r\n"
+            b"Access-Control-Allow-Origin: *\r\n\r\n"
+        )
+        for name, state in self.states.items():
+            if not instance or instance == name:
+                writer.write(_sse("snapshot", state))
+        await writer.drain()
+
+        client = (asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE), instance)
+        self.clients.add(client)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(client[0].get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    chunk = b": keepalive\n\n"
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            self.clients.discard(client)
+
+    # === 起動 ===
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"progress server: http://{self.host}:{self.port}/events")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self):
+        """バックグラウンドスレッドで起動し、待ち受けを始めてから戻る（port=0 なら空きポート）"""
+        ready = threading.Event()
+
+        def run():
+            async def main():
+                task = asyncio.create_task(self.serve())
+                while self._server is None:
+                    await asyncio.sleep(0.01)
+                ready.set()
+                await task
+            asyncio.run(main())
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait(timeout=10)
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+
+class ProgressPublisher:
+    """
+    パイプライン側：ステップごとのルート差分とコストを ProgressServer へ POST する。
+    送信はバックグラウンドスレッドで行い、サーバが落ちていても最適化は止めない（イベントを捨てる）。
+    case / step を1件でも届けられなかった（キューが満杯・POST 失敗）インスタンスは、次の step で
+    差分の代わりに現在のルートを入れた case イベント（全体のスナップショット）を送り直す。
+    """
+
+    def __init__(self, url, timeout=2.0):
+        self.url = url.rstrip("/") + "/publish"
+        self.timeout = timeout
+        self._cases = {}          # instance_name → 直近の case イベント（再同期で送り直す）
+        self._last_routes = {}    # instance_name → 最後にキューへ入れたルート（差分の基準）
+        self._resync = set()      # サーバの状態と食い違った可能性があるインスタンス
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=1024)
+        self._warned = False
+        self._thread = threading.Thread(target=self._send_loop, daemon=True)
+        self._thread.start()
+
+    def _send_loop(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            body = json.dumps(event, separators=(",", ":"), ensure_ascii=False).encode()
+            req = urllib.request.Request(self.url, data=body, method="POST",
+                                         headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(req, timeout=self.timeout).close()
+                self._warned = False
+            except OSError as e:
+                self._lost(event)
+                if not self._warned:
+                    logger.warning(f"progress server へ送信できません（{self.url}）: {e}")
+                    self._warned = True
+
+    def _lost(self, event):
+        """届かなかった case / step のインスタンスを再同期の対象にする"""
+        if event.get("type") in ("case", "step"):
+            with self._lock:
+                self._resync.add(event["instance_name"])
+
+    def _put(self, event):
+        """キューが満杯なら捨てて False を返す"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self._lost(event)
+            return False
+
+    def _take_resync(self, instance_name):
+        with self._lock:
+            needed = instance_name in self._resync
+            self._resync.discard(instance_name)
+        return needed and instance_name in self._cases
+
+    def case_started(self, instance_name, customers, PD_pairs, depot_id_list, vehicle_num_list):
+        event = {
+            "type": "case", "instance_name": instance_name, "customers": customers, "PD_pairs": PD_pairs,
+            "depot_id_list": depot_id_list, "vehicle_num_list": vehicle_num_list, "routes": [],
+            "step_index": None, "phase": "parse",
+        }
+        self._cases[instance_name] = event
+        self._last_routes[instance_name] = []
+        with self._lock:
+            self._resync.discard(instance_name)
+        self._put(event)
+
+    def step(self, instance_name, step_index, phase, routes, company_costs, elapsed=None):
+        """前回送ったルートとの差分（変わった車両だけ）を送る。再同期が必要なら全体を case で送る"""
+        routes = [list(r) for r in routes]
+        info = {"step_index": step_index, "phase": phase, "company_costs": company_costs,
+                "total_cost": sum(company_costs), "elapsed": elapsed}
+        if self._take_resync(instance_name):
+            event = {**self._cases[instance_name], "routes": routes, **info}
+        else:
+            last = self._last_routes.get(instance_name, [])
+            changed = {i: r for i, r in enumerate(routes) if i >= len(last) or last[i] != r}
+            event = {"type": "step", "instance_name": instance_name, "changed": changed,
+                     "num_routes": len(routes), **info}
+        self._last_routes[instance_name] = routes
+        self._put(event)
+
+    def case_finished(self, instance_name, company_costs, elapsed=None):
+        if self._take_resync(instance_name):
+            # 最後のステップが届いていない可能性があるので、終了前に全体を送り直す
+            self._put({**self._cases[instance_name], "routes": self._last_routes.get(instance_name, []),
+                       "company_costs": company_costs, "total_cost": sum(company_costs), "elapsed": elapsed})
+        self._put({"type": "done", "instance_name": instance_name, "company_costs": company_costs,
+                   "total_cost": sum(company_costs), "elapsed": elapsed})
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=self.timeout * 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="最適化の途中経過を vrp-viewer へ SSE で配信するサーバ")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    try:
+        asyncio.run(ProgressServer(args.host, args.port).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
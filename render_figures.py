@@ -0,0 +1,96 @@
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# ワーカープロセス内の RoutePlotter（initializer で1つ作り、担当ステップ間で使い回す）
+_plotter = None
+
+
+def _step_number(path):
+    m = re.search(r"step_(\d+)\.json$", os.path.basename(path))
+    return int(m.group(1)) if m else 10**9
+
+
+def _init_worker(customers, depot_id_list, vehicle_num_list, instance_name, output_dir, cost_history):
+    global _plotter
+    from visualizer import RoutePlotter
+    _plotter = RoutePlotter(customers, depot_id_list, vehicle_num_list, instance_name=instance_name,
+                            output_dir=output_dir, clear_on_initial=False)
+    # 改善率の基準（初期解・ボロノイ後・前ステップ）はどのワーカーでも同じ値を使う
+    _plotter.cost_history.update(cost_history)
+
+
+def _render_chunk(steps):
+    return [_plotter.plot(routes, step) for step, routes in steps]
+
+
+def render_case(case_dir, output_dir="figures", workers=None):
+    """
+    web_data/<instance>/step_*.json（または packed 形式）から figures/<instance>/routes_iter_*.png を作り直す。
+    ステップを連続した塊に分けてプロセス並列で描く（各プロセスは RoutePlotter を1つだけ作る）。
+    """
+    from visualizer import _company_costs
+
+    from web_exporter import PACKED_MANIFEST, load_packed_steps
+
+    step_paths = sorted(glob.glob(os.path.join(case_dir, "step_*.json")), key=_step_number)
+    steps = []
+    for path in step_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            steps.append((_step_number(path), json.load(f)))
+    if not steps and os.path.isfile(os.path.join(case_dir, PACKED_MANIFEST)):
+        steps = [(data["step_index"], data) for data in load_packed_steps(case_dir)]
+    if not steps:
+        raise FileNotFoundError(f"step_*.json / {PACKED_MANIFEST} がありません: {case_dir}")
+
+    first = steps[0][1]
+    instance_name = first.get("instance_name") or os.path.basename(os.path.normpath(case_dir))
+    customers = first["customers"]
+    vehicle_num_list = first["vehicle_num_list"]
+    depot_id_list = first["depot_id_list"]
+    id_to_coord = {c["id"]: (c["x"], c["y"]) for c in customers}
+    cost_history = {}
+    for step, data in steps:
+        company, total = _company_costs(data["routes"], id_to_coord, vehicle_num_list)
+        cost_history[step] = {"company": company, "total": total}
+
+    instance_folder = os.path.join(output_dir, instance_name)
+    if os.path.isdir(instance_folder):
+        shutil.rmtree(instance_folder)
+    os.makedirs(instance_folder, exist_ok=True)
+
+    items = [(step, data["routes"]) for step, data in steps]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(items)))
+    size = -(-len(items) // workers)
+    chunks = [items[k:k + size] for k in range(0, len(items), size)]
+    initargs = (customers, depot_id_list, vehicle_num_list, instance_name, output_dir, cost_history)
+    if workers == 1:
+        _init_worker(*initargs)
+        return _render_chunk(items)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        return [path for paths in pool.map(_render_chunk, chunks) for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="出力済みの step JSON から経路図をまとめて作り直す（最適化の後でオフライン実行）")
+    parser.add_argument("instances", nargs="*", help="インスタンス名（既定は web_data 以下の全て）")
+    parser.add_argument("--web-data", default="web_data", help="step JSON のルート（export_vrp_state の output_root）")
+    parser.add_argument("--output", default="figures")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定は CPU 数）")
+    args = parser.parse_args()
+
+    names = args.instances or sorted(d for d in os.listdir(args.web_data)
+                                     if os.path.isdir(os.path.join(args.web_data, d)))
+    for name in names:
+        start = time.perf_counter()
+        paths = render_case(os.path.join(args.web_data, name), args.output, args.workers)
+        print(f">>> {name}: {len(paths)} 枚（{time.perf_counter() - start:.2f} 秒）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import csv
+import json
+import time
+from collections import OrderedDict
+from tabulate import tabulate
+from flexible_vrp_solver import solve_vrp_flexible, route_cost
+from solver_corpus import disable_recording, iter_corpus, subproblem_kwargs
+
+
+def parse_options(option_list):
+    """["time_limit=0.5", "local_search_metaheuristic=GUIDED_LOCAL_SEARCH"] → dict（値はJSONとして解釈できれば数値等に）"""
+    options = {}
+    for item in option_list or []:
+        key, _, value = item.partition("=")
+        try:
+            options[key] = json.loads(value)
+        except json.JSONDecodeError:
+            options[key] = value
+    return options
+
+
+def replay_one(kwargs, search_options):
+    """1件を解き (経過秒, 目的値=総距離 or None) を返す"""
+    start = time.perf_counter()
+    routes = solve_vrp_flexible(**kwargs, search_options=search_options)
+    elapsed = time.perf_counter() - start
+    if routes is None:
+        return elapsed, None
+    return elapsed, sum(route_cost(r, kwargs["customers"]) for r in routes)
+
+
+def _quantile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(results, with_baseline):
+    """phase ごとに 時間・目的値 の分布をまとめる"""
+    groups = OrderedDict()
+    for r in results:
+        groups.setdefault(r["phase"], []).append(r)
+    rows = []
+    for phase, rs in groups.items():
+        times = [r["time"] for r in rs]
+        objs = [r["objective"] for r in rs if r["objective"] is not None]
+        row = {
+            "phase": phase,
+            "n": len(rs),
+            "failed": len(rs) - len(objs),
+            "time_total": sum(times),
+            "time_mean": sum(times) / len(times),
+            "time_p50": _quantile(times, 0.5),
+            "time_p95": _quantile(times, 0.95),
+            "time_max": max(times),
+            "obj_mean": sum(objs) / len(objs) if objs else 0.0,
+        }
+        if with_baseline:
+            base_times = [r["base_time"] for r in rs]
+            ratios = [r["objective"] / r["base_objective"] for r in rs
+                      if r["objective"] is not None and r["base_objective"]]
+            row["speedup"] = sum(base_times) / sum(times) if sum(times) > 0 else 0.0
+            row["obj_ratio_mean"] = sum(ratios) / len(ratios) if ratios else 0.0
+            row["obj_worse"] = sum(1 for x in ratios if x > 1.0 + 1e-9)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記録済みの部分問題コーパスを別の探索設定で解き直して比較する")
+    parser.add_argument("corpus", help="コーパスのディレクトリ（VRP_RECORD_CORPUS）または corpus_*.jsonl.gz")
+    parser.add_argument("--phase", action="append", help="対象の phase（複数指定可。既定は全て）")
+    parser.add_argument("--limit", type=int, default=None, help="解き直す件数の上限")
+    parser.add_argument("--option", action="append", default=[],
+                        help="探索パラメータ上書き key=value（apply_search_options のキー）")
+    parser.add_argument("--baseline", action="store_true", help="既定設定でも解き、速度比・目的値比を出す")
+    parser.add_argument("--csv", help="部分問題ごとの結果を書き出すCSV")
+    args = parser.parse_args()
+
+    disable_recording()  # リプレイ中に自分自身を記録しない
+    options = parse_options(args.option)
+    results = []
+    for k, record in enumerate(iter_corpus(args.corpus)):
+        if args.limit is not None and len(results) >= args.limit:
+            break
+        if args.phase and record["phase"] not in args.phase:
+            continue
+        kwargs = subproblem_kwargs(record)
+        t, obj = replay_one(kwargs, options)
+        result = {"index": k, "phase": record["phase"], "nodes": len(kwargs["customers"]),
+                  "vehicles": kwargs["num_vehicles"], "time": t, "objective": obj}
+        if args.baseline:
+            result["base_time"], result["base_objective"] = replay_one(kwargs, None)
+        results.append(result)
+
+    if not results:
+        print("対象の部分問題がありません。")
+        return
+    print(f"探索設定: {options or '既定'}")
+    print(tabulate(summarize(results, args.baseline), headers="keys", floatfmt=".3f"))
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import math
+
+
+def travel_time(a, b):
+    """ソルバーと同じ距離（int(hypot)）。a, b は顧客dict"""
+    return int(math.hypot(a['x'] - b['x'], a['y'] - b['y']))
+
+
+def euclid(a, b):
+    return math.hypot(a['x'] - b['x'], a['y'] - b['y'])
+
+
+def is_route_feasible(route, id_to_node, vehicle_capacity):
+    """
+    デポ始終のルートが 容量・時間枠・PD順序 を満たすかを判定する。
+    時間の扱いは solve_vrp_flexible の Time 次元に合わせる（移動=int距離+出発ノードのサービス時間、待機可）。
+    """
+    if len(route) < 2:
+        return True
+    load = 0
+    t = id_to_node[route[0]]['ready']
+    seen = set()
+    for k in range(1, len(route)):
+        prev = id_to_node[route[k - 1]]
+        node = id_to_node[route[k]]
+        t = max(node['ready'], t + travel_time(prev, node) + prev['service'])
+        if t > node['due']:
+            return False
+        if k < len(route) - 1:
+            load += node['demand']
+            if load < 0 or load > vehicle_capacity:
+                return False
+            # delivery は対応する pickup の後でなければならない
+            p = node.get('pickup_index', 0)
+            if node['demand'] < 0 and p > 0 and p in id_to_node and p not in seen:
+                return False
+            seen.add(node['id'])
+    return True
+
+
+def route_length(route, id_to_node):
+    return sum(euclid(id_to_node[route[k]], id_to_node[route[k + 1]]) for k in range(len(route) - 1))
+
+
+def cheapest_pd_insertion(route, pickup_id, delivery_id, id_to_node, vehicle_capacity):
+    """
+    1本のルートに PD ペアを挿入する最安の実行可能位置を探す。
+    戻り値: (増加コスト, 挿入後ルート)。実行可能な位置が無ければ None。
+    """
+    p = id_to_node[pickup_id]
+    d = id_to_node[delivery_id]
+    best = None
+    # route[0], route[-1] はデポ。pickup を位置 i、delivery を位置 j（i<=j）の直後に挿入
+    for i in range(len(route) - 1):
+        a = id_to_node[route[i]]
+        b = id_to_node[route[i + 1]]
+        for j in range(i, len(route) - 1):
+            if j == i:
+                delta = euclid(a, p) + euclid(p, d) + euclid(d, b) - euclid(a, b)
+            else:
+                c = id_to_node[route[j]]
+                e = id_to_node[route[j + 1]]
+                delta = (euclid(a, p) + euclid(p, b) - euclid(a, b)
+                         + euclid(c, d) + euclid(d, e) - euclid(c, e))
+            if best is not None and delta >= best[0]:
+                continue
+            candidate = route[:i + 1] + [pickup_id] + route[i + 1:j + 1] + [delivery_id] + route[j + 1:]
+            if is_route_feasible(candidate, id_to_node, vehicle_capacity):
+                best = (delta, candidate)
+    return best
+
+
+def insert_pd_pairs(routes, pairs, id_to_node, vehicle_capacity):
+    """
+    PD ペアを順に「全ルート中の最安実行可能位置」へ挿入する。
+    戻り値: (挿入後ルート, 挿入できなかったペアのリスト)
+    """
+    routes = [list(r) for r in routes]
+    # 時間枠の早いペアから入れる（後から入れるペアの選択肢を潰しにくい）
+    ordered = sorted(pairs, key=lambda pd: (id_to_node[pd[0]]['ready'], id_to_node[pd[1]]['due']))
+    unrouted = []
+    for pickup_id, delivery_id in ordered:
+        best = None
+        best_vehicle = None
+        for v, route in enumerate(routes):
+            ins = cheapest_pd_insertion(route, pickup_id, delivery_id, id_to_node, vehicle_capacity)
+            if ins is not None and (best is None or ins[0] < best[0]):
+                best = ins
+                best_vehicle = v
+        if best is None:
+            unrouted.append((pickup_id, delivery_id))
+            continue
+        routes[best_vehicle] = best[1]
+    return routes, unrouted
+
+
+def project_routes(prev_routes, node_ids, pd_pairs, id_to_node, vehicle_capacity):
+    """
+    前回のルートを新しいタスク集合 node_ids に射影する。
+      - node_ids に含まれないノード（移管されたペア）はルートから落とす（訪問順は維持）
+      - 新たに担当となった PD ペアは最安実行可能挿入で追加する
+    戻り値: (射影後ルート, 挿入できなかったペアのリスト)
+    """
+    projected = []
+    for r in prev_routes:
+        if len(r) >= 2:
+            projected.append([r[0]] + [n for n in r[1:-1] if n in node_ids] + [r[-1]])
+        else:
+            projected.append(list(r))
+
+    kept = set()
+    for r in projected:
+        kept.update(r[1:-1])
+    gained = [(p, d) for p, d in pd_pairs if p not in kept and d not in kept]
+    return insert_pd_pairs(projected, gained, id_to_node, vehicle_capacity)
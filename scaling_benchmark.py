@@ -0,0 +1,140 @@
+import argparse
+import csv
+import resource
+import time
+import tracemalloc
+import traceback
+from tabulate import tabulate
+from flexible_vrp_solver import route_cost
+from gat import initialize_individual_vrps, perform_gat_exchange
+from instance_generator import compose_case
+from voronoi_allocator import perform_voronoi_routing
+from pipeline import split_routes_by_company, filter_subcustomers_by_routes, filter_pd_pairs_for_nodes
+
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(name, func, rows, context, trace_memory=False):
+    """
+    func() を実行し、経過秒・プロセス最大RSS（とそのフェーズでの増加分）を rows に追加する（失敗も記録）。
+    時間は tracemalloc なしで計る（トレース中は全アロケーションが遅くなるため）。
+    trace_memory=True なら、続けてもう1回 tracemalloc 付きで実行して Python ヒープのピークを記録する。
+    """
+    rss_before = _max_rss_mb()
+    start = time.perf_counter()
+    result, status = None, "ok"
+    try:
+        result = func()
+        if result is None:
+            status = "infeasible"
+    except Exception as e:  # どの規模で何が壊れるかを見るのが目的なので、止めずに記録する
+        status = f"error: {type(e).__name__}: {e}"
+        traceback.print_exc()
+    elapsed = time.perf_counter() - start
+    rss_after = _max_rss_mb()
+
+    peak = None
+    if trace_memory and status == "ok":
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    rows.append({
+        **context,
+        "phase": name,
+        "status": status,
+        "time_s": elapsed,
+        "py_peak_mb": peak,
+        "max_rss_mb": rss_after,
+        "rss_growth_mb": rss_after - rss_before,
+    })
+    return result
+
+
+def run_scale_point(num_lsps, num_pairs, source, gat_rounds, spacing, seed, trace_memory=False):
+    """1つの規模（LSP数 × 1社あたりのタスク数）で 初期解 → ボロノイ → 社内GAT を実行し、フェーズ別の計測行を返す"""
+    if source:
+        sources = [source] * num_lsps
+    else:
+        sources = [{"num_pairs": num_pairs} for _ in range(num_lsps)]
+    case = compose_case(sources, spacing=spacing, seed=seed)
+    customers, PD_pairs = case['customers'], case['PD_pairs']
+    vehicle_num_list, depot_id_list = case['vehicle_num_list'], case['depot_id_list']
+    vehicle_capacity = case['vehicle_capacity']
+
+    context = {"lsps": num_lsps, "pairs": len(PD_pairs), "nodes": len(customers), "vehicles": sum(vehicle_num_list)}
+    rows = []
+
+    routes = _measure("initial", lambda: initialize_individual_vrps(
+        customers, PD_pairs, num_lsps, vehicle_num_list, depot_id_list, vehicle_capacity=vehicle_capacity
+    ), rows, context, trace_memory)
+    if not routes:
+        return rows
+
+    routes = _measure("voronoi", lambda: perform_voronoi_routing(
+        customers, PD_pairs, depot_id_list, vehicle_num_list, vehicle_capacity
+    ), rows, context, trace_memory)
+    if not routes:
+        return rows
+
+    def gat_round():
+        out = []
+        for company_routes in split_routes_by_company(routes, vehicle_num_list):
+            sub_customers = filter_subcustomers_by_routes(customers, company_routes)
+            sub_PD_pairs = filter_pd_pairs_for_nodes(PD_pairs, {c['id'] for c in sub_customers})
+            out.extend(perform_gat_exchange(
+                company_routes, sub_customers, sub_PD_pairs, vehicle_capacity, [len(company_routes)]
+            ))
+        return out
+
+    for k in range(gat_rounds):
+        new_routes = _measure(f"gat{k + 1}", gat_round, rows, context, trace_memory)
+        if not new_routes:
+            break
+        routes = new_routes
+
+    peaks = [r["py_peak_mb"] for r in rows if r["py_peak_mb"] is not None]
+    rows.append({**context, "phase": "final", "status": "ok", "time_s": sum(r["time_s"] for r in rows),
+                 "py_peak_mb": max(peaks) if peaks else None, "max_rss_mb": rows[-1]["max_rss_mb"],
+                 "rss_growth_mb": sum(r["rss_growth_mb"] for r in rows),
+                 "cost": sum(route_cost(r, customers) for r in routes)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LSP数・タスク数を変えてフェーズ別の時間とメモリを計測する")
+    parser.add_argument("--lsps", type=int, nargs="+", default=[2, 4, 8], help="LSP数（複数指定で掃引）")
+    parser.add_argument("--pairs", type=int, nargs="+", default=[50, 100],
+                        help="1社あたりのPDペア数（合成インスタンス時。複数指定で掃引）")
+    parser.add_argument("--source", help="合成の代わりに各社へ使う Li & Lim ファイル（例 data/LC1_2_2.txt）")
+    parser.add_argument("--gat-rounds", type=int, default=1, help="計測する社内GATのラウンド数")
+    parser.add_argument("--spacing", type=float, default=60.0, help="隣接LSPのデポ間隔（auto_offsets）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="各フェーズをもう1回 tracemalloc 付きで実行し、Python ヒープのピークも記録する（時間は約2倍）")
+    parser.add_argument("--csv", help="計測結果を書き出すCSV")
+    args = parser.parse_args()
+
+    pair_sizes = [None] if args.source else args.pairs
+    all_rows = []
+    for num_lsps in args.lsps:
+        for num_pairs in pair_sizes:
+            print(f">>> LSP {num_lsps} 社 × " + (args.source if args.source else f"{num_pairs} ペア"))
+            all_rows.extend(run_scale_point(num_lsps, num_pairs, args.source, args.gat_rounds,
+                                            args.spacing, args.seed, args.trace_memory))
+
+    print(tabulate(all_rows, headers="keys", floatfmt=".2f"))
+    if args.csv:
+        fieldnames = list(dict.fromkeys(k for r in all_rows for k in r))
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(all_rows)
+
+
+if __name__ == "__main__":
+    main()
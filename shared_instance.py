@@ -0,0 +1,116 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# ノード表の列（float64）。customers の dict と同じキー名
+NODE_FIELDS = ("id", "x", "y", "demand", "ready", "due", "service", "pickup_index", "delivery_index")
+INT_FIELDS = ("id", "demand", "ready", "due", "service", "pickup_index", "delivery_index")
+
+
+class SharedInstance:
+    """
+    1ケース分のインスタンスデータを multiprocessing.shared_memory に1回だけ公開し、
+    ワーカープロセスからは名前で attach して参照する（タスクごとのコピー・pickle を無くす）。
+
+    公開する配列:
+      - nodes:    ノード表（NODE_FIELDS の列, float64）
+      - dist:     距離行列（int32, ソルバーと同じ int(hypot)）
+      - time:     時間行列（int32, 距離 + 出発ノードのサービス時間）
+      - pd_index: PDペア（int64, [pickup_id, delivery_id] の行）
+
+    ワーカーにはノードIDのリストだけを渡し、customers_for / distance_submatrix で部分問題を組み立てる。
+    """
+
+    def __init__(self, blocks, owner):
+        self._blocks = blocks
+        self._owner = owner
+        n = blocks["nodes"][1][0]
+        self.nodes = self._view("nodes")
+        self.dist = self._view("dist")
+        self.time = self._view("time")
+        self.pd_index = self._view("pd_index")
+        self.id_to_row = {int(nid): row for row, nid in enumerate(self.nodes[:n, 0])}
+
+    def _view(self, key):
+        shm, shape, dtype = self._blocks[key]
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def publish(cls, customers, PD_pairs):
+        """customers / PD_pairs を共有メモリに書き出した所有者インスタンスを返す"""
+        n = len(customers)
+        nodes = np.array([[float(c.get(f, 0)) for f in NODE_FIELDS] for c in customers], dtype=np.float64)
+        xy = nodes[:, 1:3]
+        diff = xy[:, None, :] - xy[None, :, :]
+        dist = np.floor(np.hypot(diff[..., 0], diff[..., 1])).astype(np.int32)
+        time = dist + nodes[:, 6].astype(np.int32)[:, None]
+        pd_index = np.array(list(PD_pairs.items()), dtype=np.int64).reshape(-1, 2)
+
+        blocks = {}
+        for key, arr in (("nodes", nodes), ("dist", dist), ("time", time), ("pd_index", pd_index)):
+            shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            blocks[key] = (shm, arr.shape, arr.dtype)
+        inst = cls(blocks, owner=True)
+        assert len(inst.id_to_row) == n, "customers に重複IDがあります"
+        return inst
+
+    @property
+    def spec(self):
+        """ワーカーへ渡す小さな記述子（共有メモリ名・形状・型）"""
+        return {key: (shm.name, shape, np.dtype(dtype).str) for key, (shm, shape, dtype) in self._blocks.items()}
+
+    @classmethod
+    def attach(cls, spec):
+        blocks = {}
+        for key, (name, shape, dtype) in spec.items():
+            blocks[key] = (shared_memory.SharedMemory(name=name), tuple(shape), np.dtype(dtype))
+        return cls(blocks, owner=False)
+
+    def customers_for(self, node_ids):
+        """node_ids の順に customers 形式（dict のリスト）を組み立てる"""
+        out = []
+        for nid in node_ids:
+            row = self.nodes[self.id_to_row[nid]]
+            c = {f: float(v) for f, v in zip(NODE_FIELDS, row)}
+            for f in INT_FIELDS:
+                c[f] = int(c[f])
+            out.append(c)
+        return out
+
+    def distance_submatrix(self, node_ids):
+        rows = [self.id_to_row[nid] for nid in node_ids]
+        return self.dist[np.ix_(rows, rows)].tolist()
+
+    def time_submatrix(self, node_ids):
+        rows = [self.id_to_row[nid] for nid in node_ids]
+        return self.time[np.ix_(rows, rows)].tolist()
+
+    def node_arrays(self, node_ids):
+        """
+        node_ids の順の部分問題について flexible_vrp_solver.node_arrays と同じ dict を共有配列から作る
+        （行列は tolist で int になるので、ソルバー側でコピーし直さない）
+        """
+        rows = [self.id_to_row[nid] for nid in node_ids]
+        ix = np.ix_(rows, rows)
+        nodes = self.nodes[rows]
+        return {
+            "distance_matrix": self.dist[ix].tolist(),
+            "time_matrix": self.time[ix].tolist(),
+            "demands": nodes[:, 3].astype(np.int64).tolist(),
+            "time_windows": list(zip(nodes[:, 4].astype(np.int64).tolist(), nodes[:, 5].astype(np.int64).tolist())),
+        }
+
+    def pd_pairs(self):
+        return {int(p): int(d) for p, d in self.pd_index}
+
+    def close(self):
+        # numpy のビューが残っていると close できないので先に外す
+        self.nodes = self.dist = self.time = self.pd_index = None
+        for shm, _, _ in self._blocks.values():
+            shm.close()
+
+    def unlink(self):
+        if self._owner:
+            for shm, _, _ in self._blocks.values():
+                shm.unlink()
+
@@ -0,0 +1,100 @@
+import os
+import gzip
+import glob
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 記録先ディレクトリ。未設定なら記録しない。環境変数 VRP_RECORD_CORPUS でも指定可
+_corpus_dir = os.getenv("VRP_RECORD_CORPUS") or None
+
+# customers は dict ではなく、この列順の配列で保存する（キー名の繰り返しを省いて小さくする）
+CUSTOMER_FIELDS = ("id", "x", "y", "demand", "ready", "due", "service", "pickup_index", "delivery_index")
+
+
+def enable_recording(corpus_dir):
+    """solve_vrp_flexible に渡された部分問題を corpus_dir に記録する（子プロセスにも環境変数で引き継ぐ）"""
+    global _corpus_dir
+    os.makedirs(corpus_dir, exist_ok=True)
+    _corpus_dir = corpus_dir
+    os.environ["VRP_RECORD_CORPUS"] = corpus_dir
+
+
+def disable_recording():
+    global _corpus_dir
+    _corpus_dir = None
+    os.environ.pop("VRP_RECORD_CORPUS", None)
+
+
+def recording_enabled():
+    return _corpus_dir is not None
+
+
+def record_subproblem(phase, customers, initial_routes, PD_pairs, num_vehicles, vehicle_capacity,
+                      start_depots, end_depots, use_capacity, use_time, use_pickup_delivery, isGAT,
+                      cost_upper_bound=None):
+    """
+    部分問題1件を gzip 圧縮JSONL（プロセスごとのファイル）に追記する。
+    1件ずつ独立した gzip メンバーとして書くので、途中で落ちても書き終えた分は読める。
+    """
+    if _corpus_dir is None:
+        return
+    record = {
+        "phase": phase or "unknown",
+        "customers": [[c.get(f, 0) for f in CUSTOMER_FIELDS] for c in customers],
+        "PD_pairs": [list(pd) for pd in PD_pairs],
+        "num_vehicles": num_vehicles,
+        "vehicle_capacity": vehicle_capacity,
+        "start_depots": list(start_depots),
+        "end_depots": list(end_depots),
+        "initial_routes": [list(r) for r in initial_routes] if initial_routes is not None else None,
+        "flags": {
+            "use_capacity": use_capacity,
+            "use_time": use_time,
+            "use_pickup_delivery": use_pickup_delivery,
+            "isGAT": isGAT,
+        },
+        "cost_upper_bound": cost_upper_bound,
+    }
+    path = os.path.join(_corpus_dir, f"corpus_{os.getpid()}.jsonl.gz")
+    try:
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+    except OSError as e:
+        logger.warning(f"corpus の書き込みに失敗しました: {e}")
+
+
+def iter_corpus(path):
+    """ディレクトリ（corpus_*.jsonl.gz）または単一ファイルから記録を順に返す"""
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, "corpus_*.jsonl.gz")))
+    else:
+        files = [path]
+    for file in files:
+        try:
+            with gzip.open(file, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        except (OSError, EOFError) as e:
+            # 書き込み途中で終了したファイルの末尾は読み飛ばす
+            logger.warning(f"corpus の読み込みを途中で打ち切りました: {file} ({e})")
+
+
+def subproblem_kwargs(record):
+    """記録を solve_vrp_flexible のキーワード引数に戻す"""
+    customers = [dict(zip(CUSTOMER_FIELDS, row)) for row in record["customers"]]
+    kwargs = {
+        "customers": customers,
+        "initial_routes": record["initial_routes"],
+        "PD_pairs": [tuple(pd) for pd in record["PD_pairs"]],
+        "num_vehicles": record["num_vehicles"],
+        "vehicle_capacity": record["vehicle_capacity"],
+        "start_depots": record["start_depots"],
+        "end_depots": record["end_depots"],
+        "phase": record["phase"],
+        "cost_upper_bound": record.get("cost_upper_bound"),  # 上限の導入前に記録したものは None
+    }
+    kwargs.update(record["flags"])
+    return kwargs
@@ -0,0 +1,291 @@
+import os
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# ソルバー呼び出し時間のヒストグラム境界（秒）
+SOLVE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# メトリクス名 → (種類, 説明)
+METRICS = {
+    "vrp_solves_in_flight": ("gauge", "実行中の solve_vrp_flexible / 2車両部分問題の数"),
+    "vrp_solves_total": ("counter", "完了した solve の数（status=ok|failed）"),
+    "vrp_solve_duration_seconds": ("histogram", "solve 1回あたりの時間"),
+    "vrp_pairs_evaluated_total": ("counter", "ソルバーで評価した車両ペアの数"),
+    "vrp_pairs_skipped_total": ("counter", "ソルバーを呼ばずに飛ばした車両ペアの数（評価済み・境界外など）"),
+    "vrp_rounds_total": ("counter", "完了したラウンド数（GAT / 会社間交換）"),
+    "vrp_round": ("gauge", "ケースの現在のラウンド番号"),
+    "vrp_round_improvement_percent": ("gauge", "直近ラウンドの会社別改善率（lsp=total は全体）"),
+    "vrp_total_cost": ("gauge", "直近ラウンド後の総コスト"),
+    "vrp_last_progress_timestamp_seconds": ("gauge", "最後にラウンドが完了した時刻（停滞の検知用）"),
+    "vrp_pair_workers": ("gauge", "2車両部分問題のワーカー数"),
+    "vrp_pair_worker_busy_seconds_total": ("counter", "ワーカーが部分問題を解いていた時間の合計"),
+    "vrp_pair_worker_utilization": ("gauge", "直近バッチのワーカー稼働率（busy / (経過時間 × ワーカー数)）"),
+    "vrp_cases_completed_total": ("counter", "完了したケース数"),
+    "vrp_case_elapsed_seconds": ("gauge", "ケースの実行時間"),
+}
+
+# 有効化されたレジストリ。None なら全ての記録関数は何もしない
+_registry = None
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class MetricsRegistry:
+    """プロセス内のメトリクス（カウンタ・ゲージ・ヒストグラム）。ワークキューのスレッドからも更新される"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {name: {} for name in METRICS}   # name → {ラベル: 値}（histogram は [バケット..., sum, count]）
+
+    def inc(self, name, amount=1.0, **labels):
+        with self._lock:
+            series = self._values[name]
+            key = _key(labels)
+            series[key] = series.get(key, 0.0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[name][_key(labels)] = float(value)
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self._values[name]
+            key = _key(labels)
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = [0] * len(SOLVE_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(SOLVE_BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def snapshot(self):
+        """カウンタとヒストグラムの値のコピー（別プロセスで記録した分を merge で親に足し込む用。ゲージは含めない）"""
+        with self._lock:
+            return {name: {key: list(value) if isinstance(value, list) else value for key, value in series.items()}
+                    for name, series in self._values.items() if METRICS[name][0] != "gauge" and series}
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, series in snapshot.items():
+                target = self._values[name]
+                for key, value in series.items():
+                    if isinstance(value, list):
+                        hist = target.setdefault(key, [0] * len(SOLVE_BUCKETS) + [0.0, 0])
+                        for i, v in enumerate(value):
+                            hist[i] += v
+                    else:
+                        target[key] = target.get(key, 0.0) + value
+
+    def render(self):
+        """Prometheus のテキスト形式（exposition format 0.0.4）"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in METRICS.items():
+                series = self._values[name]
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(series.items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{_format_labels(key)} {float(value)!r}")
+                        continue
+                    for bound, count in zip(SOLVE_BUCKETS, value):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {value[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {float(value[-2])!r}")
+                    lines.append(f"{name}_count{_format_labels(key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def enable_metrics():
+    """記録を有効にして（既に有効なら同じ）レジストリを返す"""
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
+
+
+def disable_metrics():
+    global _registry
+    _registry = None
+
+
+def metrics_enabled():
+    return _registry is not None
+
+
+# === 記録（無効時は何もしない）===
+def solve_started(phase):
+    if _registry is not None:
+        _registry.inc("vrp_solves_in_flight", 1, phase=phase or "unknown")
+
+
+def solve_finished(phase, seconds, ok=True):
+    if _registry is not None:
+        phase = phase or "unknown"
+        _registry.inc("vrp_solves_in_flight", -1, phase=phase)
+        _registry.inc("vrp_solves_total", 1, phase=phase, status="ok" if ok else "failed")
+        _registry.observe("vrp_solve_duration_seconds", seconds, phase=phase)
+
+
+def pairs_evaluated(phase, count):
+    if _registry is not None and count:
+        _registry.inc("vrp_pairs_evaluated_total", count, phase=phase)
+
+
+def pairs_skipped(phase, count):
+    if _registry is not None and count:
+        _registry.inc("vrp_pairs_skipped_total", count, phase=phase)
+
+
+def round_finished(instance, phase, round_number, prev_company_costs, curr_company_costs):
+    """ラウンドの会社別・全体の改善率と総コストを記録する"""
+    if _registry is None:
+        return
+    _registry.inc("vrp_rounds_total", 1, phase=phase)
+    _registry.set("vrp_round", round_number, instance=instance, phase=phase)
+    for lsp, (prev, curr) in enumerate(zip(prev_company_costs, curr_company_costs), 1):
+        _registry.set("vrp_round_improvement_percent", (prev - curr) / prev * 100.0 if prev > 0 else 0.0,
+                      instance=instance, phase=phase, lsp=lsp)
+    prev_total, curr_total = sum(prev_company_costs), sum(curr_company_costs)
+    _registry.set("vrp_round_improvement_percent",
+                  (prev_total - curr_total) / prev_total * 100.0 if prev_total > 0 else 0.0,
+                  instance=instance, phase=phase, lsp="total")
+    _registry.set("vrp_total_cost", curr_total, instance=instance)
+    _registry.set("vrp_last_progress_timestamp_seconds", time.time(), instance=instance)
+
+
+def workers_changed(backend, count):
+    if _registry is not None:
+        _registry.set("vrp_pair_workers", count, backend=backend)
+
+
+def batch_finished(backend, workers, busy_seconds, wall_seconds):
+    """map_pairs 1回分のワーカー稼働時間と稼働率を記録する"""
+    if _registry is None:
+        return
+    _registry.inc("vrp_pair_worker_busy_seconds_total", busy_seconds, backend=backend)
+    if workers > 0 and wall_seconds > 0:
+        _registry.set("vrp_pair_worker_utilization", min(1.0, busy_seconds / (wall_seconds * workers)),
+                      backend=backend)
+
+
+def case_finished(instance, elapsed):
+    if _registry is not None:
+        _registry.inc("vrp_cases_completed_total", 1)
+        _registry.set("vrp_case_elapsed_seconds", elapsed, instance=instance)
+
+
+def run_with_metrics(fn, *args):
+    """
+    子プロセスで fn(*args) を実行し、(戻り値, その間に記録したカウンタ・ヒストグラム) を返す。
+    子プロセスの記録は親のレジストリに届かないので、親は受け取った値を merge_metrics で足し込む。
+    （プロセスプールのタスク専用。呼び出しの間だけ専用のレジストリに差し替える）
+    """
+    global _registry
+    _registry = MetricsRegistry()
+    try:
+        return fn(*args), _registry.snapshot()
+    finally:
+        _registry = None
+
+
+def merge_metrics(snapshot):
+    if _registry is not None and snapshot:
+        _registry.merge(snapshot)
+
+
+def render_metrics():
+    return _registry.render() if _registry is not None else ""
+
+
+# === 公開（HTTP / テキストファイル）===
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format % args)
+
+
+class MetricsExporter:
+    """
+    レジストリを Prometheus から読めるようにする。
+      port > 0 … http://host:port/metrics で公開（port はバックグラウンドスレッドで待ち受け）
+      path     … interval 秒ごとに Prometheus テキスト形式で書き出す（node_exporter の textfile collector 用）
+    close() で待ち受けを止め、ファイルには最後の値を書いてから終わる。
+    """
+
+    def __init__(self, port=0, path="", interval=15.0, host="127.0.0.1"):
+        enable_metrics()
+        self.path = path
+        self.interval = interval
+        self._server = None
+        self._stop = threading.Event()
+        self._threads = []
+        if port:
+            self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            self._threads.append(threading.Thread(target=self._server.serve_forever, daemon=True))
+            logger.info(f"metrics: http://{host}:{self._server.server_address[1]}/metrics")
+        if path:
+            self._threads.append(threading.Thread(target=self._write_loop, daemon=True))
+        for t in self._threads:
+            t.start()
+
+    @property
+    def port(self):
+        return self._server.server_address[1] if self._server is not None else None
+
+    def write_file(self):
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(render_metrics())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"metrics の書き込みに失敗しました: {e}")
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self.write_file()
+
+    def close(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for t in self._threads:
+            t.join(timeout=5)
+        if self.path:
+            self.write_file()
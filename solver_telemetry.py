@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 出力先（JSONL）。未設定なら計測しない。環境変数 VRP_TELEMETRY_PATH でも指定可
+_telemetry_path = os.getenv("VRP_TELEMETRY_PATH") or None
+
+# RoutingModel.status() の数値 → 名前
+ROUTING_STATUS_NAMES = {
+    0: "ROUTING_NOT_SOLVED",
+    1: "ROUTING_SUCCESS",
+    2: "ROUTING_PARTIAL_SUCCESS_LOCAL_OPTIMUM_NOT_REACHED",
+    3: "ROUTING_FAIL",
+    4: "ROUTING_FAIL_TIMEOUT",
+    5: "ROUTING_INVALID",
+    6: "ROUTING_INFEASIBLE",
+    7: "ROUTING_OPTIMAL",
+}
+
+
+def enable_telemetry(path, reset=False):
+    """
+    solve_vrp_flexible の呼び出しごとのイベントを path（JSONL）へ追記するよう設定する。
+    - reset=True なら既存ファイルを空にする（ケース単位で取り直す場合）
+    - 子プロセスにも引き継がれるよう環境変数 VRP_TELEMETRY_PATH も更新する
+    """
+    global _telemetry_path
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    if reset and os.path.exists(path):
+        os.remove(path)
+    _telemetry_path = path
+    os.environ["VRP_TELEMETRY_PATH"] = path
+
+
+def disable_telemetry():
+    global _telemetry_path
+    _telemetry_path = None
+    os.environ.pop("VRP_TELEMETRY_PATH", None)
+
+
+def telemetry_enabled():
+    return _telemetry_path is not None
+
+
+def status_name(status):
+    return ROUTING_STATUS_NAMES.get(status, str(status))
+
+
+def record_solve_event(phase, num_nodes, num_vehicles, num_pd, build_time, solve_time,
+                       status, objective, warm_start):
+    """1回の solve_vrp_flexible 呼び出しを1行のJSONとして追記する（無効時は何もしない）"""
+    if _telemetry_path is None:
+        return None
+    event = {
+        "ts": time.time(),
+        "pid": os.getpid(),
+        "phase": phase or "unknown",
+        "num_nodes": num_nodes,
+        "num_vehicles": num_vehicles,
+        "num_pd": num_pd,
+        "build_time": round(build_time, 6),
+        "solve_time": round(solve_time, 6),
+        "status": status,
+        "objective": objective,
+        "warm_start": bool(warm_start),
+    }
+    # 1イベント=1回の短い追記なので、複数プロセスから書いても行が混ざらない
+    try:
+        with open(_telemetry_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"telemetry の書き込みに失敗しました: {e}")
+    return event
+
+
+def load_events(path):
+    """JSONL を読み込み、イベントのリストを返す（壊れた行は読み飛ばす）"""
+    events = []
+    if not os.path.isfile(path):
+        return events
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return events
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def summarize_events(events):
+    """
+    phase ごとに集計した行（dict）のリストを返す。
+      calls / failed / warm_start / 平均ノード数 / build・solve 時間（合計・平均・p95・最大）/ 時間シェア
+    """
+    groups = OrderedDict()
+    for e in events:
+        groups.setdefault(e.get("phase", "unknown"), []).append(e)
+
+    grand_total = sum(e.get("build_time", 0.0) + e.get("solve_time", 0.0) for e in events)
+    rows = []
+    for phase, evs in groups.items():
+        solve_times = sorted(e.get("solve_time", 0.0) for e in evs)
+        build_total = sum(e.get("build_time", 0.0) for e in evs)
+        solve_total = sum(solve_times)
+        rows.append({
+            "phase": phase,
+            "calls": len(evs),
+            "failed": sum(1 for e in evs if e.get("objective") is None),
+            "warm_start": sum(1 for e in evs if e.get("warm_start")),
+            "mean_nodes": sum(e.get("num_nodes", 0) for e in evs) / len(evs),
+            "build_total": build_total,
+            "solve_total": solve_total,
+            "solve_mean": solve_total / len(evs),
+            "solve_p95": _percentile(solve_times, 0.95),
+            "solve_max": solve_times[-1] if solve_times else 0.0,
+            "share(%)": (build_total + solve_total) / grand_total * 100.0 if grand_total > 0 else 0.0,
+        })
+    return rows
+
+
+def summarize_telemetry(path):
+    return summarize_events(load_events(path))
+
+
+def format_summary(rows):
+    from tabulate import tabulate
+    return tabulate(rows, headers="keys", floatfmt=".3f")
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("usage: python solver_telemetry.py <events.jsonl> [...]")
+        sys.exit(1)
+    all_events = []
+    for p in sys.argv[1:]:
+        all_events.extend(load_events(p))
+    print(format_summary(summarize_events(all_events)))
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# テストはリポジトリ直下のモジュール（parser.py など）を直接 import する
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_node(node_id, x, y, demand=0, ready=0, due=1000, service=0, pickup_index=0, delivery_index=0):
+    return {'id': node_id, 'x': x, 'y': y, 'demand': demand, 'ready': ready, 'due': due, 'service': service,
+            'pickup_index': pickup_index, 'delivery_index': delivery_index}
@@ -0,0 +1,64 @@
+import gzip
+
+import pytest
+
+from checkpoint import (checkpoint_path, phase_rank, save_checkpoint, load_checkpoint, checkpoint_matches,
+                        is_case_finished)
+
+FILE_PATHS = ["data/LC1_2_2.txt", "data/LC1_2_6.txt"]
+OFFSETS = [(0, 0), (42, -42)]
+
+
+def make_state(phase="gat", **extra):
+    return {"phase": phase, "file_paths": FILE_PATHS, "offsets": [list(o) for o in OFFSETS],
+            "gat_round": 3, "converged": [True, False], "gat_current_routes": [[0, 1, 2, 0], [5, 5]], **extra}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = checkpoint_path("case", str(tmp_path / "ckpt"))
+    state = make_state()
+    assert save_checkpoint(path, state) == path
+    assert load_checkpoint(path) == state
+    assert not (tmp_path / "ckpt" / "case.json.gz.tmp").exists()
+
+
+def test_save_rejects_unknown_phase(tmp_path):
+    with pytest.raises(ValueError):
+        save_checkpoint(str(tmp_path / "x.json.gz"), {"phase": "unknown"})
+
+
+def test_load_missing_or_broken_returns_none(tmp_path):
+    assert load_checkpoint(str(tmp_path / "missing.json.gz")) is None
+    broken = tmp_path / "broken.json.gz"
+    broken.write_bytes(b"not gzip")
+    assert load_checkpoint(str(broken)) is None
+    wrong = tmp_path / "wrong.json.gz"
+    with gzip.open(wrong, "wt") as f:
+        f.write('{"phase": "bogus"}')
+    assert load_checkpoint(str(wrong)) is None
+
+
+def test_phase_rank():
+    assert phase_rank(None) == -1
+    assert phase_rank({"phase": "initial"}) == 0
+    assert phase_rank({"phase": "gat"}) < phase_rank({"phase": "cross"}) < phase_rank({"phase": "done"})
+
+
+def test_checkpoint_matches_compares_files_and_offsets():
+    state = make_state()
+    assert checkpoint_matches(state, FILE_PATHS, OFFSETS)
+    assert checkpoint_matches(state, list(FILE_PATHS), [list(o) for o in OFFSETS])
+    assert not checkpoint_matches(state, FILE_PATHS, [(0, 0), (0, 0)])
+    assert not checkpoint_matches(state, FILE_PATHS[:1], OFFSETS[:1])
+    assert not checkpoint_matches({"phase": "gat"}, FILE_PATHS, OFFSETS)
+
+
+def test_is_case_finished(tmp_path):
+    path = str(tmp_path / "case.json.gz")
+    assert not is_case_finished(path, FILE_PATHS, OFFSETS)
+    save_checkpoint(path, make_state("cross"))
+    assert not is_case_finished(path, FILE_PATHS, OFFSETS)
+    save_checkpoint(path, make_state("done"))
+    assert is_case_finished(path, FILE_PATHS, OFFSETS)
+    # 同じ path でもオフセットが違うケースは完了扱いにしない
+    assert not is_case_finished(path, FILE_PATHS, [(0, 0), (30, 30)])
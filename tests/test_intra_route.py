@@ -0,0 +1,78 @@
+import itertools
+import random
+
+import pytest
+
+from conftest import make_node
+from route_insertion import is_route_feasible, route_length, travel_time
+from intra_route import exact_route_order, or_opt, optimize_routes
+
+
+def random_instance(seed, num_pairs, tight=False):
+    """ペア (1,2), (3,4), ... を持つインスタンス。tight なら時間枠を route=[0,1,2,...,0] の到着時刻の近くに絞る"""
+    rng = random.Random(seed)
+    nodes = [make_node(0, 50, 50, due=10000)]
+    for k in range(num_pairs):
+        p, d = 2 * k + 1, 2 * k + 2
+        nodes.append(make_node(p, rng.uniform(0, 100), rng.uniform(0, 100), demand=10, service=5,
+                               due=10000, delivery_index=d))
+        nodes.append(make_node(d, rng.uniform(0, 100), rng.uniform(0, 100), demand=-10, service=5,
+                               due=10000, pickup_index=p))
+    if tight:
+        t = 0
+        for prev, node in zip(nodes, nodes[1:]):
+            t += travel_time(prev, node) + prev['service']
+            node['ready'] = max(0, t - rng.randint(0, 150))
+            node['due'] = t + rng.randint(0, 60)
+    return {n['id']: n for n in nodes}
+
+
+def brute_force(route, id_to_node, vehicle_capacity):
+    best = None
+    for perm in itertools.permutations(route[1:-1]):
+        candidate = [route[0], *perm, route[-1]]
+        if is_route_feasible(candidate, id_to_node, vehicle_capacity):
+            length = route_length(candidate, id_to_node)
+            if best is None or length < best:
+                best = length
+    return best
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("tight", [False, True])
+def test_exact_order_matches_brute_force(seed, tight):
+    id_to_node = random_instance(seed, num_pairs=3, tight=tight)
+    route = [0, 1, 2, 3, 4, 5, 6, 0]
+    assert is_route_feasible(route, id_to_node, vehicle_capacity=20)
+    result = exact_route_order(route, id_to_node, vehicle_capacity=20)
+    assert sorted(result) == sorted(route)
+    assert is_route_feasible(result, id_to_node, vehicle_capacity=20)
+    assert route_length(result, id_to_node) == pytest.approx(brute_force(route, id_to_node, 20))
+
+
+def test_exact_order_keeps_route_without_alternative():
+    id_to_node = random_instance(0, num_pairs=1)
+    assert exact_route_order([0, 1, 2, 0], id_to_node, vehicle_capacity=20) == [0, 1, 2, 0]
+    assert exact_route_order([0, 0], id_to_node, vehicle_capacity=20) == [0, 0]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_or_opt_never_worsens_and_stays_feasible(seed):
+    id_to_node = random_instance(seed, num_pairs=8)
+    route = [0] + list(range(1, 17)) + [0]
+    result = or_opt(route, id_to_node, vehicle_capacity=40)
+    assert sorted(result) == sorted(route)
+    assert is_route_feasible(result, id_to_node, vehicle_capacity=40)
+    assert route_length(result, id_to_node) <= route_length(route, id_to_node) + 1e-9
+
+
+def test_optimize_routes_reports_gain():
+    id_to_node = random_instance(1, num_pairs=3)
+    routes = [[0, 1, 2, 3, 4, 5, 6, 0], [0, 0]]
+    new_routes, gain, changed = optimize_routes(routes, id_to_node, vehicle_capacity=30)
+    before = sum(route_length(r, id_to_node) for r in routes)
+    after = sum(route_length(r, id_to_node) for r in new_routes)
+    assert gain > 0
+    assert gain == pytest.approx(before - after)
+    assert changed == 1
+    assert new_routes[1] == [0, 0]
@@ -0,0 +1,39 @@
+from parser import parse_lilim
+
+HEADER = "25\t200\t1\n"
+ROWS = [
+    "0\t40\t50\t0\t0\t1236\t0\t0\t0",
+    "1\t45\t68\t10\t0\t1127\t90\t0\t2",
+    "2\t45\t70\t-10\t0\t1125\t90\t1\t0",
+    "3\t42\t66\t10\t0\t1129\t90\t0\t4",
+    "4\t42\t68\t-10\t727\t782\t90\t3\t0",
+]
+
+
+def write_instance(tmp_path, rows):
+    path = tmp_path / "instance.txt"
+    path.write_text(HEADER + "\n".join(rows) + "\n")
+    return str(path)
+
+
+def test_parse_with_offsets(tmp_path):
+    data = parse_lilim(write_instance(tmp_path, ROWS), x_offset=10, y_offset=-5, id_offset=100)
+    assert data["num_vehicles"] == 25
+    assert data["vehicle_capacity"] == 200
+    assert data["PD_pairs"] == {101: 102, 103: 104}
+    assert data["depot_id"] == 100
+    assert data["depot_coord"] == (50.0, 45.0)
+    assert data["customers"][2]["pickup_index"] == 101
+
+
+def test_dangling_pair_drops_orphan_node(tmp_path):
+    # 切り詰めたファイル：pickup 3 の delivery 4 が無い
+    data = parse_lilim(write_instance(tmp_path, ROWS[:4]))
+    assert data["PD_pairs"] == {1: 2}
+    assert [c["id"] for c in data["customers"]] == [0, 1, 2]
+
+
+def test_orphan_delivery_is_dropped(tmp_path):
+    data = parse_lilim(write_instance(tmp_path, ROWS[:3] + ROWS[4:]))
+    assert data["PD_pairs"] == {1: 2}
+    assert [c["id"] for c in data["customers"]] == [0, 1, 2]
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from progress_server import ProgressServer, ProgressPublisher
+
+
+@pytest.fixture
+def publisher():
+    # 送信スレッドは止めておき、キューに積まれたイベントをテスト側で取り出す
+    pub = ProgressPublisher("http://127.0.0.1:9")
+    pub.close()
+    return pub
+
+
+def drain(pub):
+    events = []
+    while not pub._queue.empty():
+        # POST と同じく JSON を通す（changed のキーは文字列になる）
+        events.append(json.loads(json.dumps(pub._queue.get_nowait())))
+    return events
+
+
+def deliver(server, events):
+    for event in events:
+        server._apply(event)
+
+
+def start_case(pub, server):
+    pub.case_started("case", [{"id": 0}], {}, [0], [3])
+    deliver(server, drain(pub))
+
+
+def test_steps_send_only_changed_routes(publisher):
+    server = ProgressServer()
+    start_case(publisher, server)
+    publisher.step("case", 0, "initial", [[0, 1, 0], [0, 2, 0], [0, 0]], [10.0, 5.0])
+    publisher.step("case", 1, "gat", [[0, 1, 0], [0, 2, 3, 0], [0, 0]], [10.0, 4.0])
+    events = drain(publisher)
+    assert events[1]["changed"] == {"1": [0, 2, 3, 0]}
+    deliver(server, events)
+    state = server.states["case"]
+    assert state["routes"] == [[0, 1, 0], [0, 2, 3, 0], [0, 0]]
+    assert state["step_index"] == 1
+    assert state["phase"] == "gat"
+    assert state["total_cost"] == pytest.approx(14.0)
+
+
+def test_step_truncates_removed_vehicles(publisher):
+    server = ProgressServer()
+    start_case(publisher, server)
+    publisher.step("case", 0, "initial", [[0, 1, 0], [0, 2, 0], [0, 3, 0]], [1.0])
+    publisher.step("case", 1, "gat", [[0, 1, 2, 0]], [1.0])
+    deliver(server, drain(publisher))
+    assert server.states["case"]["routes"] == [[0, 1, 2, 0]]
+
+
+def test_lost_step_is_resynced_with_snapshot(publisher):
+    server = ProgressServer()
+    start_case(publisher, server)
+    publisher.step("case", 0, "initial", [[0, 1, 0], [0, 2, 0]], [1.0])
+    lost = drain(publisher)
+    publisher._lost(lost[0])   # POST 失敗と同じ扱い（サーバには届かない）
+    publisher.step("case", 1, "gat", [[0, 1, 0], [0, 2, 3, 0]], [0.5])
+    events = drain(publisher)
+    assert [e["type"] for e in events] == ["case"]
+    deliver(server, events)
+    state = server.states["case"]
+    assert state["routes"] == [[0, 1, 0], [0, 2, 3, 0]]
+    assert state["step_index"] == 1
+    # 以降は再び差分に戻る
+    publisher.step("case", 2, "gat", [[0, 1, 3, 0], [0, 2, 0]], [0.4])
+    events = drain(publisher)
+    assert events[0]["type"] == "step"
+    deliver(server, events)
+    assert server.states["case"]["routes"] == [[0, 1, 3, 0], [0, 2, 0]]
+
+
+def test_case_finished_resyncs_before_done(publisher):
+    server = ProgressServer()
+    start_case(publisher, server)
+    publisher.step("case", 0, "initial", [[0, 1, 0]], [1.0])
+    publisher._lost(drain(publisher)[0])
+    publisher.case_finished("case", [1.0], elapsed=2.0)
+    events = drain(publisher)
+    assert [e["type"] for e in events] == ["case", "done"]
+    deliver(server, events)
+    assert server.states["case"]["routes"] == [[0, 1, 0]]
+    assert server.states["case"]["done"] is True
+
+
+def test_step_before_case_is_ignored():
+    server = ProgressServer()
+    assert server._apply({"type": "step", "instance_name": "other", "changed": {}}) == (None, None)
+    assert "other" not in server.states
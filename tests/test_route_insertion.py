@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import make_node
+from route_insertion import is_route_feasible, route_length, cheapest_pd_insertion, project_routes
+
+
+@pytest.fixture
+def id_to_node():
+    # デポ 0、ペア (1→2) と (3→4)
+    nodes = [
+        make_node(0, 0, 0),
+        make_node(1, 10, 0, demand=5, delivery_index=2),
+        make_node(2, 20, 0, demand=-5, pickup_index=1),
+        make_node(3, 0, 10, demand=5, delivery_index=4),
+        make_node(4, 0, 20, demand=-5, pickup_index=3),
+    ]
+    return {n['id']: n for n in nodes}
+
+
+def test_route_length(id_to_node):
+    assert route_length([0, 1, 2, 0], id_to_node) == pytest.approx(40.0)
+    assert route_length([0, 0], id_to_node) == 0.0
+
+
+def test_feasible_route(id_to_node):
+    assert is_route_feasible([0, 1, 2, 0], id_to_node, vehicle_capacity=10)
+    assert is_route_feasible([0, 0], id_to_node, vehicle_capacity=10)
+
+
+def test_delivery_before_pickup_is_infeasible(id_to_node):
+    assert not is_route_feasible([0, 2, 1, 0], id_to_node, vehicle_capacity=10)
+
+
+def test_capacity_violation(id_to_node):
+    assert not is_route_feasible([0, 1, 3, 2, 4, 0], id_to_node, vehicle_capacity=9)
+    assert is_route_feasible([0, 1, 3, 2, 4, 0], id_to_node, vehicle_capacity=10)
+
+
+def test_time_window_violation(id_to_node):
+    id_to_node[2]['due'] = 15   # デポ→1→2 で到着は 20
+    assert not is_route_feasible([0, 1, 2, 0], id_to_node, vehicle_capacity=10)
+
+
+def test_cheapest_insertion_into_empty_route(id_to_node):
+    delta, route = cheapest_pd_insertion([0, 0], 1, 2, id_to_node, vehicle_capacity=10)
+    assert route == [0, 1, 2, 0]
+    assert delta == pytest.approx(40.0)
+
+
+def test_cheapest_insertion_keeps_pickup_before_delivery(id_to_node):
+    delta, route = cheapest_pd_insertion([0, 1, 2, 0], 3, 4, id_to_node, vehicle_capacity=10)
+    assert is_route_feasible(route, id_to_node, vehicle_capacity=10)
+    assert route.index(3) < route.index(4)
+    assert delta == pytest.approx(route_length(route, id_to_node) - 40.0)
+
+
+def test_cheapest_insertion_returns_none_when_infeasible(id_to_node):
+    assert cheapest_pd_insertion([0, 1, 2, 0], 3, 4, id_to_node, vehicle_capacity=4) is None
+
+
+def test_project_routes_drops_moved_and_inserts_gained(id_to_node):
+    # ペア (1→2) は他社へ移り、(3→4) を新たに担当する
+    routes, unrouted = project_routes([[0, 1, 2, 0]], {0, 3, 4}, [(3, 4)], id_to_node, vehicle_capacity=10)
+    assert unrouted == []
+    assert routes == [[0, 3, 4, 0]]
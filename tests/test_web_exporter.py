@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from conftest import make_node
+from web_exporter import export_vrp_state, export_packed_state, load_packed_steps, load_step
+
+CUSTOMERS = [make_node(0, 0, 0), make_node(1, 1.5, 2.5, demand=10, delivery_index=2),
+             make_node(2, 3, 4, demand=-10, pickup_index=1), make_node(3, 5, 6, demand=10, delivery_index=4),
+             make_node(4, 7, 8, demand=-10, pickup_index=3)]
+PD_PAIRS = {1: 2, 3: 4}
+STEPS = [
+    [[0, 1, 2, 0], [0, 3, 4, 0]],
+    [[0, 1, 2, 0], [0, 4, 3, 0]],
+    [[0, 1, 3, 4, 2, 0], [0, 0]],
+]
+
+
+def export_steps(root, steps=STEPS):
+    for k, routes in enumerate(steps):
+        export_packed_state(CUSTOMERS, routes, PD_PAIRS, k, instance_name="case", depot_id_list=[0],
+                            vehicle_num_list=[2], output_root=str(root))
+    return os.path.join(str(root), "case")
+
+
+def test_packed_round_trip(tmp_path):
+    case_dir = export_steps(tmp_path)
+    steps = load_packed_steps(case_dir)
+    assert [s["step_index"] for s in steps] == [0, 1, 2]
+    assert [s["routes"] for s in steps] == STEPS
+    first = steps[0]
+    assert first["PD_pairs"] == PD_PAIRS
+    assert first["depot_id_list"] == [0]
+    assert first["vehicle_num_list"] == [2]
+    assert [c["id"] for c in first["customers"]] == [0, 1, 2, 3, 4]
+    assert first["customers"][1]["x"] == pytest.approx(1.5)
+    assert [c["demand"] for c in first["customers"]] == [0, 10, -10, 10, -10]
+
+
+def test_packed_appends_only_changed_routes(tmp_path):
+    case_dir = export_steps(tmp_path, STEPS[:2])
+    # 2ステップ目は車両1だけが変わるので、その4ノードだけが追記される
+    assert os.path.getsize(os.path.join(case_dir, "routes.bin")) == (4 + 4 + 4) * 4
+
+
+def test_packed_reexport_drops_later_steps(tmp_path):
+    export_steps(tmp_path)
+    case_dir = os.path.join(str(tmp_path), "case")
+    export_packed_state(CUSTOMERS, STEPS[0], PD_PAIRS, 1, instance_name="case", output_root=str(tmp_path))
+    steps = load_packed_steps(case_dir)
+    assert [s["step_index"] for s in steps] == [0, 1]
+    assert steps[1]["routes"] == STEPS[0]
+
+
+def test_load_step_reads_json_or_packed(tmp_path):
+    case_dir = export_steps(tmp_path / "packed")
+    assert load_step(case_dir, 2)["routes"] == STEPS[2]
+    assert load_step(case_dir, 7) is None
+
+    export_vrp_state(CUSTOMERS, STEPS[1], PD_PAIRS, 0, instance_name="case", output_root=str(tmp_path / "json"))
+    assert load_step(os.path.join(str(tmp_path / "json"), "case"), 0)["routes"] == STEPS[1]
@@ -1,16 +1,140 @@
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
 import os
 import shutil
-import json
 import math
 import logging
 
 logger = logging.getLogger(__name__)
 
-plt.rcParams['font.family'] = 'MS Gothic'  # Windowsの場合
-plt.rcParams['axes.unicode_minus'] = False
-plt.rcParams['font.monospace'] = ['MS Gothic']
+_fonts_configured = False
+
+
+def _configure_fonts():
+    """日本語フォントの設定（import 時ではなく最初の描画時に1回だけ行う）"""
+    global _fonts_configured
+    if _fonts_configured:
+        return
+    # Windows は MS Gothic、無い環境では順にフォールバック（未インストールのものは指定しない）
+    from matplotlib import font_manager
+    installed = {f.name for f in font_manager.fontManager.ttflist}
+    jp_fonts = [name for name in ('MS Gothic', 'IPAexGothic', 'Noto Sans CJK JP') if name in installed]
+    plt.rcParams['font.family'] = jp_fonts + ['DejaVu Sans']
+    plt.rcParams['axes.unicode_minus'] = False
+    plt.rcParams['font.monospace'] = jp_fonts[:1] + ['DejaVu Sans Mono']
+    _fonts_configured = True
+
+
+COMPANY_COLORS = ["tab:blue", "tab:green", "tab:red", "tab:orange", "tab:purple", "tab:brown"]
+
+
+# ====== 描画共通のユーティリティ ======
+def _route_cost(single_route, id2xy):
+    cost = 0.0
+    for k in range(len(single_route) - 1):
+        x1, y1 = id2xy[single_route[k]]
+        x2, y2 = id2xy[single_route[k + 1]]
+        cost += math.hypot(x2 - x1, y2 - y1)
+    return cost
+
+
+def _company_costs(all_routes, id2xy, veh_num_list):
+    costs = []
+    idx = 0
+    for n in veh_num_list:
+        s = 0.0
+        for _ in range(n):
+            s += _route_cost(all_routes[idx], id2xy)
+            idx += 1
+        costs.append(s)
+    return costs, sum(costs)
+
+
+def _load_step_costs(instance_name, step_index, vehicle_num_list, web_data_root="web_data"):
+    """出力済みの step_{n}.json（または packed 形式）から会社別コストを読む（無ければ None）"""
+    from web_exporter import load_step
+    try:
+        j = load_step(os.path.join(web_data_root, instance_name), step_index)
+        if j is None:
+            return None
+        id2 = {c["id"]: (c["x"], c["y"]) for c in j["customers"]}
+        comp_costs, total = _company_costs(j["routes"], id2, j.get("vehicle_num_list", vehicle_num_list))
+        return {"company": comp_costs, "total": total}
+    except Exception:
+        return None
+
+
+def _fmt(v):
+    return f"{v:.2f}"
+
+
+def _pct(old, new):
+    if old and old > 0:
+        return f"{(old - new) / old * 100:.2f}%"
+    return "—"
+
+
+def _draw_bisectors(ax, customers, depot_xy):
+    """デポ間の等距離線（ボロノイ境界）を破線で描く"""
+    if len(depot_xy) <= 1:
+        return
+    depot_coords = np.array(depot_xy)
+    x_vals = np.linspace(min(c["x"] for c in customers) - 10, max(c["x"] for c in customers) + 10, 300)
+    y_vals = np.linspace(min(c["y"] for c in customers) - 10, max(c["y"] for c in customers) + 10, 300)
+    X, Y = np.meshgrid(x_vals, y_vals)
+    distances = np.zeros((len(depot_coords), *X.shape))
+    for i, (dx, dy) in enumerate(depot_coords):
+        distances[i] = np.sqrt((X - dx)**2 + (Y - dy)**2)
+    for i in range(len(depot_coords)):
+        for j in range(i + 1, len(depot_coords)):
+            ax.contour(X, Y, distances[i] - distances[j], levels=[0], colors="gray", linestyles="--", linewidths=1)
+
+
+def _iteration_title(iteration):
+    if iteration == 0:
+        return "車両経路（初期解）"
+    if iteration == 1:
+        return "車両経路（ボロノイ分割後）"
+    if iteration == 2:
+        return "車両経路（自社内GAT実行後）"
+    return f"Vehicle Routes (Iteration {iteration})"
+
+
+def _metrics_lines(iteration, curr_company, curr_total, lookup):
+    """図の下部に出す改善率の文字列。lookup(step) は {"company", "total"} か None を返す"""
+    lines = []
+    if iteration == 0:
+        lines.append("【初期解】")
+        for i, c in enumerate(curr_company, 1):
+            lines.append(f"  LSP {i}: {_fmt(c)}")
+        lines.append(f"  TOTAL: {_fmt(curr_total)}")
+    elif iteration == 1:
+        lines.append("【ボロノイ分割後】")
+        init_metrics = lookup(0)
+        for i, c in enumerate(curr_company, 1):
+            base = init_metrics["company"][i-1] if init_metrics else None
+            lines.append(f"  LSP {i}: {_fmt(c)}   改善(初期比): {_pct(base, c)}")
+        base_total = init_metrics["total"] if init_metrics else None
+        lines.append(f"  TOTAL: {_fmt(curr_total)}   改善(初期比): {_pct(base_total, curr_total)}")
+    else:
+        lines.append(f"【自社内GAT{iteration}回目】")
+        init_metrics = lookup(0)
+        voro_metrics = lookup(1)
+        prev_metrics = lookup(iteration-1)
+        for i, c in enumerate(curr_company, 1):
+            base_prev = prev_metrics["company"][i-1] if prev_metrics else None
+            base_voro = voro_metrics["company"][i-1] if voro_metrics else None
+            base_init = init_metrics["company"][i-1] if init_metrics else None
+            lines.append(f"    LSP {i}: {_fmt(c)}   改善(ラウンド比): {_pct(base_prev, c)}   改善(ボロノイ比): {_pct(base_voro, c)}   改善(初期比): {_pct(base_init, c)}")
+        base_total_prev = prev_metrics["total"] if prev_metrics else None
+        base_total_voro = voro_metrics["total"] if voro_metrics else None
+        base_total_init = init_metrics["total"] if init_metrics else None
+        lines.append(f"    TOTAL: {_fmt(curr_total)}   改善(ラウンド比): {_pct(base_total_prev, curr_total)}   改善(ボロノイ比): {_pct(base_total_voro, curr_total)}   改善(初期比): {_pct(base_total_init, curr_total)}")
+    return lines
+
 
 def plot_routes(customers, routes, depot_id_list, vehicle_num_list, iteration, instance_name="", output_dir="figures"):
     """
@@ -22,47 +146,7 @@ def plot_routes(customers, routes, depot_id_list, vehicle_num_list, iteration, i
     - iteration: 現在の反復番号（ファイル名に使用）
     - instance_name: 実験インスタンス名（フォルダ作成用）
     """
-
-    # ====== 内部ユーティリティ ======
-    def route_cost(single_route, id2xy):
-        cost = 0.0
-        for k in range(len(single_route) - 1):
-            x1, y1 = id2xy[single_route[k]]
-            x2, y2 = id2xy[single_route[k + 1]]
-            cost += math.hypot(x2 - x1, y2 - y1)
-        return cost
-
-    def company_costs(all_routes, id2xy, veh_num_list):
-        costs = []
-        idx = 0
-        for n in veh_num_list:
-            s = 0.0
-            for _ in range(n):
-                s += route_cost(all_routes[idx], id2xy)
-                idx += 1
-            costs.append(s)
-        return costs, sum(costs)
-
-    def load_step_routes(step_index):
-        base = os.path.join("web_data", instance_name, f"step_{step_index}.json")
-        if not os.path.isfile(base):
-            return None
-        try:
-            with open(base, "r", encoding="utf-8") as f:
-                j = json.load(f)
-            id2 = {c["id"]: (c["x"], c["y"]) for c in j["customers"]}
-            comp_costs, total = company_costs(j["routes"], id2, j.get("vehicle_num_list", vehicle_num_list))
-            return {"company": comp_costs, "total": total}
-        except Exception:
-            return None
-
-    def fmt(v):
-        return f"{v:.2f}"
-
-    def pct(old, new):
-        if old and old > 0:
-            return f"{(old - new) / old * 100:.2f}%"
-        return "—"
+    _configure_fonts()
 
     # ====== フォルダ準備（初回のみ全消去） ======
     instance_folder = os.path.join(output_dir, instance_name)
@@ -74,18 +158,11 @@ def plot_routes(customers, routes, depot_id_list, vehicle_num_list, iteration, i
     id_to_coord = {c["id"]: (c["x"], c["y"]) for c in customers}
 
     # 色
-    colors = ["tab:blue", "tab:green", "tab:red", "tab:orange", "tab:purple", "tab:brown"]
+    colors = COMPANY_COLORS
 
     # ====== 図のセットアップ ======
     plt.figure(figsize=(8, 8))
-    if iteration == 0:
-        plt.title("車両経路（初期解）")
-    elif iteration == 1:
-        plt.title("車両経路（ボロノイ分割後）")
-    elif iteration == 2:
-        plt.title("車両経路（自社内GAT実行後）")
-    else:
-        plt.title(f"Vehicle Routes (Iteration {iteration})")
+    plt.title(_iteration_title(iteration))
 
     # 経路描画
     vehicle_index = 0
@@ -106,17 +183,7 @@ def plot_routes(customers, routes, depot_id_list, vehicle_num_list, iteration, i
             plt.scatter(xs, ys, c=color, s=15)
 
     # 等距離線
-    if len(depot_id_list) > 1:
-        depot_coords = np.array([id_to_coord[d] for d in depot_id_list])
-        x_vals = np.linspace(min(c["x"] for c in customers) - 10, max(c["x"] for c in customers) + 10, 300)
-        y_vals = np.linspace(min(c["y"] for c in customers) - 10, max(c["y"] for c in customers) + 10, 300)
-        X, Y = np.meshgrid(x_vals, y_vals)
-        distances = np.zeros((len(depot_coords), *X.shape))
-        for i, (dx, dy) in enumerate(depot_coords):
-            distances[i] = np.sqrt((X - dx)**2 + (Y - dy)**2)
-        for i in range(len(depot_coords)):
-            for j in range(i + 1, len(depot_coords)):
-                plt.contour(X, Y, distances[i] - distances[j], levels=[0], colors="gray", linestyles="--", linewidths=1)
+    _draw_bisectors(plt.gca(), customers, [id_to_coord[d] for d in depot_id_list])
 
     plt.xlabel("X Coordinate")
     plt.ylabel("Y Coordinate")
@@ -125,36 +192,10 @@ def plot_routes(customers, routes, depot_id_list, vehicle_num_list, iteration, i
     plt.tight_layout()
 
     # ====== メトリクス計算 ======
-    curr_company, curr_total = company_costs(routes, id_to_coord, vehicle_num_list)
+    curr_company, curr_total = _company_costs(routes, id_to_coord, vehicle_num_list)
 
-    lines = []
-    if iteration == 0:
-        lines.append("【初期解】")
-        for i, c in enumerate(curr_company, 1):
-            lines.append(f"  LSP {i}: {fmt(c)}")
-        lines.append(f"  TOTAL: {fmt(curr_total)}")
-    elif iteration == 1:
-        lines.append("【ボロノイ分割後】")
-        init_metrics = load_step_routes(0)
-        for i, c in enumerate(curr_company, 1):
-            base = init_metrics["company"][i-1] if init_metrics else None
-            lines.append(f"  LSP {i}: {fmt(c)}   改善(初期比): {pct(base, c)}")
-        base_total = init_metrics["total"] if init_metrics else None
-        lines.append(f"  TOTAL: {fmt(curr_total)}   改善(初期比): {pct(base_total, curr_total)}")
-    else:
-        lines.append(f"【自社内GAT{iteration}回目】")
-        init_metrics = load_step_routes(0)
-        voro_metrics = load_step_routes(1)
-        prev_metrics = load_step_routes(iteration-1)
-        for i, c in enumerate(curr_company, 1):
-            base_prev = prev_metrics["company"][i-1] if prev_metrics else None
-            base_voro = voro_metrics["company"][i-1] if voro_metrics else None
-            base_init = init_metrics["company"][i-1] if init_metrics else None
-            lines.append(f"    LSP {i}: {fmt(c)}   改善(ラウンド比): {pct(base_prev, c)}   改善(ボロノイ比): {pct(base_voro, c)}   改善(初期比): {pct(base_init, c)}")
-        base_total_prev = prev_metrics["total"] if prev_metrics else None
-        base_total_voro = voro_metrics["total"] if voro_metrics else None
-        base_total_init = init_metrics["total"] if init_metrics else None
-        lines.append(f"    TOTAL: {fmt(curr_total)}   改善(ラウンド比): {pct(base_total_prev, curr_total)}   改善(ボロノイ比): {pct(base_total_voro, curr_total)}   改善(初期比): {pct(base_total_init, curr_total)}")
+    lines = _metrics_lines(iteration, curr_company, curr_total,
+                           lambda step: _load_step_costs(instance_name, step, vehicle_num_list))
 
     # ====== ★ここを変更：下部フッターに表示 ======
     if lines:
@@ -176,3 +217,101 @@ def plot_routes(customers, routes, depot_id_list, vehicle_num_list, iteration, i
     plt.savefig(save_path)
     plt.close()
     logger.info(f"✅図を保存しました: {save_path}")
+
+
+class RoutePlotter:
+    """
+    plot_routes の高速版（同じ見た目の PNG を出す）。1ケースにつき1つ作り、ステップごとに plot を呼ぶ。
+    - pyplot を使わず Agg の Figure を直接持ち、図・軸・凡例・等距離線はケースの最初に1回だけ作る
+    - ステップごとに更新するのは、会社ごとの LineCollection（経路）と散布点（訪問ノード）、タイトルと下部の文字だけ
+    - 改善率の基準（初期解・ボロノイ後・前ステップ）は自分で描いたステップのコストを覚えておき、
+      無ければ出力済みの step JSON（web_data_root）から読む
+    """
+
+    def __init__(self, customers, depot_id_list, vehicle_num_list, instance_name="", output_dir="figures",
+                 web_data_root="web_data", clear_on_initial=True, dpi=100):
+        _configure_fonts()
+        self.vehicle_num_list = list(vehicle_num_list)
+        self.instance_name = instance_name
+        self.web_data_root = web_data_root
+        self.clear_on_initial = clear_on_initial
+        self.dpi = dpi
+        self.instance_folder = os.path.join(output_dir, instance_name)
+        self.id_to_coord = {c["id"]: (c["x"], c["y"]) for c in customers}
+        self.cost_history = {}
+
+        self.fig = Figure(figsize=(8, 8))
+        FigureCanvasAgg(self.fig)
+        ax = self.fig.add_subplot()
+        self.ax = ax
+        self.title = ax.set_title(_iteration_title(0))  # tight_layout がタイトル分の余白を取るよう仮の文字を入れておく
+        self.route_lines = []
+        self.route_nodes = []
+        for lsp_index, depot_id in enumerate(depot_id_list):
+            color = COMPANY_COLORS[lsp_index % len(COMPANY_COLORS)]
+            depot_x, depot_y = self.id_to_coord[depot_id]
+            ax.scatter(depot_x, depot_y, marker="s", c=color, s=120, edgecolor="black", label=f"LSP {lsp_index+1} depot")
+            lines = LineCollection([], colors=color, alpha=0.8)
+            ax.add_collection(lines)
+            self.route_lines.append(lines)
+            self.route_nodes.append(ax.scatter(np.empty(0), np.empty(0), c=color, s=15))
+        _draw_bisectors(ax, customers, [self.id_to_coord[d] for d in depot_id_list])
+
+        # 毎ステップの autoscale をやめ、軸を固定する（等距離線があれば plot_routes と同じくその格子の範囲）
+        xs = [c["x"] for c in customers]
+        ys = [c["y"] for c in customers]
+        if len(depot_id_list) > 1:
+            ax.set_xlim(min(xs) - 10, max(xs) + 10)
+            ax.set_ylim(min(ys) - 10, max(ys) + 10)
+        else:
+            pad_x = (max(xs) - min(xs)) * 0.05
+            pad_y = (max(ys) - min(ys)) * 0.05
+            ax.set_xlim(min(xs) - pad_x, max(xs) + pad_x)
+            ax.set_ylim(min(ys) - pad_y, max(ys) + pad_y)
+        ax.set_xlabel("X Coordinate")
+        ax.set_ylabel("Y Coordinate")
+        ax.legend()
+        ax.grid(True)
+        self.fig.tight_layout()
+        self.fig.subplots_adjust(bottom=0.17)
+        self.footer = self.fig.text(
+            0.02, 0.02, "",
+            ha="left", va="bottom",
+            fontsize=10,
+            bbox=dict(boxstyle="round", facecolor="white", alpha=0.9, edgecolor="#999"),
+            family="monospace"
+        )
+
+    def _lookup(self, step):
+        if step in self.cost_history:
+            return self.cost_history[step]
+        return _load_step_costs(self.instance_name, step, self.vehicle_num_list, self.web_data_root)
+
+    def plot(self, routes, iteration):
+        """routes を描いて routes_iter_{iteration}.png に保存し、そのパスを返す"""
+        if iteration == 0 and self.clear_on_initial and os.path.isdir(self.instance_folder):
+            shutil.rmtree(self.instance_folder)
+        os.makedirs(self.instance_folder, exist_ok=True)
+
+        vehicle_index = 0
+        for lsp_index, num_vehicles in enumerate(self.vehicle_num_list):
+            segments = []
+            for route in routes[vehicle_index: vehicle_index + num_vehicles]:
+                if len(route) > 2:
+                    segments.append(np.array([self.id_to_coord[i] for i in route], dtype=float))
+            vehicle_index += num_vehicles
+            self.route_lines[lsp_index].set_segments(segments)
+            self.route_nodes[lsp_index].set_offsets(np.concatenate(segments) if segments else np.empty((0, 2)))
+
+        curr_company, curr_total = _company_costs(routes, self.id_to_coord, self.vehicle_num_list)
+        self.cost_history[iteration] = {"company": curr_company, "total": curr_total}
+        self.title.set_text(_iteration_title(iteration))
+        self.footer.set_text("\n".join(_metrics_lines(iteration, curr_company, curr_total, self._lookup)))
+
+        save_path = os.path.join(self.instance_folder, f"routes_iter_{iteration:02d}.png")
+        self.fig.savefig(save_path, dpi=self.dpi)
+        logger.info(f"✅図を保存しました: {save_path}")
+        return save_path
+
+    def close(self):
+        self.fig.clear()
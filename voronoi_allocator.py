@@ -1,6 +1,95 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import math
+from ortools.sat.python import cp_model
 from flexible_vrp_solver import solve_vrp_flexible
+from determinism import configure_cp_solver
+from route_insertion import project_routes
+
+
+def pair_midpoint(id_to_coord, p_id, d_id):
+    px, py = id_to_coord[p_id]
+    dx, dy = id_to_coord[d_id]
+    return (px + dx) / 2.0, (py + dy) / 2.0
+
+
+def assign_pairs_nearest(pairs, id_to_coord, depot_id_list):
+    """各PDペアを「中点から最も近いデポ」の会社に割り当てる（通常のボロノイ分割）"""
+    assignment = {}
+    for p_id, d_id in pairs:
+        cx, cy = pair_midpoint(id_to_coord, p_id, d_id)
+        best_comp = None
+        best_dist = float("inf")
+        for comp_idx, depot_id in enumerate(depot_id_list):
+            depot_x, depot_y = id_to_coord[depot_id]
+            dist = math.hypot(cx - depot_x, cy - depot_y)
+            if dist < best_dist:
+                best_dist = dist
+                best_comp = comp_idx
+        assignment[(p_id, d_id)] = best_comp
+    return assignment
+
+
+def workload_limits(pair_weights, vehicle_num_list, balance_by, balance_slack):
+    """
+    各社の作業量上限を返す。
+      - "tasks":    ペア数を会社数で均等割り
+      - "vehicles": ペア数を車両台数比で按分
+      - "demand":   pickup 需要量の合計を車両台数比で按分
+    いずれも (1 + balance_slack) 倍の余裕を持たせる。
+    """
+    total = sum(pair_weights)
+    if balance_by == "tasks":
+        shares = [1.0 / len(vehicle_num_list)] * len(vehicle_num_list)
+    elif balance_by in ("vehicles", "demand"):
+        shares = [n / sum(vehicle_num_list) for n in vehicle_num_list]
+    else:
+        raise ValueError(f"balance_by must be 'tasks', 'vehicles' or 'demand': {balance_by}")
+    return [int(math.ceil(total * sh * (1.0 + balance_slack))) for sh in shares]
+
+
+def assign_pairs_balanced(pairs, id_to_node, depot_id_list, vehicle_num_list,
+                          balance_by="vehicles", balance_slack=0.1, limits=None, time_limit=10.0):
+    """
+    容量付きボロノイ分割：各社の作業量上限を守りつつ「中点→デポ距離」の総和が最小になるよう
+    PDペアを割り当てる（CP-SATによる一般化割当問題）。
+    上限を満たす割当が無い場合は None を返す。
+    """
+    id_to_coord = {nid: (float(n["x"]), float(n["y"])) for nid, n in id_to_node.items()}
+    if balance_by == "demand":
+        weights = [max(1, abs(int(id_to_node[p]["demand"]))) for p, _ in pairs]
+    else:
+        weights = [1] * len(pairs)
+    if limits is None:
+        limits = workload_limits(weights, vehicle_num_list, balance_by, balance_slack)
+
+    model = cp_model.CpModel()
+    x = {}
+    cost_terms = []
+    for k, (p_id, d_id) in enumerate(pairs):
+        cx, cy = pair_midpoint(id_to_coord, p_id, d_id)
+        for comp_idx, depot_id in enumerate(depot_id_list):
+            x[k, comp_idx] = model.NewBoolVar(f"assign_{k}_{comp_idx}")
+            depot_x, depot_y = id_to_coord[depot_id]
+            # 距離は 0.01 単位で整数化
+            cost_terms.append(int(round(math.hypot(cx - depot_x, cy - depot_y) * 100)) * x[k, comp_idx])
+        model.AddExactlyOne(x[k, c] for c in range(len(depot_id_list)))
+    for comp_idx, limit in enumerate(limits):
+        model.Add(sum(weights[k] * x[k, comp_idx] for k in range(len(pairs))) <= limit)
+    model.Minimize(sum(cost_terms))
+
+    solver = configure_cp_solver(cp_model.CpSolver(), time_limit)
+    status = solver.Solve(model)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None
+
+    assignment = {}
+    for k, pair in enumerate(pairs):
+        for comp_idx in range(len(depot_id_list)):
+            if solver.Value(x[k, comp_idx]) == 1:
+                assignment[pair] = comp_idx
+                break
+    return assignment
+
 
 def perform_voronoi_routing(
     customers: List[Dict],
@@ -8,11 +97,26 @@ def perform_voronoi_routing(
     depot_id_list: List[int],
     vehicle_num_list: List[int],
     vehicle_capacity: int,
+    warm_start_routes: List[List[int]] = None,
+    allocation: str = "nearest",
+    balance_by: str = "vehicles",
+    balance_slack: float = 0.1,
+    workload_limit_list: Optional[List[int]] = None,
 ):
     """
     ボロノイ分割（最近デポ）でタスクを各社に再配布し、その後 各社独立にVRPを一発最適化して
     全車両ルート（デポ始終の巡回リスト）を返す。
 
+    warm_start_routes（初期経路など、vehicle_num_list 順の全車両ルート）を渡すと warm-start モード：
+      - 各社の旧ルートを新しい担当タスクに射影（移管ペアは削除、獲得ペアは最安実行可能挿入）
+      - それを初期解として ReadAssignmentFromRoutes に渡し、局所探索のみで改善する
+
+    allocation="balanced" で容量付きボロノイ分割（各社の作業量上限つき最小距離割当）：
+      - balance_by: "tasks"（ペア数を均等割り）/ "vehicles"（ペア数を台数比）/ "demand"（需要量を台数比）
+      - balance_slack: 上限に持たせる余裕（0.1 なら按分量の 1.1 倍まで）
+      - workload_limit_list: 会社ごとの上限を直接指定する場合（balance_by の重みで数える）
+      - 上限を満たす割当が無ければ通常の最近デポ割当に戻す
+
     ルール：
       - PDペアは pickup+delivery を同一会社に配属。
       - 会社の決定は「PDペアの重心（中点）からデポまでの距離」が最小の会社。
@@ -32,25 +136,28 @@ def perform_voronoi_routing(
         company_customers[comp_idx].append(id_to_node[depot_id])
 
     # --- PDペアの割当：重心ベース ---
+    valid_pairs = []
     for p_id, d_id in PD_pairs.items():
         if p_id not in id_to_coord or d_id not in id_to_coord:
             print(f"⚠️ Invalid PD pair: ({p_id}, {d_id})")
             continue
+        valid_pairs.append((p_id, d_id))
 
-        px, py = id_to_coord[p_id]
-        dx, dy = id_to_coord[d_id]
-        # 中点（重心）
-        cx, cy = (px + dx) / 2.0, (py + dy) / 2.0
+    assignment = None
+    if allocation == "balanced":
+        assignment = assign_pairs_balanced(
+            valid_pairs, id_to_node, depot_id_list, vehicle_num_list,
+            balance_by=balance_by, balance_slack=balance_slack, limits=workload_limit_list
+        )
+        if assignment is None:
+            print("⚠️ 作業量上限を満たす割当が見つからないため、最近デポ割当を使います")
+    elif allocation != "nearest":
+        raise ValueError(f"allocation must be 'nearest' or 'balanced': {allocation}")
+    if assignment is None:
+        assignment = assign_pairs_nearest(valid_pairs, id_to_coord, depot_id_list)
 
-        # 重心から最も近いデポを持つ会社を選ぶ
-        best_comp = None
-        best_dist = float("inf")
-        for comp_idx, depot_id in enumerate(depot_id_list):
-            depot_x, depot_y = id_to_coord[depot_id]
-            dist = math.hypot(cx - depot_x, cy - depot_y)
-            if dist < best_dist:
-                best_dist = dist
-                best_comp = comp_idx
+    for p_id, d_id in valid_pairs:
+        best_comp = assignment[(p_id, d_id)]
 
         # その会社に pickup / delivery を配属（重複追加は避ける）
         for nid in (p_id, d_id):
@@ -89,9 +196,21 @@ def perform_voronoi_routing(
             f"顧客={len(sub_customers)}件, 車両={num_vehicles}台, PD={len(sub_pd_pairs)}組"
         )
 
+        # warm-start：旧ルートを射影して初期解にする（全ペアを挿入できた場合のみ）
+        initial_routes = None
+        if warm_start_routes is not None:
+            v_start = sum(vehicle_num_list[:comp_idx])
+            prev_routes = warm_start_routes[v_start: v_start + num_vehicles]
+            node_ids = {c["id"] for c in sub_customers}
+            projected, unrouted = project_routes(prev_routes, node_ids, sub_pd_pairs, id_to_node, vehicle_capacity)
+            if unrouted:
+                print(f"⚠️ LSP {comp_idx+1}: {len(unrouted)}組を挿入できないため warm-start を使わずに解きます")
+            else:
+                initial_routes = [r[1:-1] for r in projected]
+
         routes = solve_vrp_flexible(
             customers=sub_customers,
-            initial_routes=None,
+            initial_routes=initial_routes,
             PD_pairs=sub_pd_pairs,
             num_vehicles=num_vehicles,
             vehicle_capacity=vehicle_capacity,
@@ -100,7 +219,8 @@ def perform_voronoi_routing(
             use_capacity=True,
             use_time=True,
             use_pickup_delivery=True,
-            isGAT=False
+            isGAT=initial_routes is not None,
+            phase="voronoi"
         )
         if routes is None:
             print(f"⚠️ LSP {comp_idx+1}: 解が見つからなかったため空ルートを採用")
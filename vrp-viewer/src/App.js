@@ -1,5 +1,11 @@
 import React, { useEffect, useState, useRef } from "react";
 import InteractiveVRPViewer from "./InteractiveVRPViewer";
+import useLiveProgress from "./useLiveProgress";
+import { loadPackedCase, packedStep } from "./packedData";
+
+// ライブ表示：?live=http://127.0.0.1:8765 または REACT_APP_PROGRESS_URL で progress_server.py を指定
+const LIVE_URL =
+  new URLSearchParams(window.location.search).get("live") || process.env.REACT_APP_PROGRESS_URL || "";
 
 export default function App() {
   const [caseList, setCaseList] = useState([]);        // [{name, steps}, ...]
@@ -11,6 +17,20 @@ export default function App() {
   // ノード選択（FastVRPViewer から受け取る）
   const [selectedNode, setSelectedNode] = useState(null);
 
+  // ライブ表示（SSE で受け取った途中経過）
+  const { instances: liveInstances, connected: liveConnected } = useLiveProgress(LIVE_URL);
+  const [liveMode, setLiveMode] = useState(Boolean(LIVE_URL));
+  const [liveCase, setLiveCase] = useState(null);
+  const liveNames = Object.keys(liveInstances);
+  useEffect(() => {
+    // 新しいケースが始まったら自動で切り替える
+    if (liveNames.length > 0 && !liveNames.includes(liveCase)) {
+      setLiveCase(liveNames[liveNames.length - 1]);
+    }
+  }, [liveNames.join("|")]); // eslint-disable-line react-hooks/exhaustive-deps
+  const liveData = liveCase ? liveInstances[liveCase] : null;
+  const viewData = liveMode ? liveData : data;
+
   // ビューア領域のサイズ計測
   const viewerRef = useRef(null);
   const [viewerSize, setViewerSize] = useState({ width: 0, height: 0 });
@@ -33,7 +53,8 @@ export default function App() {
       return json.cases
         .map((c) => {
           if (typeof c === "string") return { name: c, steps: [] };
-          if (typeof c === "object" && c.name) return { name: c.name, steps: c.steps || [] };
+          if (typeof c === "object" && c.name)
+            return { name: c.name, steps: c.steps || [], format: c.format || "json", manifest: c.manifest };
           return null;
         })
         .filter(Boolean);
@@ -104,9 +125,28 @@ export default function App() {
       });
   }, [selectedCase, caseList]);
 
-  // データ読み込み
+  // データ読み込み（packed 形式のケースはバイナリをケースごとに1度だけ読み、ステップは offset から切り出す）
+  const packedCacheRef = useRef({});
   useEffect(() => {
     if (!selectedCase || !selectedStep) return;
+    const caseObj = caseList.find((c) => c.name === selectedCase);
+    if (caseObj && caseObj.format === "packed") {
+      const cache = packedCacheRef.current;
+      if (!cache[selectedCase]) {
+        cache[selectedCase] = loadPackedCase(process.env.PUBLIC_URL + `/vrp_data/${selectedCase}`, caseObj.manifest);
+      }
+      let cancelled = false;
+      cache[selectedCase]
+        .then((pack) => !cancelled && setData(packedStep(pack, selectedStep)))
+        .catch((err) => {
+          console.error("packed データ読み込みエラー:", err);
+          delete cache[selectedCase];
+          if (!cancelled) setData(null);
+        });
+      return () => {
+        cancelled = true;
+      };
+    }
     fetch(process.env.PUBLIC_URL + `/vrp_data/${selectedCase}/${selectedStep}`)
       .then((res) => {
         if (!res.ok) throw new Error(`Data not found: ${res.status}`);
@@ -117,7 +157,7 @@ export default function App() {
         console.error("VRPデータ読み込みエラー:", err);
         setData(null);
       });
-  }, [selectedCase, selectedStep]);
+  }, [selectedCase, selectedStep, caseList]);
 
   // --- 追加: Case 前後移動ハンドラ（最小変更） ---
   const currentCaseIndex = caseList.findIndex((c) => c.name === selectedCase);
@@ -235,73 +275,104 @@ export default function App() {
 
       {/* セレクタ行 */}
       <div style={{ margin: "12px 0", display: "flex", alignItems: "center", gap: 8 }}>
-        <label style={{ marginRight: 8 }}>Case:</label>
+        {LIVE_URL && (
+          <label style={{ marginRight: 16 }} title={LIVE_URL}>
+            <input type="checkbox" checked={liveMode} onChange={(e) => setLiveMode(e.target.checked)} />
+            ライブ表示
+            <span style={{ marginLeft: 6, color: liveConnected ? "#28A745" : "#DC3545" }}>●</span>
+          </label>
+        )}
 
-        {/* 追加: 前のCaseボタン */}
-        <button
-          onClick={goPrevCase}
-          disabled={!hasPrevCase}
-          title="前のケースへ"
-          style={{ padding: "4px 8px" }}
-        >
-          ◀
-        </button>
+        {liveMode ? (
+          <>
+            <label style={{ marginRight: 8 }}>Case:</label>
+            <select value={liveCase || ""} onChange={(e) => setLiveCase(e.target.value)}>
+              {liveNames.map((name) => (
+                <option key={name} value={name}>{name}</option>
+              ))}
+            </select>
+            {liveData && (
+              <span style={{ marginLeft: 16, color: "#333" }}>
+                {liveData.phase} / step {liveData.step_index ?? "-"}
+                {typeof liveData.total_cost === "number" && ` / 総コスト ${liveData.total_cost.toFixed(2)}`}
+                {liveData.company_costs &&
+                  ` （${liveData.company_costs.map((c, i) => `LSP ${i + 1}: ${c.toFixed(2)}`).join(", ")}）`}
+                {liveData.done && " / 完了"}
+              </span>
+            )}
+          </>
+        ) : (
+          <>
+            <label style={{ marginRight: 8 }}>Case:</label>
 
-        <select value={selectedCase || ""} onChange={(e) => setSelectedCase(e.target.value)}>
-          {caseList.map((c, idx) => (
-            <option key={`${c.name}-${idx}`} value={c.name}>{c.name}</option>
-          ))}
-        </select>
+            {/* 追加: 前のCaseボタン */}
+            <button
+              onClick={goPrevCase}
+              disabled={!hasPrevCase}
+              title="前のケースへ"
+              style={{ padding: "4px 8px" }}
+            >
+              ◀
+            </button>
 
-        {/* 追加: 次のCaseボタン */}
-        <button
-          onClick={goNextCase}
-          disabled={!hasNextCase}
-          title="次のケースへ"
-          style={{ padding: "4px 8px" }}
-        >
-          ▶
-        </button>
+            <select value={selectedCase || ""} onChange={(e) => setSelectedCase(e.target.value)}>
+              {caseList.map((c, idx) => (
+                <option key={`${c.name}-${idx}`} value={c.name}>{c.name}</option>
+              ))}
+            </select>
 
-        <label style={{ marginLeft: 16, marginRight: 8 }}>Step:</label>
+            {/* 追加: 次のCaseボタン */}
+            <button
+              onClick={goNextCase}
+              disabled={!hasNextCase}
+              title="次のケースへ"
+              style={{ padding: "4px 8px" }}
+            >
+              ▶
+            </button>
 
-        {/* 追加: 前へボタン（Step） */}
-        <button
-          onClick={goPrevStep}
-          disabled={!hasPrev}
-          title="前のステップへ"
-          style={{ padding: "4px 8px" }}
-        >
-          ◀
-        </button>
+            <label style={{ marginLeft: 16, marginRight: 8 }}>Step:</label>
 
-        {/* 既存のプルダウン（Step） */}
-        <select value={selectedStep || ""} onChange={(e) => setSelectedStep(e.target.value)}>
-          {stepList.map((s, idx) => (
-            <option key={`${s}-${idx}`} value={s}>{s}</option>
-          ))}
-        </select>
+            {/* 追加: 前へボタン（Step） */}
+            <button
+              onClick={goPrevStep}
+              disabled={!hasPrev}
+              title="前のステップへ"
+              style={{ padding: "4px 8px" }}
+            >
+              ◀
+            </button>
 
-        {/* 追加: 次へボタン（Step） */}
-        <button
-          onClick={goNextStep}
-          disabled={!hasNext}
-          title="次のステップへ"
-          style={{ padding: "4px 8px" }}
-        >
-          ▶
-        </button>
+            {/* 既存のプルダウン（Step） */}
+            <select value={selectedStep || ""} onChange={(e) => setSelectedStep(e.target.value)}>
+              {stepList.map((s, idx) => (
+                <option key={`${s}-${idx}`} value={s}>{s}</option>
+              ))}
+            </select>
+
+            {/* 追加: 次へボタン（Step） */}
+            <button
+              onClick={goNextStep}
+              disabled={!hasNext}
+              title="次のステップへ"
+              style={{ padding: "4px 8px" }}
+            >
+              ▶
+            </button>
+          </>
+        )}
       </div>
 
       {/* ビューア領域：残り高さすべて */}
       <div ref={viewerRef} style={{ flex: 1, minHeight: 0 }}>
-        {data ? (
+        {viewData ? (
           <InteractiveVRPViewer
-            customers={data.customers}
-            routes={data.routes}
-            PD_pairs={data.PD_pairs}
-            depot_id_list={data.depot_id_list}
-            vehicle_num_list={data.vehicle_num_list}
+            customers={viewData.customers}
+            routes={viewData.routes}
+            PD_pairs={viewData.PD_pairs}
+            depot_id_list={viewData.depot_id_list}
+            vehicle_num_list={viewData.vehicle_num_list}
+            changedRouteIndices={liveMode ? viewData.changed : undefined}
             width={viewerSize.width}
             height={viewerSize.height}
             onSelectNode={setSelectedNode}
@@ -8,10 +8,11 @@ import FastVRPViewer from "./components/FastVRPViewer";
  * - PD_pairs
  * - depot_id_list
  * - vehicle_num_list
+ * - changedRouteIndices（ライブ表示で直前のステップに変わった車両）
  */
 export default function InteractiveVRPViewer({
   customers, routes, PD_pairs, depot_id_list, vehicle_num_list,
-  width, height, onSelectNode
+  changedRouteIndices, width, height, onSelectNode
 }) {
   // 受け取った props をそのまま FastVRPViewer に渡す
   if (!customers || !routes) {
@@ -25,6 +26,7 @@ export default function InteractiveVRPViewer({
       PD_pairs={PD_pairs || {}}
       depot_id_list={depot_id_list || []}
       vehicle_num_list={vehicle_num_list || []}
+      changedRouteIndices={changedRouteIndices || []}
       width={width}
       height={height}
       onSelectNode={onSelectNode}
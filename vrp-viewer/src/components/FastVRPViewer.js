@@ -10,6 +10,7 @@ import { Stage, Layer, Line, Circle } from "react-konva";
  * - PD_pairs: { [pickupId: number]: deliveryId: number }
  * - depot_id_list: number[]
  * - vehicle_num_list: number[]
+ * - changedRouteIndices: number[]  // ライブ表示で直前のステップに変わった車両（太線で強調）
  * - width: number   // 親から与えられる描画領域の幅
  * - height: number  // 親から与えられる描画領域の高さ
  * - onSelectNode?: (info|null) => void  // ノードクリック時に親へ通知（nullで解除）
@@ -20,6 +21,7 @@ export default function FastVRPViewer({
   PD_pairs = {},
   depot_id_list = [],
   vehicle_num_list = [],
+  changedRouteIndices = [],
   width = 800,
   height = 600,
   onSelectNode,
@@ -201,13 +203,14 @@ export default function FastVRPViewer({
             const stroke = companyColors[compIdx % companyColors.length];
             const isHighlighted =
               highlightedRouteIndex === null || highlightedRouteIndex === i;
+            const isChanged = changedRouteIndices.includes(i);
 
             return (
               <Line
                 key={`route_${i}`}
                 points={pts}
                 stroke={stroke}
-                strokeWidth={isHighlighted ? 1.8 / (scale || 1) : 0.6 / (scale || 1)}
+                strokeWidth={(isHighlighted ? (isChanged ? 3.6 : 1.8) : 0.6) / (scale || 1)}
                 opacity={isHighlighted ? 1 : 0.2}
                 lineJoin="round"
                 lineCap="round"
@@ -0,0 +1,75 @@
+/**
+ * web_exporter.export_packed_state が書く packed 形式の読み込み
+ *
+ * - packed.json: マニフェスト（nodes.bin のバッファ位置・型、ステップごとの車両の offset / length）
+ * - nodes.bin:   id(int32) / x(float32) / y(float32) / demand(int32) / PD ペア(int32, p,d,p,d,...)
+ * - routes.bin:  ルートのノード id(int32)。ステップは変わった車両だけが追記され、他は前の位置を指す
+ *
+ * バイナリは fetch → ArrayBuffer → 型付き配列のビューにするだけで、JSON として解析しない。
+ * customers / PD_pairs はケースごとに1度だけ作るので、ステップを切り替えても同じ配列のまま
+ * （FastVRPViewer の表示範囲が保たれる）。
+ */
+
+const TYPED = { int32: Int32Array, float32: Float32Array };
+
+async function fetchBuffer(url) {
+  const res = await fetch(url);
+  if (!res.ok) throw new Error(`HTTP ${res.status}: ${url}`);
+  return res.arrayBuffer();
+}
+
+function view(buffer, { dtype, offset, length }) {
+  return new TYPED[dtype](buffer, offset, length);
+}
+
+/** baseUrl（…/vrp_data/<instance>）の packed 形式を読み込む */
+export async function loadPackedCase(baseUrl, manifestName = "packed.json") {
+  const res = await fetch(`${baseUrl}/${manifestName}`);
+  if (!res.ok) throw new Error(`HTTP ${res.status}: ${manifestName}`);
+  const manifest = await res.json();
+  const [nodesBuffer, routesBuffer] = await Promise.all([
+    fetchBuffer(`${baseUrl}/${manifest.nodes.file}`),
+    fetchBuffer(`${baseUrl}/${manifest.routes.file}`),
+  ]);
+
+  const { buffers } = manifest.nodes;
+  const ids = view(nodesBuffer, buffers.id);
+  const xs = view(nodesBuffer, buffers.x);
+  const ys = view(nodesBuffer, buffers.y);
+  const demands = view(nodesBuffer, buffers.demand);
+  const pd = view(nodesBuffer, buffers.pd_pairs);
+
+  const customers = new Array(ids.length);
+  for (let i = 0; i < ids.length; i++) {
+    customers[i] = { id: ids[i], x: xs[i], y: ys[i], demand: demands[i] };
+  }
+  const PD_pairs = {};
+  for (let k = 0; k + 1 < pd.length; k += 2) PD_pairs[pd[k]] = pd[k + 1];
+
+  return {
+    manifest,
+    customers,
+    PD_pairs,
+    routeIds: new Int32Array(routesBuffer),
+    stepsByName: Object.fromEntries(manifest.steps.map((s) => [s.name, s])),
+  };
+}
+
+/** 1ステップ分を step_N.json と同じ形（customers / routes / PD_pairs / …）で返す */
+export function packedStep(pack, stepName) {
+  const step = pack.stepsByName[stepName];
+  if (!step) return null;
+  const routes = step.offsets.map((offset, v) =>
+    Array.from(pack.routeIds.subarray(offset, offset + step.lengths[v]))
+  );
+  return {
+    customers: pack.customers,
+    routes,
+    PD_pairs: pack.PD_pairs,
+    depot_id_list: pack.manifest.depot_id_list,
+    vehicle_num_list: pack.manifest.vehicle_num_list,
+    step_index: step.step_index,
+    instance_name: pack.manifest.instance_name,
+    changed: step.changed,
+  };
+}
@@ -0,0 +1,82 @@
+import { useEffect, useRef, useState } from "react";
+
+/**
+ * progress_server.py の SSE（/events）を購読し、インスタンスごとの現在状態を返すフック
+ *
+ * - snapshot: 状態を丸ごと置き換える（接続直後・取りこぼし時）
+ * - step:     changed={車両index: ルート} の差分だけを routes に反映する
+ * - done:     終了フラグを立てる
+ *
+ * customers などの大きな配列は snapshot のときだけ差し替えるので、
+ * step ごとに FastVRPViewer の表示範囲（ズーム・位置）がリセットされることはない。
+ *
+ * 戻り値: { instances: { [name]: state }, connected: boolean }
+ *   state = { customers, routes, PD_pairs, depot_id_list, vehicle_num_list,
+ *             step_index, phase, company_costs, total_cost, changed: number[], done }
+ */
+export default function useLiveProgress(url) {
+  const [instances, setInstances] = useState({});
+  const [connected, setConnected] = useState(false);
+  const sourceRef = useRef(null);
+
+  useEffect(() => {
+    if (!url) return undefined;
+    const source = new EventSource(`${url.replace(/\/$/, "")}/events`);
+    sourceRef.current = source;
+
+    source.onopen = () => setConnected(true);
+    source.onerror = () => setConnected(false); // EventSource が自動で再接続する
+
+    source.addEventListener("snapshot", (e) => {
+      const state = JSON.parse(e.data);
+      setInstances((prev) => ({ ...prev, [state.instance_name]: { ...state, changed: [] } }));
+    });
+
+    source.addEventListener("step", (e) => {
+      const ev = JSON.parse(e.data);
+      setInstances((prev) => {
+        const cur = prev[ev.instance_name];
+        if (!cur) return prev;
+        const routes = cur.routes.slice(0, ev.num_routes);
+        const changed = [];
+        Object.entries(ev.changed || {}).forEach(([idx, route]) => {
+          routes[Number(idx)] = route;
+          changed.push(Number(idx));
+        });
+        for (let i = 0; i < routes.length; i++) {
+          if (!routes[i]) routes[i] = [];
+        }
+        return {
+          ...prev,
+          [ev.instance_name]: {
+            ...cur,
+            routes,
+            changed,
+            step_index: ev.step_index,
+            phase: ev.phase,
+            company_costs: ev.company_costs,
+            total_cost: ev.total_cost,
+            elapsed: ev.elapsed,
+          },
+        };
+      });
+    });
+
+    source.addEventListener("done", (e) => {
+      const ev = JSON.parse(e.data);
+      setInstances((prev) =>
+        prev[ev.instance_name]
+          ? { ...prev, [ev.instance_name]: { ...prev[ev.instance_name], done: true, changed: [] } }
+          : prev
+      );
+    });
+
+    return () => {
+      source.close();
+      sourceRef.current = null;
+      setConnected(false);
+    };
+  }, [url]);
+
+  return { instances, connected };
+}
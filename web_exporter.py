@@ -1,6 +1,7 @@
 import os
 import json
 import glob
+import re
 import shutil
 import logging
 
@@ -61,6 +62,140 @@ def export_vrp_state(customers, routes, PD_pairs, step_index, case_index=None,
     return json_path  # 返しておくとテストやログに便利
 
 
+# === packed 形式（型付き配列のバイナリ＋小さな JSON マニフェスト）===
+# <instance>/packed.json … マニフェスト（バッファの場所・型、ステップごとのルートの位置）
+# <instance>/nodes.bin   … id(int32) / x(float32) / y(float32) / demand(int32) / PD ペア(int32, p,d,p,d,...)
+# <instance>/routes.bin  … ルートのノード id(int32) を追記していく。各ステップは車両ごとの (offset, length) を持ち、
+#                          変わっていない車両は前のステップと同じ位置を指す（追記されるのは変わったルートだけ）
+PACKED_MANIFEST = "packed.json"
+PACKED_FORMAT = "vrp-packed-1"
+
+
+def _write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, PACKED_MANIFEST)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def export_packed_state(customers, routes, PD_pairs, step_index, case_index=None,
+                        depot_id_list=None, vehicle_num_list=None, instance_name=None,
+                        output_root="web_data"):
+    """
+    export_vrp_state と同じ引数で、packed 形式（nodes.bin / routes.bin / packed.json）に1ステップを追記する。
+    step_index == 0 でフォルダを作り直してノードを書き、以降のステップは前のステップから変わったルートだけを追記する。
+    """
+    import numpy as np
+
+    folder_name = instance_name or f"case_{case_index if case_index is not None else int(__import__('time').time())}"
+    output_dir = os.path.join(output_root, folder_name)
+    manifest_path = os.path.join(output_dir, PACKED_MANIFEST)
+    routes_path = os.path.join(output_dir, "routes.bin")
+
+    if step_index == 0 or not os.path.isfile(manifest_path):
+        if os.path.exists(output_dir):
+            logger.info(f"⚠️ 初回ステップのため既存フォルダを削除します: {output_dir}")
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        if depot_id_list is None:
+            depot_id_list = [c["id"] for c in customers if c.get("demand", 0) == 0]
+        pairs = list(PD_pairs.items()) if isinstance(PD_pairs, dict) else [tuple(pd) for pd in PD_pairs]
+        columns = [
+            ("id", np.array([c["id"] for c in customers], dtype="<i4")),
+            ("x", np.array([c["x"] for c in customers], dtype="<f4")),
+            ("y", np.array([c["y"] for c in customers], dtype="<f4")),
+            ("demand", np.array([c.get("demand", 0) for c in customers], dtype="<i4")),
+            ("pd_pairs", np.array(pairs, dtype="<i4").reshape(-1)),
+        ]
+        buffers, offset = {}, 0
+        with open(os.path.join(output_dir, "nodes.bin"), "wb") as f:
+            for name, array in columns:
+                f.write(array.tobytes())
+                buffers[name] = {"dtype": "float32" if array.dtype.kind == "f" else "int32",
+                                 "offset": offset, "length": int(array.size)}
+                offset += array.nbytes
+        open(routes_path, "wb").close()
+        manifest = {
+            "format": PACKED_FORMAT,
+            "instance_name": folder_name,
+            "depot_id_list": depot_id_list,
+            "vehicle_num_list": vehicle_num_list if vehicle_num_list is not None else [len(routes)],
+            "nodes": {"file": "nodes.bin", "count": len(customers), "buffers": buffers},
+            "routes": {"file": "routes.bin", "dtype": "int32"},
+            "steps": [],
+        }
+    else:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        # 同じステップを出し直す場合（再開時など）は、それ以降のステップを捨てる
+        manifest["steps"] = [st for st in manifest["steps"] if st["step_index"] < step_index]
+
+    prev = manifest["steps"][-1] if manifest["steps"] else None
+    written = np.fromfile(routes_path, dtype="<i4") if prev is not None else None
+    end = os.path.getsize(routes_path) // 4
+    offsets, lengths, changed, appended = [], [], [], []
+    for v, route in enumerate(routes):
+        if prev is not None and v < len(prev["offsets"]) and prev["lengths"][v] == len(route) \
+                and written[prev["offsets"][v]:prev["offsets"][v] + len(route)].tolist() == list(route):
+            offsets.append(prev["offsets"][v])
+            lengths.append(prev["lengths"][v])
+            continue
+        offsets.append(end)
+        lengths.append(len(route))
+        changed.append(v)
+        appended.extend(route)
+        end += len(route)
+    with open(routes_path, "ab") as f:
+        f.write(np.array(appended, dtype="<i4").tobytes())
+
+    manifest["steps"].append({"name": f"step_{step_index}", "step_index": step_index,
+                              "offsets": offsets, "lengths": lengths, "changed": changed})
+    _write_manifest(output_dir, manifest)
+    logger.info(f"✅ VRP状態を出力しました（packed）: {output_dir} step {step_index}（変更 {len(changed)} 台）")
+    return manifest_path
+
+
+def load_packed_steps(case_dir):
+    """packed 形式を export_vrp_state の JSON と同じ dict のリストに戻す（render_figures / visualizer 用）"""
+    import numpy as np
+
+    with open(os.path.join(case_dir, PACKED_MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    raw = np.fromfile(os.path.join(case_dir, manifest["nodes"]["file"]), dtype=np.uint8)
+    columns = {}
+    for name, buf in manifest["nodes"]["buffers"].items():
+        dtype = "<f4" if buf["dtype"] == "float32" else "<i4"
+        columns[name] = np.frombuffer(raw, dtype=dtype, count=buf["length"], offset=buf["offset"]).tolist()
+    customers = [{"id": i, "x": x, "y": y, "demand": d}
+                 for i, x, y, d in zip(columns["id"], columns["x"], columns["y"], columns["demand"])]
+    pd = columns["pd_pairs"]
+    PD_pairs = {pd[k]: pd[k + 1] for k in range(0, len(pd), 2)}
+    route_ids = np.fromfile(os.path.join(case_dir, manifest["routes"]["file"]), dtype="<i4").tolist()
+    return [{
+        "customers": customers,
+        "routes": [route_ids[o:o + n] for o, n in zip(st["offsets"], st["lengths"])],
+        "PD_pairs": PD_pairs,
+        "depot_id_list": manifest["depot_id_list"],
+        "vehicle_num_list": manifest["vehicle_num_list"],
+        "step_index": st["step_index"],
+        "instance_name": manifest["instance_name"],
+    } for st in manifest["steps"]]
+
+
+def load_step(case_dir, step_index):
+    """step_{n}.json、無ければ packed 形式から1ステップを読む（どちらも無ければ None）"""
+    path = os.path.join(case_dir, f"step_{step_index}.json")
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if os.path.isfile(os.path.join(case_dir, PACKED_MANIFEST)):
+        for data in load_packed_steps(case_dir):
+            if data["step_index"] == step_index:
+                return data
+    return None
+
+
 def generate_index_json(instance_name: str,
                         output_root: str = "web_data",
                         target_root: str = "vrp-viewer/public/vrp_data"):
@@ -129,9 +264,16 @@ def generate_index_json(instance_name: str,
         return int(m.group(1)) if m else 10**9   # マッチしない場合は末尾へ
 
     steps = [os.path.basename(p) for p in sorted(step_paths, key=step_num)]
+    entry = {"name": instance_name, "steps": steps}
+    packed_path = os.path.join(dst_case_dir, PACKED_MANIFEST)
+    if not steps and os.path.isfile(packed_path):
+        # packed 形式：steps はマニフェストのステップ名、viewer は manifest からバイナリを読む
+        with open(packed_path, "r", encoding="utf-8") as f:
+            entry = {"name": instance_name, "steps": [st["name"] for st in json.load(f)["steps"]],
+                     "format": "packed", "manifest": PACKED_MANIFEST}
 
     # 6) 新しいエントリを追加
-    cases.append({"name": instance_name, "steps": steps})
+    cases.append(entry)
 
     # 7) index.json を保存（上書き）
     index_data = {"cases": cases}